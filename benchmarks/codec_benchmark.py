@@ -0,0 +1,71 @@
+"""
+Gateway decode throughput for each installed JSON backend.
+
+Usage:
+    python -m benchmarks.codec_benchmark [recorded_frames.jsonl]
+
+The optional file holds one raw gateway frame per line, e.g. captured with
+the gateway websocket. Without it a synthetic mix of MESSAGE_CREATE,
+GUILD_CREATE and PRESENCE_UPDATE frames is used.
+"""
+import sys
+import time
+
+from harmony import codec
+
+
+def synthetic_frames():
+    author = {'id': '80351110224678912', 'username': 'Nelly', 'discriminator': '1337',
+              'avatar': '8342729096ea3675442027381ff50dfe', 'bot': False}
+    message = {'op': 0, 's': 42, 't': 'MESSAGE_CREATE', 'd': {
+        'id': '334385199974967042', 'channel_id': '290926798999357250',
+        'guild_id': '290926798626357250', 'author': author,
+        'content': 'Supa Hot ' * 8, 'timestamp': '2017-07-11T17:27:07.299000+00:00',
+        'tts': False, 'mention_everyone': False, 'mentions': [author], 'mention_roles': [],
+        'attachments': [], 'embeds': [], 'pinned': False, 'type': 0
+    }}
+    presence = {'op': 0, 's': 43, 't': 'PRESENCE_UPDATE', 'd': {
+        'user': {'id': '80351110224678912'}, 'guild_id': '290926798626357250',
+        'status': 'online', 'activities': [{'name': 'Rocket League', 'type': 0}],
+        'client_status': {'desktop': 'online'}
+    }}
+    guild = {'op': 0, 's': 44, 't': 'GUILD_CREATE', 'd': {
+        'id': '290926798626357250', 'name': 'Test Guild', 'owner_id': '80351110224678912',
+        'channels': [{'id': str(10 ** 17 + i), 'name': f'channel-{i}', 'type': 0, 'position': i}
+                     for i in range(50)],
+        'roles': [{'id': str(2 * 10 ** 17 + i), 'name': f'role-{i}', 'permissions': '104324673',
+                   'color': 0, 'position': i} for i in range(30)],
+        'members': [{'user': dict(author, id=str(3 * 10 ** 17 + i)), 'roles': [], 'nick': None,
+                     'joined_at': '2017-07-11T17:27:07.299000+00:00'} for i in range(200)]
+    }}
+
+    frames = [message] * 80 + [presence] * 19 + [guild]
+    return [codec.BACKENDS['json'][1](frame).encode('utf-8') for frame in frames]
+
+
+def load_frames(path):
+    with open(path, 'rb') as fh:
+        return [line.strip() for line in fh if line.strip()]
+
+
+def main():
+    frames = load_frames(sys.argv[1]) if len(sys.argv) > 1 else synthetic_frames()
+    total_bytes = sum(len(frame) for frame in frames)
+    rounds = 50
+
+    print(f"{len(frames)} frames, {total_bytes / 1024:.1f} KiB per round, {rounds} rounds")
+
+    for name, (loads, _) in codec.BACKENDS.items():
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for frame in frames:
+                loads(frame)
+        elapsed = time.perf_counter() - start
+
+        events = len(frames) * rounds
+        mib = total_bytes * rounds / (1024 * 1024)
+        print(f"{name:>8}: {events / elapsed:12,.0f} events/sec  {mib / elapsed:8.1f} MiB/s")
+
+
+if __name__ == '__main__':
+    main()
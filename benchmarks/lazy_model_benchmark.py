@@ -0,0 +1,81 @@
+"""
+Eager vs lazy Message construction throughput.
+
+Usage:
+    python -m benchmarks.lazy_model_benchmark [recorded_frames.jsonl]
+
+The optional file holds one raw gateway frame per line; its MESSAGE_CREATE
+payloads are used. Without it a synthetic payload with an author, mentions
+and an embed is used. Each mode is timed for construction alone, for
+construction plus a typical handler's reads (content, author id and
+channel id), and for construction plus reading every field.
+"""
+import sys
+import time
+
+from harmony import codec
+from harmony.models import Message, LazyMessage
+
+
+def synthetic_payloads(count=20000):
+    author = {'id': '80351110224678912', 'username': 'Nelly', 'discriminator': '1337',
+              'global_name': 'Nelly', 'avatar': '8342729096ea3675442027381ff50dfe', 'bot': False}
+    raw = codec.dumps({
+        'id': '334385199974967042', 'channel_id': '290926798999357250',
+        'guild_id': '290926798626357250', 'author': author, 'member': {'roles': [], 'nick': None},
+        'content': 'Supa Hot ' * 8, 'timestamp': '2017-07-11T17:27:07.299000+00:00',
+        'edited_timestamp': None, 'tts': False, 'mention_everyone': False,
+        'mentions': [dict(author, id=str(80351110224678913 + i)) for i in range(3)],
+        'mention_roles': ['290926798626357251', '290926798626357252'], 'attachments': [],
+        'embeds': [{'title': 'Embed', 'description': 'Text ' * 20, 'color': 3447003,
+                    'fields': [{'name': f'Field {i}', 'value': 'Value', 'inline': True} for i in range(5)]}],
+        'pinned': False, 'type': 0
+    })
+    return [codec.loads(raw) for _ in range(count)]
+
+
+def load_payloads(path):
+    with open(path, 'rb') as fh:
+        return [codec.loads(line)['d'] for line in fh if b'"t":"MESSAGE_CREATE"' in line]
+
+
+def construct(cls, payloads):
+    for payload in payloads:
+        cls(None, payload)
+
+
+def handler_reads(cls, payloads):
+    for payload in payloads:
+        message = cls(None, payload)
+        message.content, message.author.id, message.channel_id
+
+
+def read_everything(cls, payloads):
+    for payload in payloads:
+        message = cls(None, payload)
+        for name in Message._attributes:
+            getattr(message, name)
+
+
+def main():
+    payloads = load_payloads(sys.argv[1]) if len(sys.argv) > 1 else synthetic_payloads()
+    rounds = 5
+
+    print(f"{len(payloads)} MESSAGE_CREATE payloads, {rounds} rounds")
+    print(f"{'workload':>16}  {'eager':>14}  {'lazy':>14}  {'speedup':>7}")
+
+    for name, workload in (('construct', construct), ('handler reads', handler_reads),
+                           ('read everything', read_everything)):
+        rates = []
+        for cls in (Message, LazyMessage):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                workload(cls, payloads)
+            rates.append(len(payloads) * rounds / (time.perf_counter() - start))
+
+        eager, lazy = rates
+        print(f"{name:>16}  {eager:10,.0f}/sec  {lazy:10,.0f}/sec  {lazy / eager:6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Memory used per cached model, dict-based models against the slotted ones.
+
+Usage:
+    python -m benchmarks.model_memory_benchmark [count]
+
+Each object is built from a freshly decoded payload, as the gateway does,
+and the payload is dropped afterwards so only what the model keeps is
+counted. The "dict" models reproduce the old `setattr`-every-key `_update`.
+"""
+import gc
+import sys
+import tracemalloc
+
+from harmony import codec
+from harmony.models import User, Member, Message, Channel, Guild
+
+
+class DictModel:
+    def __init__(self, client, data):
+        self._client = client
+        self._update(data)
+
+    def _update(self, data):
+        for key, value in data.items():
+            setattr(self, key, value)
+
+
+class DictUser(DictModel):
+    pass
+
+
+class DictMember(DictModel):
+    def _update(self, data):
+        super()._update(data)
+        if 'user' in data:
+            self.user = DictUser(self._client, data['user'])
+
+
+class DictMessage(DictModel):
+    def _update(self, data):
+        super()._update(data)
+        if 'author' in data:
+            self.author = DictUser(self._client, data['author'])
+
+
+class DictChannel(DictModel):
+    pass
+
+
+class DictGuild(DictModel):
+    pass
+
+
+AUTHOR = {'id': '80351110224678912', 'username': 'Nelly', 'discriminator': '1337',
+          'global_name': 'Nelly', 'avatar': '8342729096ea3675442027381ff50dfe', 'bot': False,
+          'public_flags': 64, 'avatar_decoration_data': None, 'banner': None, 'accent_color': None}
+
+PAYLOADS = {
+    'User': AUTHOR,
+    'Member': {'user': AUTHOR, 'roles': ['290926798626357251', '290926798626357252'], 'nick': None,
+               'avatar': None, 'joined_at': '2017-07-11T17:27:07.299000+00:00', 'premium_since': None,
+               'deaf': False, 'mute': False, 'flags': 0, 'pending': False},
+    'Message': {'id': '334385199974967042', 'channel_id': '290926798999357250',
+                'guild_id': '290926798626357250', 'author': AUTHOR, 'member': {'roles': [], 'nick': None},
+                'content': 'Supa Hot ' * 8, 'timestamp': '2017-07-11T17:27:07.299000+00:00',
+                'edited_timestamp': None, 'tts': False, 'mention_everyone': False, 'mentions': [],
+                'mention_roles': [], 'attachments': [], 'embeds': [], 'components': [],
+                'pinned': False, 'type': 0, 'flags': 0, 'nonce': '334385199974967040'},
+    'Channel': {'id': '290926798999357250', 'type': 0, 'guild_id': '290926798626357250',
+                'position': 3, 'permission_overwrites': [{'id': '290926798626357250', 'type': 0,
+                                                          'allow': '0', 'deny': '1024'}],
+                'name': 'general', 'topic': 'Chat', 'nsfw': False, 'last_message_id': '334385199974967042',
+                'rate_limit_per_user': 0, 'parent_id': '290926798999357249', 'flags': 0},
+    'Guild': {'id': '290926798626357250', 'name': 'Test Guild', 'icon': None, 'owner_id': '80351110224678912',
+              'system_channel_id': '290926798999357250', 'member_count': 1200, 'large': True,
+              'unavailable': False, 'region': 'us-west', 'afk_timeout': 300, 'verification_level': 1,
+              'features': ['COMMUNITY', 'NEWS'], 'preferred_locale': 'en-US', 'description': None,
+              'roles': [], 'emojis': [], 'stickers': []},
+}
+
+MODELS = {
+    'User': (DictUser, User),
+    'Member': (DictMember, Member),
+    'Message': (DictMessage, Message),
+    'Channel': (DictChannel, Channel),
+    'Guild': (DictGuild, Guild),
+}
+
+
+def bytes_per_object(cls, raw, count):
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+
+    objects = [cls(None, codec.loads(raw)) for _ in range(count)]
+    gc.collect()
+
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    del objects
+    # The list holding the objects is not part of the model's cost
+    return (used - sys.getsizeof([None] * count)) / count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    print(f"{count} objects per model, JSON backend: {codec.backend}")
+    print(f"{'model':>8}  {'dict':>10}  {'slots':>10}  {'saved':>6}")
+
+    for name, (dict_model, slotted_model) in MODELS.items():
+        raw = codec.dumps(PAYLOADS[name])
+        before = bytes_per_object(dict_model, raw, count)
+        after = bytes_per_object(slotted_model, raw, count)
+        print(f"{name:>8}  {before:8,.0f} B  {after:8,.0f} B  {1 - after / before:5.0%}")
+
+
+if __name__ == '__main__':
+    main()
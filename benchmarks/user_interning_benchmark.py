@@ -0,0 +1,90 @@
+"""
+Allocations saved by interning User objects on a replayed MESSAGE_CREATE stream.
+
+Usage:
+    python -m benchmarks.user_interning_benchmark [recorded_frames.jsonl]
+
+The optional file holds one raw gateway frame per line; its MESSAGE_CREATE
+frames are replayed. Without it a synthetic stream is used where a few
+hundred users write most of the messages. Every message is kept alive, as in
+the message cache, and the User objects and memory behind them are compared
+with and without interning.
+"""
+import gc
+import random
+import sys
+import time
+import tracemalloc
+
+from harmony import codec
+from harmony.enums import Intents
+from harmony.models import Message
+from harmony.state import ConnectionState, CachePolicy
+
+
+class ReplayClient:
+    """Just enough of a client for models to intern their users"""
+
+    def __init__(self):
+        self.intents = Intents.GUILDS | Intents.GUILD_MESSAGES
+        self.state = ConnectionState(self, CachePolicy())
+
+
+def synthetic_stream(count=20000, authors=300):
+    rng = random.Random(0)
+    users = [{'id': str(80351110224678912 + i), 'username': f'user{i}', 'discriminator': '0',
+              'global_name': f'User {i}', 'avatar': '8342729096ea3675442027381ff50dfe', 'bot': False}
+             for i in range(authors)]
+
+    frames = []
+    for i in range(count):
+        author = users[min(int(rng.paretovariate(1.2)) - 1, authors - 1)]
+        mentions = [rng.choice(users)] if rng.random() < 0.2 else []
+        frames.append(codec.dumps({'op': 0, 's': i, 't': 'MESSAGE_CREATE', 'd': {
+            'id': str(334385199974967042 + i), 'channel_id': '290926798999357250',
+            'guild_id': '290926798626357250', 'author': author, 'mentions': mentions,
+            'content': 'hello there', 'timestamp': '2017-07-11T17:27:07.299000+00:00',
+            'tts': False, 'mention_everyone': False, 'mention_roles': [], 'attachments': [],
+            'embeds': [], 'pinned': False, 'type': 0
+        }}))
+    return frames
+
+
+def load_stream(path):
+    with open(path, 'rb') as fh:
+        return [line.strip() for line in fh if b'"t":"MESSAGE_CREATE"' in line]
+
+
+def replay(payloads, client):
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+
+    start = time.perf_counter()
+    messages = [Message(client, payload) for payload in payloads]
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    users = {id(message.author) for message in messages}
+    users.update(id(user) for message in messages for user in message.mentions)
+    return len(messages), len(users), used, elapsed
+
+
+def main():
+    frames = load_stream(sys.argv[1]) if len(sys.argv) > 1 else synthetic_stream()
+    payloads = [codec.loads(frame)['d'] for frame in frames]
+
+    print(f"{len(payloads)} MESSAGE_CREATE payloads, "
+          f"{len({payload['author']['id'] for payload in payloads})} distinct authors")
+
+    for name, client in (('per payload', None), ('interned', ReplayClient())):
+        count, users, used, elapsed = replay(payloads, client)
+        print(f"{name:>12}: {users:7,} User objects  {used / 1024:9,.0f} KiB  "
+              f"{used / count:6,.0f} B/message  {count / elapsed:10,.0f} messages/sec")
+
+
+if __name__ == '__main__':
+    main()
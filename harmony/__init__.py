@@ -2,8 +2,13 @@ import sys
 print("HarmonyPy - A powerful Discord API wrapper for Python", file=sys.stderr)
 
 from .client import Client, Bot
-from .models import User, Guild, Message, Channel
+from .sharding import AutoShardedClient, AutoShardedBot
+from .cluster import ClusterLauncher, IPCBus
+from .models import User, Guild, Message, LazyMessage, Channel, Role, Member, Emoji
 from .events import Event, EventDispatcher
+from .state import CachePolicy, ConnectionState
+from .rest import (RESTClient, RetryPolicy, HTTPException, BadRequest, Unauthorized, Forbidden, NotFound,
+                   RateLimited, ServerError)
 
 class _Enums:
     class ChannelType:
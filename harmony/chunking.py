@@ -0,0 +1,193 @@
+import asyncio
+import itertools
+import logging
+from collections import deque
+from typing import Optional, Dict, Any, Deque
+
+from .enums import Intents
+from .models import Guild, Member
+
+logger = logging.getLogger('harmony')
+
+CHUNK_MODES = ('startup', 'lazy')
+
+
+def _log_failure(future: asyncio.Future) -> None:
+    # Startup and lazy requests have nobody awaiting them
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning(f"Member chunk request failed: {future.exception()!r}")
+
+
+class ChunkRequest:
+    """One outstanding REQUEST_GUILD_MEMBERS for a guild"""
+
+    def __init__(self, guild: Guild, nonce: str):
+        self.guild = guild
+        self.nonce = nonce
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.chunks_received = 0
+        self.members_received = 0
+
+
+class MemberChunker:
+    """Fetches full member lists over the gateway (op 8) into the member cache.
+
+    Requests are queued and sent one guild at a time by a single sender task,
+    at low priority through each shard's send queue, so chunking hundreds of
+    guilds never starves heartbeats or other sends. Each GUILD_MEMBERS_CHUNK
+    is written straight into the guild's member store as it arrives.
+
+    With mode 'startup', large guilds are chunked as they become available.
+    With mode 'lazy', a guild is chunked the first time a member lookup
+    misses on it, or when `chunk()` is awaited.
+    """
+
+    def __init__(self, client, mode: Optional[str] = None, timeout: float = 60.0):
+        if mode is not None and mode not in CHUNK_MODES:
+            raise ValueError(f"chunk_guilds must be one of {', '.join(CHUNK_MODES)} or None")
+        if mode is not None and not client.intents & Intents.GUILD_MEMBERS:
+            raise ValueError("chunk_guilds needs the GUILD_MEMBERS intent")
+        if mode is not None and not client.state.enabled('members'):
+            raise ValueError("chunk_guilds needs the members cache")
+
+        self.client = client
+        self.mode = mode
+        self.timeout = timeout
+        self._requests: Dict[str, ChunkRequest] = {}
+        self._by_guild: Dict[int, ChunkRequest] = {}
+        self._queue: Deque[ChunkRequest] = deque()
+        self._sender: Optional[asyncio.Task] = None
+        self._nonces = itertools.count()
+
+    @property
+    def pending(self) -> int:
+        """Guilds requested but not fully received"""
+        return len(self._by_guild)
+
+    def request(self, guild: Guild) -> asyncio.Future:
+        """Queue a guild for chunking, returning a future resolved with the guild once complete.
+
+        Concurrent requests for the same guild share one request.
+        """
+        existing = self._by_guild.get(guild.id)
+        if existing is not None:
+            return existing.future
+
+        if not self.client.intents & Intents.GUILD_MEMBERS:
+            raise Exception("Requesting guild members needs the GUILD_MEMBERS intent")
+        if not self.client.state.enabled('members'):
+            raise Exception("Requesting guild members needs the members cache")
+
+        request = ChunkRequest(guild, str(next(self._nonces)))
+        request.future.add_done_callback(_log_failure)
+        self._requests[request.nonce] = request
+        self._by_guild[guild.id] = request
+        self._queue.append(request)
+
+        if self._sender is None or self._sender.done():
+            self._sender = asyncio.create_task(self._send_queued())
+        return request.future
+
+    async def chunk(self, guild: Guild, timeout: Optional[float] = None) -> Guild:
+        """Fetch every member of a guild, returning as soon as the guild is chunked"""
+        if guild.chunked:
+            return guild
+
+        future = self.request(guild)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout or self.timeout)
+        except asyncio.TimeoutError as e:
+            request = self._by_guild.get(guild.id)
+            self._drop(request)
+            if request is not None and not request.future.done():
+                request.future.set_exception(e)
+            raise
+
+    def on_member_miss(self, guild: Guild) -> None:
+        """Start chunking a guild in lazy mode after a cache miss on it"""
+        if self.mode != 'lazy' or guild.chunked or guild.id in self._by_guild:
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+
+        try:
+            self.request(guild)
+        except Exception as e:
+            logger.debug(f"Not chunking guild {guild.id}: {e}")
+
+    def on_guild_available(self, guild: Guild) -> None:
+        """Chunk large guilds as they arrive in startup mode"""
+        if self.mode != 'startup' or guild.chunked:
+            return
+
+        if guild.large or (guild.member_count or 0) > len(guild.members):
+            self.request(guild)
+        else:
+            # Small guilds already carry every member in GUILD_CREATE
+            guild.chunked = True
+
+    def feed(self, data: Dict[str, Any]) -> None:
+        """Stream a GUILD_MEMBERS_CHUNK into the member cache"""
+        request = self._requests.get(data.get('nonce'))
+        guild = request.guild if request else self.client.state.get_guild(data['guild_id'])
+        if guild is None:
+            return
+
+        client = self.client
+        for member_data in data['members']:
+            guild._add_member(Member(client, member_data))
+
+        if 'presences' in data and client.state.enabled('presences'):
+            for presence in data['presences']:
+                guild._set_presence(presence)
+
+        if request is None:
+            return
+
+        request.chunks_received += 1
+        request.members_received += len(data['members'])
+        if request.chunks_received >= data['chunk_count']:
+            guild.chunked = True
+            logger.debug(f"Chunked guild {guild.id}: {request.members_received} members "
+                         f"in {request.chunks_received} chunks")
+            self._drop(request)
+            if not request.future.done():
+                request.future.set_result(guild)
+
+    def _drop(self, request: Optional[ChunkRequest]) -> None:
+        if request is None:
+            return
+        self._requests.pop(request.nonce, None)
+        if self._by_guild.get(request.guild.id) is request:
+            del self._by_guild[request.guild.id]
+
+    async def _send_queued(self) -> None:
+        while self._queue:
+            request = self._queue.popleft()
+            if request.nonce not in self._requests:
+                continue
+
+            guild = request.guild
+            try:
+                connection = self.client._connection_for(guild.shard_id)
+                await connection.request_guild_members(
+                    guild.id, request.nonce, presences=self.client.state.enabled('presences')
+                )
+            except Exception as e:
+                self._drop(request)
+                if not request.future.done():
+                    request.future.set_exception(e)
+
+    def clear(self) -> None:
+        """Fail every outstanding request, e.g. when the client closes"""
+        for request in list(self._requests.values()):
+            if not request.future.done():
+                request.future.cancel()
+        self._requests.clear()
+        self._by_guild.clear()
+        self._queue.clear()
+        if self._sender:
+            self._sender.cancel()
+            self._sender = None
@@ -1,16 +1,88 @@
 
 import asyncio
 import aiohttp
-import json
 import logging
-import traceback
+import os
 from typing import Optional, Dict, Any, List, Callable, Union
 
+from .enums import Intents
 from .events import EventDispatcher
-from .models import User, Guild, Message, Channel
+from .gateway import GatewayConnection, GATEWAY_URL
+from .metrics import MetricsServer, render_prometheus
+from .rest import RESTClient
+from .models import User, Guild, Message, LazyMessage, Channel, Role, Member, Emoji
+from .state import ConnectionState, CachePolicy
+from .snapshot import save_snapshot, load_snapshot
+from .chunking import MemberChunker
 
 logger = logging.getLogger('harmony')
 
+# Listener events each gateway event can produce. If none of them has a
+# listener, the payload is dropped without being parsed into models.
+EVENT_LISTENERS: Dict[str, tuple] = {
+    'READY': ('ready', 'shard_ready'),
+    'MESSAGE_CREATE': ('message',),
+    'MESSAGE_UPDATE': ('message_edit', 'raw_message_edit'),
+    'MESSAGE_DELETE': ('message_delete', 'raw_message_delete'),
+    'MESSAGE_DELETE_BULK': ('bulk_message_delete', 'raw_bulk_message_delete'),
+    'GUILD_CREATE': ('guild_join',),
+    # component_interaction and modal_submit come from InteractionHandler, itself an interaction_create listener
+    'INTERACTION_CREATE': ('interaction_create',),
+    'MESSAGE_REACTION_ADD': ('raw_reaction_add',),
+    'MESSAGE_REACTION_REMOVE': ('raw_reaction_remove',),
+    'CHANNEL_CREATE': ('guild_channel_create',),
+    'CHANNEL_UPDATE': ('guild_channel_update',),
+    'CHANNEL_DELETE': ('guild_channel_delete',),
+    'THREAD_CREATE': ('thread_create',),
+    'THREAD_UPDATE': ('thread_update',),
+    'THREAD_DELETE': ('thread_delete',),
+    'GUILD_ROLE_CREATE': ('guild_role_create',),
+    'GUILD_ROLE_UPDATE': ('guild_role_update',),
+    'GUILD_ROLE_DELETE': ('guild_role_delete',),
+    'GUILD_MEMBER_ADD': ('member_join',),
+    'GUILD_MEMBER_UPDATE': ('member_update',),
+    'GUILD_MEMBER_REMOVE': ('member_remove',),
+    'GUILD_UPDATE': ('guild_update',),
+    'GUILD_DELETE': ('guild_remove',),
+    'GUILD_EMOJIS_UPDATE': ('guild_emojis_update',),
+    'PRESENCE_UPDATE': ('presence_update',),
+    'VOICE_STATE_UPDATE': ('voice_state_update',),
+}
+
+# Intents a gateway event is gated behind; Discord only sends it if one is enabled
+INTENT_EVENTS: Dict[str, int] = {
+    'GUILD_CREATE': Intents.GUILDS,
+    'GUILD_UPDATE': Intents.GUILDS,
+    'GUILD_DELETE': Intents.GUILDS,
+    'GUILD_ROLE_CREATE': Intents.GUILDS,
+    'GUILD_ROLE_UPDATE': Intents.GUILDS,
+    'GUILD_ROLE_DELETE': Intents.GUILDS,
+    'CHANNEL_CREATE': Intents.GUILDS,
+    'CHANNEL_UPDATE': Intents.GUILDS,
+    'CHANNEL_DELETE': Intents.GUILDS,
+    'THREAD_CREATE': Intents.GUILDS,
+    'THREAD_UPDATE': Intents.GUILDS,
+    'THREAD_DELETE': Intents.GUILDS,
+    'GUILD_MEMBER_ADD': Intents.GUILD_MEMBERS,
+    'GUILD_MEMBER_UPDATE': Intents.GUILD_MEMBERS,
+    'GUILD_MEMBER_REMOVE': Intents.GUILD_MEMBERS,
+    'GUILD_BAN_ADD': Intents.GUILD_BANS,
+    'GUILD_BAN_REMOVE': Intents.GUILD_BANS,
+    'GUILD_EMOJIS_UPDATE': Intents.GUILD_EMOJIS,
+    'VOICE_STATE_UPDATE': Intents.GUILD_VOICE_STATES,
+    'PRESENCE_UPDATE': Intents.GUILD_PRESENCES,
+    'MESSAGE_CREATE': Intents.GUILD_MESSAGES | Intents.DIRECT_MESSAGES,
+    'MESSAGE_UPDATE': Intents.GUILD_MESSAGES | Intents.DIRECT_MESSAGES,
+    'MESSAGE_DELETE': Intents.GUILD_MESSAGES | Intents.DIRECT_MESSAGES,
+    'MESSAGE_DELETE_BULK': Intents.GUILD_MESSAGES,
+    'MESSAGE_REACTION_ADD': Intents.GUILD_MESSAGE_REACTIONS | Intents.DIRECT_MESSAGE_REACTIONS,
+    'MESSAGE_REACTION_REMOVE': Intents.GUILD_MESSAGE_REACTIONS | Intents.DIRECT_MESSAGE_REACTIONS,
+    'TYPING_START': Intents.GUILD_MESSAGE_TYPING | Intents.DIRECT_MESSAGE_TYPING,
+}
+
+# Events the gateway connection itself needs, whatever the listeners
+CONNECTION_EVENTS = {'READY', 'RESUMED'}
+
 class MessageSender:
     """Helper class to send messages with components"""
 
@@ -38,121 +110,481 @@ class MessageSender:
                 payload['components'] = comp_list
 
         # Send to Discord API
-        if hasattr(client, 'rest') and hasattr(client.rest, 'create_message'):
-            return await client.rest.create_message(channel_id, payload)
-        return None
+        return await client.rest.create_message(channel_id, **payload)
 
 class Client:
     """Base client for interacting with the Discord API"""
 
-    def __init__(self, intents: int = 0):
+    def __init__(self, intents: int = 0, compress: bool = False, gateway_url: str = GATEWAY_URL,
+                 max_concurrent_listeners: Optional[int] = 100, ordered_dispatch: bool = False,
+                 slow_listener_threshold: Optional[float] = 0.25, cache: Optional[CachePolicy] = None,
+                 snapshot_path: Optional[str] = None, lazy_messages: bool = False,
+                 chunk_guilds: Optional[str] = None, max_listener_backlog: int = 10000):
         self.token: Optional[str] = None
         self.user: Optional[User] = None
-        self.guilds: Dict[str, Guild] = {}
-        self.ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self.application_id: Optional[str] = None
         self.session: Optional[aiohttp.ClientSession] = None
-        self.heartbeat_interval: Optional[float] = None
-        self.sequence: Optional[int] = None
         self.intents = intents
-
-        self.events = EventDispatcher()
+        self.compress = compress
+        self.gateway_url = gateway_url
+        self._connection: Optional[GatewayConnection] = None
+        # Every API request goes through this one client and its connection pool
+        self.rest = RESTClient(self)
+
+        self.events = EventDispatcher(max_concurrent_listeners, ordered=ordered_dispatch,
+                                      slow_threshold=slow_listener_threshold, max_backlog=max_listener_backlog)
+        self._metrics_server: Optional[MetricsServer] = None
         self._ready = asyncio.Event()
 
+        self.state = ConnectionState(self, cache)
+        self.snapshot_path = snapshot_path
+        self.chunker = MemberChunker(self, chunk_guilds)
+        # Lazy messages keep the raw payload and parse fields as they're read
+        self._message_class = LazyMessage if lazy_messages else Message
+        self._snapshot_sessions: Dict[int, Dict[str, Any]] = {}
+
+        # Gateway events that must always be parsed to keep the cache current
+        self._cache_events = self.state.cache_events()
+        self._parsers: Dict[str, Callable[[Dict[str, Any], int], Any]] = {
+            attr[6:].upper(): getattr(self, attr) for attr in dir(type(self)) if attr.startswith('parse_')
+        }
+        self._allowed: Optional[set] = None
+        self._allowed_version = -1
+
     async def login(self, token: str) -> None:
         """Login to Discord with the provided token"""
         self.token = token
-        self.session = aiohttp.ClientSession()
+        self.session = await self.rest.start()
 
         logger.info("Logging in to Discord...")
 
-        # Validate token by making a request to /users/@me
-        async with self.session.get(
-            'https://discord.com/api/v10/users/@me',
-            headers={'Authorization': f'Bot {self.token}'}
-        ) as resp:
-            if resp.status != 200:
-                raise Exception(f"Invalid token (Status: {resp.status})")
-
-            data = await resp.json()
-            self.user = User(self, data)
+        # Validate token by making a request to /users/@me; a bad token raises Unauthorized
+        data = await self.rest.get_current_user()
+        self.user = self.state.store_user(data)
 
         logger.info(f"Logged in as {self.user.username}#{self.user.discriminator}")
 
-    async def connect(self) -> None:
+    async def connect(self, reconnect: bool = True) -> None:
         """Connect to Discord gateway and start processing events"""
         if not self.token:
             raise Exception("Not logged in")
 
-        gateway_url = "wss://gateway.discord.gg/?v=10&encoding=json"
-
-        async with self.session.ws_connect(gateway_url) as ws:
-            self.ws = ws
-            await self._gateway_handler()
-
-    async def _gateway_handler(self) -> None:
-        """Handle the gateway connection and dispatch events"""
-        async for msg in self.ws:
-            if msg.type == aiohttp.WSMsgType.TEXT:
-                data = json.loads(msg.data)
-                op = data['op']
-
-                if op == 10:  # Hello
-                    self.heartbeat_interval = data['d']['heartbeat_interval'] / 1000
-                    await self._identify()
-                    asyncio.create_task(self._heartbeat())
-
-                elif op == 0:  # Dispatch
-                    self.sequence = data['s']
-                    event_name = data['t']
-                    event_data = data['d']
-
-                    await self._handle_dispatch(event_name, event_data)
-
-    async def _identify(self) -> None:
-        """Send identify payload to Discord"""
-        payload = {
-            'op': 2,
-            'd': {
-                'token': self.token,
-                'intents': self.intents,
-                'properties': {
-                    '$os': 'linux',
-                    '$browser': 'harmony',
-                    '$device': 'harmony'
-                }
-            }
-        }
+        self._load_snapshot()
+        self._connection = GatewayConnection(self, self.gateway_url, compress=self.compress)
+        self._restore_session(self._connection)
+        await self._connection.run(reconnect=reconnect)
+
+    def _load_snapshot(self) -> None:
+        """Warm the cache from the snapshot written by the last close(), if there is one"""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return
+
+        try:
+            self._snapshot_sessions = load_snapshot(self, self.snapshot_path)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache snapshot {self.snapshot_path}: {e!r}")
+            self.state.guilds.clear()
+            self.state.snapshot_guilds.clear()
+            self._snapshot_sessions = {}
+        finally:
+            # A snapshot is only valid once; a crash later must not bring back stale state
+            os.remove(self.snapshot_path)
 
-        await self.ws.send_json(payload)
-
-    async def _heartbeat(self) -> None:
-        """Send regular heartbeats to Discord"""
-        while True:
-            await asyncio.sleep(self.heartbeat_interval)
-            await self.ws.send_json({
-                'op': 1,
-                'd': self.sequence
-            })
-
-    async def _handle_dispatch(self, event_name: str, data: Dict[str, Any]) -> None:
-        """Process dispatched events from Discord"""
-        if event_name == 'READY':
-            self.user = User(self, data['user'])
-            for guild_data in data['guilds']:
-                guild = Guild(self, guild_data)
-                self.guilds[guild.id] = guild
-
-            self._ready.set()
-            await self.events.dispatch('ready')
-
-        elif event_name == 'MESSAGE_CREATE':
-            message = Message(self, data)
-            await self.events.dispatch('message', message)
-
-        elif event_name == 'GUILD_CREATE':
-            guild = Guild(self, data)
-            self.guilds[guild.id] = guild
-            await self.events.dispatch('guild_join', guild)
+    def _restore_session(self, connection: GatewayConnection) -> None:
+        """Hand a saved session to a connection so it resumes instead of identifying"""
+        session = self._snapshot_sessions.pop(connection.shard_id, None)
+        if session is None or session['shard_count'] != connection.shard_count:
+            return
+
+        connection.session_id = session['session_id']
+        connection.sequence = session['sequence']
+        connection.resume_gateway_url = session['resume_gateway_url']
+
+    def _allowed_events(self) -> Optional[set]:
+        """Gateway events worth decoding, or None if every event is wanted.
+
+        Built from the parser table, the registered listeners, the cache and
+        the intents, and rebuilt whenever listeners change.
+        """
+        if self._allowed_version == self.events.version:
+            return self._allowed
+
+        if self.events.has_listeners('raw_event'):
+            allowed = None
+        else:
+            allowed = set(CONNECTION_EVENTS)
+            for event_name in self._parsers:
+                wanted = self.events.has_listeners(*EVENT_LISTENERS.get(event_name, ()))
+                intent = INTENT_EVENTS.get(event_name)
+                if intent is not None and not self.intents & intent:
+                    if wanted:
+                        logger.warning(f"Listeners for {event_name} will never fire: its intent is not enabled")
+                    continue
+                if wanted or event_name in self._cache_events:
+                    allowed.add(event_name)
+
+        self._allowed = allowed
+        self._allowed_version = self.events.version
+        return allowed
+
+    async def _handle_dispatch(self, event_name: str, data: Dict[str, Any], shard_id: int = 0) -> None:
+        """Route a dispatched event to its parser, skipping events nobody consumes"""
+        if self.events.has_listeners('raw_event'):
+            await self.events.dispatch('raw_event', event_name, data, shard_id)
+
+        parser = self._parsers.get(event_name)
+        if parser is None:
+            return
+
+        if event_name not in self._cache_events and not self.events.has_listeners(*EVENT_LISTENERS.get(event_name, ())):
+            return
+
+        # A malformed payload or parser bug must not take the shard's connection down with it
+        try:
+            await parser(data, shard_id)
+        except Exception:
+            logger.exception(f"Failed to handle {event_name} on shard {shard_id}")
+
+    @property
+    def guilds(self) -> Dict[int, Guild]:
+        return self.state.guilds
+
+    def get_guild(self, guild_id: Union[int, str]) -> Optional[Guild]:
+        return self.state.get_guild(guild_id)
+
+    def get_user(self, user_id: Union[int, str]) -> Optional[User]:
+        return self.state.get_user(user_id)
+
+    def get_message(self, message_id: Union[int, str]) -> Optional[Message]:
+        return self.state.get_message(message_id)
+
+    async def parse_ready(self, data: Dict[str, Any], shard_id: int) -> None:
+        self.user = self.state.store_user(data['user'])
+        for guild_data in data['guilds']:
+            self.state.create_guild(guild_data, shard_id)
+
+        # A fresh session after a warm restart lists every guild the shard is still in;
+        # snapshot guilds missing from it were left while the bot was down
+        listed = {int(guild_data['id']) for guild_data in data['guilds']}
+        shard_count = (data.get('shard') or [shard_id, 1])[1]
+        stale = self.state.drop_stale_guilds(shard_id, shard_count, listed)
+        if stale:
+            logger.info(f"Dropped {len(stale)} snapshot guilds missing from READY on shard {shard_id}")
+        for guild in stale:
+            await self.events.dispatch('guild_remove', guild)
+
+        await self._mark_ready(shard_id)
+
+    async def parse_resumed(self, data: Dict[str, Any], shard_id: int) -> None:
+        self.state.confirm_snapshot_guilds(shard_id, self._connection_for(shard_id).shard_count or 1)
+        # After a warm restart there is no READY; the resumed session is ready as is
+        if not self._ready.is_set():
+            await self._mark_ready(shard_id)
+
+    async def parse_message_create(self, data: Dict[str, Any], shard_id: int) -> None:
+        message = self._message_class(self, data)
+        message.shard_id = shard_id
+        self.state.store_message(message)
+        await self.events.dispatch('message', message)
+
+    async def parse_message_update(self, data: Dict[str, Any], shard_id: int) -> None:
+        # Edits are often partial (e.g. embeds resolving), so apply them in place
+        message = self.state.messages.get(data['id'])
+        before = None
+        if message is not None:
+            if self.events.has_listeners('message_edit'):
+                before = message._copy()
+            message._update(data)
+
+        await self.events.dispatch('raw_message_edit', data)
+        if before is not None:
+            await self.events.dispatch('message_edit', before, message)
+
+    async def parse_message_delete(self, data: Dict[str, Any], shard_id: int) -> None:
+        message = self.state.messages.remove(data['id'])
+
+        await self.events.dispatch('raw_message_delete', data)
+        if message is not None:
+            await self.events.dispatch('message_delete', message)
+
+    async def parse_message_delete_bulk(self, data: Dict[str, Any], shard_id: int) -> None:
+        removed = (self.state.messages.remove(message_id) for message_id in data['ids'])
+        messages = [message for message in removed if message is not None]
+
+        await self.events.dispatch('raw_bulk_message_delete', data)
+        if messages:
+            await self.events.dispatch('bulk_message_delete', messages)
+
+    async def parse_guild_create(self, data: Dict[str, Any], shard_id: int) -> None:
+        guild = self.state.create_guild(data, shard_id)
+        self.chunker.on_guild_available(guild)
+        await self.events.dispatch('guild_join', guild)
+
+    async def parse_guild_members_chunk(self, data: Dict[str, Any], shard_id: int) -> None:
+        self.chunker.feed(data)
+
+    async def parse_guild_update(self, data: Dict[str, Any], shard_id: int) -> None:
+        guild = self.state.get_guild(data['id'])
+        if guild is not None:
+            self.state.update_guild(guild, data)
+            await self.events.dispatch('guild_update', guild)
+
+    async def parse_guild_delete(self, data: Dict[str, Any], shard_id: int) -> None:
+        if data.get('unavailable'):
+            # An outage, not a removal; the guild comes back with a new GUILD_CREATE
+            guild = self.state.get_guild(data['id'])
+            if guild is not None:
+                guild.unavailable = True
+            return
+
+        guild = self.state.remove_guild(data['id'])
+        if guild is not None:
+            await self.events.dispatch('guild_remove', guild)
+
+    def _guild_for(self, data: Dict[str, Any]) -> Optional[Guild]:
+        guild_id = data.get('guild_id')
+        return self.state.get_guild(guild_id) if guild_id is not None else None
+
+    async def parse_channel_create(self, data: Dict[str, Any], shard_id: int) -> None:
+        guild = self._guild_for(data)
+        if guild is None:
+            return
+
+        channel = Channel(self, data)
+        guild._add_channel(channel)
+        await self.events.dispatch('guild_channel_create', channel)
+
+    async def parse_channel_update(self, data: Dict[str, Any], shard_id: int) -> None:
+        guild = self._guild_for(data)
+        if guild is None:
+            return
+
+        before = guild.get_channel(data['id'])
+        after = Channel(self, data)
+        guild._add_channel(after)
+        if before is not None:
+            await self.events.dispatch('guild_channel_update', before, after)
+
+    async def parse_channel_delete(self, data: Dict[str, Any], shard_id: int) -> None:
+        guild = self._guild_for(data)
+        if guild is None:
+            return
+
+        channel = guild.channels.pop(int(data['id']), None)
+        self.state.messages.remove_channel(int(data['id']))
+        if channel is not None:
+            await self.events.dispatch('guild_channel_delete', channel)
+
+    async def parse_thread_create(self, data: Dict[str, Any], shard_id: int) -> None:
+        guild = self._guild_for(data)
+        if guild is None:
+            return
+
+        thread = Channel(self, data)
+        guild._add_thread(thread)
+        await self.events.dispatch('thread_create', thread)
+
+    async def parse_thread_update(self, data: Dict[str, Any], shard_id: int) -> None:
+        guild = self._guild_for(data)
+        if guild is None:
+            return
+
+        before = guild.get_thread(data['id'])
+        after = Channel(self, data)
+        guild._add_thread(after)
+        if before is not None:
+            await self.events.dispatch('thread_update', before, after)
+
+    async def parse_thread_delete(self, data: Dict[str, Any], shard_id: int) -> None:
+        guild = self._guild_for(data)
+        if guild is None:
+            return
+
+        thread = guild.threads.pop(int(data['id']), None)
+        if thread is not None:
+            await self.events.dispatch('thread_delete', thread)
+
+    async def parse_guild_role_create(self, data: Dict[str, Any], shard_id: int) -> None:
+        guild = self._guild_for(data)
+        if guild is None:
+            return
+
+        role = Role(self, data['role'])
+        guild._add_role(role)
+        await self.events.dispatch('guild_role_create', role)
+
+    async def parse_guild_role_update(self, data: Dict[str, Any], shard_id: int) -> None:
+        guild = self._guild_for(data)
+        if guild is None:
+            return
+
+        before = guild.get_role(data['role']['id'])
+        after = Role(self, data['role'])
+        guild._add_role(after)
+        if before is not None:
+            await self.events.dispatch('guild_role_update', before, after)
+
+    async def parse_guild_role_delete(self, data: Dict[str, Any], shard_id: int) -> None:
+        guild = self._guild_for(data)
+        if guild is None:
+            return
+
+        role = guild.roles.pop(int(data['role_id']), None)
+        if role is not None:
+            await self.events.dispatch('guild_role_delete', role)
+
+    async def parse_guild_member_add(self, data: Dict[str, Any], shard_id: int) -> None:
+        guild = self._guild_for(data)
+        if guild is None:
+            return
+
+        member = Member(self, data)
+        if self.state.enabled('members'):
+            guild._add_member(member)
+        if guild.member_count is not None:
+            guild.member_count += 1
+        await self.events.dispatch('member_join', member)
+
+    async def parse_guild_member_update(self, data: Dict[str, Any], shard_id: int) -> None:
+        guild = self._guild_for(data)
+        if guild is None:
+            return
+
+        # Read the store directly; only user lookups should start a lazy chunk
+        before = guild.members.get(int(data['user']['id']))
+        after = Member(self, data)
+        if self.state.enabled('members'):
+            guild._add_member(after)
+        if before is not None:
+            await self.events.dispatch('member_update', before, after)
+
+    async def parse_guild_member_remove(self, data: Dict[str, Any], shard_id: int) -> None:
+        guild = self._guild_for(data)
+        if guild is None:
+            return
+
+        member = guild.members.pop(int(data['user']['id']), None)
+        if guild.member_count is not None:
+            guild.member_count -= 1
+        if member is not None:
+            await self.events.dispatch('member_remove', member)
+
+    async def parse_guild_emojis_update(self, data: Dict[str, Any], shard_id: int) -> None:
+        guild = self._guild_for(data)
+        if guild is None:
+            return
+
+        emojis = [Emoji(self, emoji_data) for emoji_data in data['emojis']]
+        if self.state.enabled('emojis'):
+            guild.emojis = {emoji.id: emoji for emoji in emojis}
+        await self.events.dispatch('guild_emojis_update', guild, emojis)
+
+    async def parse_presence_update(self, data: Dict[str, Any], shard_id: int) -> None:
+        guild = self._guild_for(data)
+        if guild is not None and self.state.enabled('presences'):
+            guild._set_presence(data)
+        await self.events.dispatch('presence_update', data)
+
+    async def parse_voice_state_update(self, data: Dict[str, Any], shard_id: int) -> None:
+        guild = self._guild_for(data)
+        if guild is not None and self.state.enabled('voice_states'):
+            guild._set_voice_state(data)
+        await self.events.dispatch('voice_state_update', data)
+
+    async def parse_interaction_create(self, data: Dict[str, Any], shard_id: int) -> None:
+        await self.events.dispatch('interaction_create', data)
+
+    async def parse_message_reaction_add(self, data: Dict[str, Any], shard_id: int) -> None:
+        await self.events.dispatch('raw_reaction_add', data)
+
+    async def parse_message_reaction_remove(self, data: Dict[str, Any], shard_id: int) -> None:
+        await self.events.dispatch('raw_reaction_remove', data)
+
+    async def _mark_ready(self, shard_id: int) -> None:
+        self._ready.set()
+        await self.events.dispatch('ready')
+
+    def _connections(self) -> List[GatewayConnection]:
+        return [self._connection] if self._connection else []
+
+    def _connection_for(self, shard_id: Optional[int]) -> GatewayConnection:
+        if self._connection is None:
+            raise Exception("Not connected")
+        return self._connection
+
+    @property
+    def send_stats(self) -> Dict[int, Dict[str, Any]]:
+        """Outbound gateway queue depth and wait times per shard"""
+        return {connection.shard_id: connection.ratelimiter.stats() for connection in self._connections()}
+
+    @property
+    def latency(self) -> Optional[float]:
+        """Average heartbeat round trip in seconds across all shards"""
+        latencies = [c.latency for c in self._connections() if c.latency is not None]
+        if not latencies:
+            return None
+        return sum(latencies) / len(latencies)
+
+    @property
+    def latencies(self) -> Dict[int, Optional[float]]:
+        """Most recent heartbeat round trip per shard"""
+        return {connection.shard_id: connection.latency for connection in self._connections()}
+
+    @property
+    def latency_stats(self) -> Dict[int, Dict[str, Any]]:
+        """Rolling heartbeat latency histogram (p50/p90/p99) per shard"""
+        return {connection.shard_id: connection.latency_histogram.summary() for connection in self._connections()}
+
+    @property
+    def dispatch_stats(self) -> Dict[str, Any]:
+        """Per-event counts, per-listener latency and in-flight listener tasks"""
+        return self.events.stats()
+
+    @property
+    def message_cache_stats(self) -> Dict[str, Any]:
+        """Message cache size, hits, misses and evictions"""
+        return self.state.messages.stats()
+
+    @property
+    def rest_stats(self) -> Dict[str, Any]:
+        """REST requests sent, connection reuse, latency and rate limit state"""
+        return self.rest.stats()
+
+    def metrics_text(self) -> str:
+        """Dispatch and gateway metrics in Prometheus text format"""
+        return render_prometheus(self)
+
+    async def start_metrics_server(self, host: str = '127.0.0.1', port: int = 9100) -> None:
+        """Serve Prometheus metrics on http://host:port/metrics"""
+        if self._metrics_server is None:
+            self._metrics_server = MetricsServer(self, host, port)
+            await self._metrics_server.start()
+
+    async def change_presence(self, status: str = 'online', activity: Optional[Dict[str, Any]] = None,
+                              afk: bool = False) -> None:
+        """Update the bot's presence on every gateway connection"""
+        activities = [activity] if activity else []
+        for connection in self._connections():
+            await connection.change_presence(status, activities, afk)
+
+    @property
+    def ws(self) -> Optional[aiohttp.ClientWebSocketResponse]:
+        return self._connection.ws if self._connection else None
+
+    @property
+    def sequence(self) -> Optional[int]:
+        return self._connection.sequence if self._connection else None
+
+    @property
+    def heartbeat_interval(self) -> Optional[float]:
+        return self._connection.heartbeat_interval if self._connection else None
+
+    @property
+    def transport_stats(self) -> Dict[str, Any]:
+        """Bytes received on the wire against decompressed bytes (zlib-stream only)"""
+        if not self._connection or not self._connection._inflator:
+            return {}
+        return self._connection._inflator.stats()
 
     async def wait_until_ready(self) -> None:
         """Wait until the client is fully connected and ready"""
@@ -165,8 +597,7 @@ class Client:
                 await self.login(token)
                 await self.connect()
             finally:
-                if self.session:
-                    await self.session.close()
+                await self.rest.close()
 
         loop = asyncio.get_event_loop()
         try:
@@ -178,11 +609,29 @@ class Client:
             loop.close()
 
     async def close(self) -> None:
-        """Close the connection to Discord"""
-        if self.ws:
-            await self.ws.close()
-        if self.session:
-            await self.session.close()
+        """Close the connection to Discord, saving a cache snapshot if `snapshot_path` is set"""
+        if self.events.monitor is not None:
+            self.events.monitor.stop()
+        if self._metrics_server:
+            await self._metrics_server.stop()
+            self._metrics_server = None
+
+        self.chunker.clear()
+
+        # Closing with 1000 ends the session; any other code keeps it resumable
+        code = 4000 if self.snapshot_path else 1000
+        await asyncio.gather(*(connection.close(code=code) for connection in self._connections()))
+
+        if self.snapshot_path and self.state.guilds:
+            count = save_snapshot(self, self.snapshot_path)
+            logger.info(f"Saved {count} guilds to {self.snapshot_path}")
+
+        await self.rest.close()
+
+    async def wait_for(self, event: str, check: Optional[Callable[..., bool]] = None,
+                       timeout: Optional[float] = None, **keys: Any) -> Any:
+        """Wait for an event, optionally indexed by channel_id, user_id or custom_id"""
+        return await self.events.wait_for(event, check=check, timeout=timeout, **keys)
 
     def event(self, coro: Callable) -> Callable:
         """Decorator to register an event handler"""
@@ -190,18 +639,17 @@ class Client:
         self.events.add_listener(event_name, coro)
         return coro
 
+    def coalesced_event(self, window: float = 0.5, key: Optional[str] = 'guild_id', max_size: int = 1000):
+        """Decorator to register an event handler that receives bursts as one list"""
+        def decorator(coro: Callable) -> Callable:
+            self.events.add_coalesced_listener(coro.__name__, coro, window=window, key=key, max_size=max_size)
+            return coro
+        return decorator
+
     async def send_message(self, channel_id: str, content: str) -> Message:
         """Send a message to a channel"""
-        async with self.session.post(
-            f'https://discord.com/api/v10/channels/{channel_id}/messages',
-            headers={'Authorization': f'Bot {self.token}'},
-            json={'content': content}
-        ) as resp:
-            if resp.status != 200:
-                raise Exception(f"Failed to send message (Status: {resp.status})")
-
-            data = await resp.json()
-            return Message(self, data)
+        data = await self.rest.create_message(channel_id, content)
+        return Message(self, data)
 
 
 class Bot(Client):
@@ -210,8 +658,8 @@ class Bot(Client):
     # Static reference to store the current instance
     _current_instance = None
 
-    def __init__(self, command_prefix: str, intents: int = 0):
-        super().__init__(intents=intents)
+    def __init__(self, command_prefix: str, intents: int = 0, **options):
+        super().__init__(intents=intents, **options)
         self.command_prefix = command_prefix
         self.commands = {}
 
@@ -244,85 +692,14 @@ class Bot(Client):
             except Exception as e:
                 logger.error(f"Error executing command {command_name}: {e}")
 
+    async def parse_ready(self, data: Dict[str, Any], shard_id: int) -> None:
+        self.session_id = data.get('session_id')
+        self.application_id = data.get('application', {}).get('id')
+        await super().parse_ready(data, shard_id)
+
     async def process_event(self, event_data):
-        """Process a Discord gateway event"""
+        """Process a raw Discord gateway event"""
         try:
-            if event_data.get('t') == 'READY':
-                data = event_data.get('d', {})
-                self.user = User(self, data.get('user', {}))
-                self.session_id = data.get('session_id')
-
-                self.application_id = data.get('application', {}).get('id')
-
-                # Process guilds
-                for guild_data in data.get('guilds', []):
-                    self.guilds[guild_data['id']] = Guild(self, guild_data)
-
-                await self.events.emit('ready')
-
-            elif event_data.get('t') == 'MESSAGE_CREATE':
-                message_data = event_data.get('d', {})
-                message = Message(self, message_data)
-
-                # Check if this is a command
-                if message.content.startswith(self.command_prefix):
-                    # Extract command name and arguments
-                    parts = message.content[len(self.command_prefix):].split()
-                    command_name = parts[0].lower()
-                    args = parts[1:]
-
-                    # Execute the command if it exists
-                    if command_name in self.commands:
-                        try:
-                            await self.commands[command_name](message, *args)
-                        except Exception as e:
-                            print(f"Error executing command {command_name}: {e}")
-                            traceback.print_exc()
-
-                await self.events.emit('message', message)
-
-            # Handle interaction events
-            elif event_data.get('t') == 'INTERACTION_CREATE':
-                interaction_data = event_data.get('d', {})
-                interaction_type = interaction_data.get('type')
-
-                # Handle component interactions (buttons, select menus)
-                if interaction_type == 3:  # MESSAGE_COMPONENT
-                    data = interaction_data.get('data', {})
-                    custom_id = data.get('custom_id')
-                    component_type = data.get('component_type')
-
-                    # Create context for the interaction
-                    from harmony.interactions import InteractionContext
-                    ctx = InteractionContext(self, interaction_data)
-                    
-                    # Initialize rest client if not already set
-                    if not hasattr(self, 'rest'):
-                        from harmony.rest import RESTClient
-                        self.rest = RESTClient(self)
-
-                    # Emit component interaction event
-                    try:
-                        print(f"Processing interaction: {custom_id}, type: {component_type}")
-                        await self.events.emit('component_interaction', ctx, custom_id, component_type)
-                    except Exception as e:
-                        print(f"Error handling component interaction: {e}")
-                        import traceback
-                        traceback.print_exc()
-
-                # Handle other interaction types
-                elif interaction_type == 2:  # APPLICATION_COMMAND
-                    # Slash commands
-                    await self.events.emit('application_command', interaction_data)
-                elif interaction_type == 5:  # MODAL_SUBMIT
-                    # Modal submissions
-                    await self.events.emit('modal_submit', interaction_data)
-
-            # Handle other event types...
-            elif event_data.get('t') == 'GUILD_CREATE':
-                guild_data = event_data.get('d', {})
-                self.guilds[guild_data['id']] = Guild(self, guild_data)
-
-            # ... more event handling
+            await self._handle_dispatch(event_data.get('t'), event_data.get('d', {}))
         except Exception as e:
             logger.error(f"Error processing event: {e}")
@@ -0,0 +1,419 @@
+import asyncio
+import functools
+import itertools
+import logging
+import multiprocessing
+import struct
+from typing import Optional, Dict, List, Any, Callable, Awaitable, Set
+
+import aiohttp
+
+from . import codec
+from .gateway import IdentifyLimiter
+
+logger = logging.getLogger('harmony')
+
+_HEADER = struct.Struct('>I')
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> Dict[str, Any]:
+    header = await reader.readexactly(_HEADER.size)
+    (length,) = _HEADER.unpack(header)
+    return codec.loads(await reader.readexactly(length))
+
+
+def _write_frame(writer: asyncio.StreamWriter, payload: Dict[str, Any]) -> None:
+    data = codec.dumps(payload).encode('utf-8')
+    writer.write(_HEADER.pack(len(data)) + data)
+
+
+def _spawn(tasks: Set[asyncio.Task], coro) -> asyncio.Task:
+    """Start a task and keep a reference to it until it finishes, logging any failure"""
+    task = asyncio.create_task(coro)
+    tasks.add(task)
+    task.add_done_callback(functools.partial(_task_done, tasks))
+    return task
+
+
+def _task_done(tasks: Set[asyncio.Task], task: asyncio.Task) -> None:
+    tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("IPC task failed", exc_info=task.exception())
+
+
+class IPCHub:
+    """Routes broadcasts, queries and IDENTIFY slots between cluster processes"""
+
+    def __init__(self, max_concurrency: int = 1):
+        self.peers: Dict[int, asyncio.StreamWriter] = {}
+        self._requests: Dict[str, Dict[str, Any]] = {}
+        self._identify = IdentifyLimiter(max_concurrency)
+        # IDENTIFY slots granted to each cluster and not yet given back
+        self._held: Dict[int, List[int]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0):
+        self._server = await asyncio.start_server(self._handle_peer, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def close(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        for writer in self.peers.values():
+            writer.close()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        cluster_id = None
+        try:
+            hello = await _read_frame(reader)
+            cluster_id = hello['cluster_id']
+            self.peers[cluster_id] = writer
+            logger.info(f"Cluster {cluster_id} connected to IPC hub")
+
+            while True:
+                await self._route(cluster_id, await _read_frame(reader))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if cluster_id is not None and self.peers.get(cluster_id) is writer:
+                del self.peers[cluster_id]
+                self._drop_peer(cluster_id)
+            writer.close()
+
+    async def _route(self, origin: int, frame: Dict[str, Any]) -> None:
+        op = frame['op']
+
+        if op == 'broadcast':
+            for cluster_id, writer in self.peers.items():
+                if cluster_id != origin:
+                    _write_frame(writer, frame)
+
+        elif op == 'request':
+            waiting = {cluster_id for cluster_id in self.peers if cluster_id != origin}
+            self._requests[frame['nonce']] = {'origin': origin, 'waiting': waiting, 'responses': []}
+            for cluster_id in waiting:
+                _write_frame(self.peers[cluster_id], frame)
+            self._complete(frame['nonce'])
+
+        elif op == 'response':
+            pending = self._requests.get(frame['nonce'])
+            if pending and origin in pending['waiting']:
+                pending['waiting'].discard(origin)
+                pending['responses'].append([origin, frame['data']])
+                self._complete(frame['nonce'])
+
+        elif op == 'identify':
+            _spawn(self._tasks, self._grant_identify(origin, frame))
+
+        elif op == 'identified':
+            held = self._held.get(origin, [])
+            if frame['shard_id'] in held:
+                held.remove(frame['shard_id'])
+                self._identify.release(frame['shard_id'], sent=frame['sent'])
+
+    async def _grant_identify(self, origin: int, frame: Dict[str, Any]) -> None:
+        await self._identify.wait(frame['shard_id'])
+        writer = self.peers.get(origin)
+        if writer:
+            self._held.setdefault(origin, []).append(frame['shard_id'])
+            _write_frame(writer, {'op': 'identify', 'nonce': frame['nonce'], 'shard_id': frame['shard_id']})
+        else:
+            self._identify.release(frame['shard_id'], sent=False)
+
+    def _complete(self, nonce: str) -> None:
+        pending = self._requests[nonce]
+        if pending['waiting']:
+            return
+
+        del self._requests[nonce]
+        writer = self.peers.get(pending['origin'])
+        if writer:
+            _write_frame(writer, {'op': 'response', 'nonce': nonce, 'data': pending['responses']})
+
+    def _drop_peer(self, cluster_id: int) -> None:
+        # A cluster that went away may have sent its IDENTIFY already
+        for shard_id in self._held.pop(cluster_id, []):
+            self._identify.release(shard_id)
+
+        for nonce in list(self._requests):
+            if self._requests[nonce]['origin'] == cluster_id:
+                del self._requests[nonce]
+                continue
+            self._requests[nonce]['waiting'].discard(cluster_id)
+            self._complete(nonce)
+
+
+class IPCBus:
+    """Cluster-side connection to the IPC hub.
+
+    Broadcasts from other clusters are dispatched as `ipc_<event>` events with
+    `(data, cluster_id)`, and queries are answered by handlers registered with
+    `handler()`.
+    """
+
+    def __init__(self, client, cluster_id: int, host: str, port: int):
+        self.client = client
+        self.cluster_id = cluster_id
+        self.host = host
+        self.port = port
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._nonces = itertools.count()
+        self._handlers: Dict[str, Callable[[Any], Awaitable[Any]]] = {
+            'has_guild': self._has_guild
+        }
+
+    async def connect(self) -> None:
+        reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        _write_frame(self._writer, {'op': 'hello', 'cluster_id': self.cluster_id})
+        await self._writer.drain()
+        self._reader_task = asyncio.create_task(self._read_loop(reader))
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing() and \
+            self._reader_task is not None and not self._reader_task.done()
+
+    async def close(self) -> None:
+        if self._reader_task:
+            self._reader_task.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+        if self._writer:
+            self._writer.close()
+
+    def handler(self, name: Optional[str] = None):
+        """Decorator to register a query handler"""
+        def decorator(func):
+            self._handlers[name or func.__name__] = func
+            return func
+        return decorator
+
+    async def broadcast(self, event: str, data: Any = None) -> None:
+        """Send an event to every other cluster"""
+        await self._send({'op': 'broadcast', 'event': event, 'data': data, 'from': self.cluster_id})
+
+    async def request(self, query: str, data: Any = None, timeout: float = 5.0) -> Dict[int, Any]:
+        """Ask every other cluster a query, returning their answers keyed by cluster id"""
+        responses = await self._call({'op': 'request', 'query': query, 'data': data}, timeout)
+        return {cluster_id: answer for cluster_id, answer in responses}
+
+    async def find_guild(self, guild_id: str, timeout: float = 5.0) -> Optional[int]:
+        """Return the id of the cluster that holds a guild"""
+        if int(guild_id) in self.client.guilds:
+            return self.cluster_id
+
+        answers = await self.request('has_guild', str(guild_id), timeout=timeout)
+        for cluster_id, has_guild in answers.items():
+            if has_guild:
+                return cluster_id
+        return None
+
+    async def wait_identify(self, shard_id: int, timeout: Optional[float] = None) -> None:
+        await self._call({'op': 'identify', 'shard_id': shard_id}, timeout)
+
+    def identified(self, shard_id: int, sent: bool = True) -> None:
+        """Give an IDENTIFY slot back to the hub"""
+        if self._writer is not None and not self._writer.is_closing():
+            _write_frame(self._writer, {'op': 'identified', 'shard_id': shard_id, 'sent': sent})
+
+    async def _has_guild(self, guild_id: str) -> bool:
+        return int(guild_id) in self.client.guilds
+
+    async def _call(self, frame: Dict[str, Any], timeout: Optional[float]) -> Any:
+        nonce = f"{self.cluster_id}:{next(self._nonces)}"
+        future = asyncio.get_running_loop().create_future()
+        self._pending[nonce] = future
+
+        try:
+            await self._send(dict(frame, nonce=nonce))
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(nonce, None)
+
+    async def _send(self, payload: Dict[str, Any]) -> None:
+        _write_frame(self._writer, payload)
+        await self._writer.drain()
+
+    async def _read_loop(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while True:
+                frame = await _read_frame(reader)
+                op = frame['op']
+
+                if op == 'broadcast':
+                    _spawn(self._tasks, self.client.events.dispatch(f"ipc_{frame['event']}", frame['data'],
+                                                                    frame['from']))
+
+                elif op == 'request':
+                    _spawn(self._tasks, self._answer(frame))
+
+                elif op in ('response', 'identify'):
+                    future = self._pending.get(frame['nonce'])
+                    if future and not future.done():
+                        future.set_result(frame.get('data'))
+                    elif op == 'identify':
+                        # Granted after the shard gave up waiting; hand the slot straight back
+                        self.identified(frame['shard_id'], sent=False)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            logger.warning(f"Cluster {self.cluster_id} lost its IPC hub connection")
+        finally:
+            # Nothing will answer these now
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("IPC hub connection lost"))
+
+    async def _answer(self, frame: Dict[str, Any]) -> None:
+        handler = self._handlers.get(frame['query'])
+        result = None
+
+        if handler:
+            try:
+                result = await handler(frame['data'])
+            except Exception as e:
+                logger.error(f"Error in IPC handler {frame['query']}: {e}")
+
+        await self._send({'op': 'response', 'nonce': frame['nonce'], 'data': result})
+
+
+class _IPCIdentifyLimiter:
+    """Identify limiter that asks the hub, so buckets are shared across processes.
+
+    If the hub is gone, or doesn't grant a slot within `timeout` seconds, the
+    shard falls back to a limiter local to this process rather than waiting
+    forever.
+    """
+
+    def __init__(self, bus: IPCBus, max_concurrency: int = 1, timeout: float = 120.0):
+        self.bus = bus
+        self.timeout = timeout
+        self._local = IdentifyLimiter(max_concurrency)
+        self._local_slots: Set[int] = set()
+
+    async def wait(self, shard_id: int) -> None:
+        if self.bus.connected:
+            try:
+                await self.bus.wait_identify(shard_id, self.timeout)
+                return
+            except (asyncio.TimeoutError, ConnectionError) as e:
+                logger.warning(f"Shard {shard_id} got no IDENTIFY slot from the IPC hub ({e!r}); "
+                               f"using a local limiter")
+
+        await self._local.wait(shard_id)
+        self._local_slots.add(shard_id)
+
+    def release(self, shard_id: int, sent: bool = True) -> None:
+        if shard_id in self._local_slots:
+            self._local_slots.discard(shard_id)
+            self._local.release(shard_id, sent)
+        else:
+            self.bus.identified(shard_id, sent)
+
+
+def _run_cluster(client_factory, token: str, cluster_id: int, shard_ids: List[int],
+                 shard_count: int, host: str, port: int) -> None:
+    client = client_factory(shard_ids=shard_ids, shard_count=shard_count)
+    client.cluster_id = cluster_id
+    client.ipc = IPCBus(client, cluster_id, host, port)
+    client.identify_limiter = _IPCIdentifyLimiter(client.ipc)
+
+    async def runner():
+        await client.ipc.connect()
+        try:
+            await client.login(token)
+            await client.connect()
+        finally:
+            await client.ipc.close()
+            await client.close()
+
+    try:
+        asyncio.run(runner())
+    except KeyboardInterrupt:
+        pass
+
+
+class ClusterLauncher:
+    """Spreads shards over worker processes, each running its own sharded client.
+
+    `client_factory` is called in every worker as
+    `client_factory(shard_ids=..., shard_count=...)` and must return an
+    `AutoShardedClient` (or `AutoShardedBot`). It has to be a module-level
+    callable so it can be sent to the worker processes.
+    """
+
+    def __init__(self, client_factory: Callable[..., Any], clusters: Optional[int] = None,
+                 shard_count: Optional[int] = None, host: str = '127.0.0.1', port: int = 0):
+        self.client_factory = client_factory
+        self.clusters = clusters or multiprocessing.cpu_count()
+        self.shard_count = shard_count
+        self.max_concurrency = 1
+        self.host = host
+        self.port = port
+        self.processes: List[multiprocessing.Process] = []
+
+    def cluster_ranges(self) -> List[List[int]]:
+        """Split the shard ids into contiguous ranges, one per cluster"""
+        clusters = min(self.clusters, self.shard_count)
+        per_cluster, extra = divmod(self.shard_count, clusters)
+
+        ranges = []
+        start = 0
+        for cluster_id in range(clusters):
+            end = start + per_cluster + (1 if cluster_id < extra else 0)
+            ranges.append(list(range(start, end)))
+            start = end
+        return ranges
+
+    async def _fetch_gateway_info(self, token: str) -> None:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(
+                'https://discord.com/api/v10/gateway/bot',
+                headers={'Authorization': f'Bot {token}'}
+            ) as resp:
+                if resp.status != 200:
+                    raise Exception(f"Failed to fetch gateway info (Status: {resp.status})")
+
+                data = await resp.json(loads=codec.loads)
+
+        self.max_concurrency = data.get('session_start_limit', {}).get('max_concurrency', 1)
+        if self.shard_count is None:
+            self.shard_count = data['shards']
+
+    async def start(self, token: str) -> None:
+        """Start the IPC hub and one process per cluster, returning when they all exit"""
+        await self._fetch_gateway_info(token)
+
+        hub = IPCHub(self.max_concurrency)
+        host, port = await hub.start(self.host, self.port)
+
+        for cluster_id, shard_ids in enumerate(self.cluster_ranges()):
+            process = multiprocessing.Process(
+                target=_run_cluster,
+                args=(self.client_factory, token, cluster_id, shard_ids, self.shard_count, host, port),
+                name=f"harmony-cluster-{cluster_id}",
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+            logger.info(f"Started cluster {cluster_id} with shards {shard_ids[0]}-{shard_ids[-1]}")
+
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.gather(*(loop.run_in_executor(None, process.join) for process in self.processes))
+        finally:
+            await hub.close()
+
+    def run(self, token: str) -> None:
+        """Launch every cluster and block until they exit"""
+        try:
+            asyncio.run(self.start(token))
+        except KeyboardInterrupt:
+            logger.info("Cluster launcher shutting down...")
+            for process in self.processes:
+                process.terminate()
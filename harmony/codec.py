@@ -0,0 +1,112 @@
+import json
+import re
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+def _json_loads(data: Union[str, bytes]) -> Any:
+    return json.loads(data)
+
+
+def _json_dumps(obj: Any) -> str:
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+
+
+def _orjson_dumps(obj: Any) -> str:
+    return orjson.dumps(obj).decode('utf-8')
+
+
+def _msgspec_dumps(obj: Any) -> str:
+    return msgspec.json.encode(obj).decode('utf-8')
+
+
+# Dispatch envelopes start with "t", "s" and "op" before the (large) "d" field,
+# so the event name and sequence can be read from the first bytes of a frame.
+_HEAD_SIZE = 128
+# Whitespace after the separators is allowed, as json.dumps writes it by default.
+_PEEK_PATTERNS = {
+    str: (re.compile(r'"t":\s*"([A-Z_]+)"'), re.compile(r'"s":\s*(\d+)'), re.compile(r'"op":\s*0\b'), '"d":'),
+    bytes: (re.compile(rb'"t":\s*"([A-Z_]+)"'), re.compile(rb'"s":\s*(\d+)'), re.compile(rb'"op":\s*0\b'),
+            b'"d":'),
+}
+
+if msgspec is not None:
+    class _Envelope(msgspec.Struct):
+        op: int
+        t: Optional[str] = None
+        s: Optional[int] = None
+
+    _envelope_decoder = msgspec.json.Decoder(_Envelope)
+else:
+    _envelope_decoder = None
+
+
+def peek_dispatch(data: Union[str, bytes]) -> Optional[Tuple[str, int]]:
+    """Read the event name and sequence of a dispatch frame without decoding it.
+
+    Returns None when the frame isn't a dispatch or its envelope can't be read
+    cheaply, in which case the caller should decode it fully.
+    """
+    kind = bytes if isinstance(data, (bytes, bytearray)) else str
+    event_pattern, sequence_pattern, op_pattern, data_marker = _PEEK_PATTERNS[kind]
+
+    head = data[:_HEAD_SIZE]
+    end = head.find(data_marker)
+    if end != -1:
+        head = head[:end]
+
+        event = event_pattern.search(head)
+        sequence = sequence_pattern.search(head)
+        if event and sequence and op_pattern.search(head):
+            name = event.group(1)
+            return (name.decode() if kind is bytes else name), int(sequence.group(1))
+
+    if _envelope_decoder is not None:
+        try:
+            envelope = _envelope_decoder.decode(data)
+        except msgspec.DecodeError:
+            return None
+        if envelope.op == 0 and envelope.t is not None and envelope.s is not None:
+            return envelope.t, envelope.s
+
+    return None
+
+
+BACKENDS: Dict[str, Any] = {'json': (_json_loads, _json_dumps)}
+
+if orjson is not None:
+    BACKENDS['orjson'] = (orjson.loads, _orjson_dumps)
+
+if msgspec is not None:
+    BACKENDS['msgspec'] = (msgspec.json.decode, _msgspec_dumps)
+
+backend: str = 'json'
+loads: Callable[[Union[str, bytes]], Any] = _json_loads
+dumps: Callable[[Any], str] = _json_dumps
+
+
+def use(name: str) -> None:
+    """Select the JSON backend used for gateway and REST payloads"""
+    global backend, loads, dumps
+
+    if name not in BACKENDS:
+        raise ValueError(f"JSON backend '{name}' is not available (installed: {', '.join(BACKENDS)})")
+
+    backend = name
+    loads, dumps = BACKENDS[name]
+
+
+# Prefer the fastest installed backend, falling back to the standard library
+for _name in ('orjson', 'msgspec', 'json'):
+    if _name in BACKENDS:
+        use(_name)
+        break
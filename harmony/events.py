@@ -1,4 +1,55 @@
-from typing import Dict, List, Callable, Awaitable, Any
+import asyncio
+import functools
+import logging
+import time
+from collections import deque
+from typing import Dict, List, Callable, Awaitable, Any, Optional, Set, Tuple, Deque
+
+from .metrics import Histogram, LoopMonitor
+
+logger = logging.getLogger('harmony')
+
+
+def _key_value(obj: Any, field: str) -> Optional[str]:
+    """Read an index key such as channel_id, user_id or custom_id from an event argument"""
+    if isinstance(obj, dict):
+        value = obj.get(field)
+    else:
+        value = getattr(obj, field, None)
+
+    if value is None and field == 'user_id':
+        if isinstance(obj, dict):
+            user = obj.get('author') or obj.get('user')
+        else:
+            user = getattr(obj, 'author', None) or getattr(obj, 'user', None)
+        value = user.get('id') if isinstance(user, dict) else getattr(user, 'id', None)
+
+    if value is None and field == 'custom_id':
+        data = obj.get('data') if isinstance(obj, dict) else getattr(obj, 'data', None)
+        if isinstance(data, dict):
+            value = data.get('custom_id')
+
+    return None if value is None else str(value)
+
+
+def _guild_key(args: Tuple[Any, ...]) -> Optional[str]:
+    """Find the guild an event belongs to from its first argument"""
+    if not args:
+        return None
+
+    first = args[0]
+    if isinstance(first, dict):
+        guild_id = first.get('guild_id')
+    else:
+        from .models import Guild
+        if isinstance(first, Guild):
+            guild_id = first.id
+        else:
+            guild_id = getattr(first, 'guild_id', None)
+
+    # Models store snowflakes as ints and raw payloads as strings
+    return None if guild_id is None else str(guild_id)
+
 
 class Event:
     def __init__(self, name: str):
@@ -9,23 +60,342 @@ class Event:
         self.listeners.append(callback)
 
     async def dispatch(self, *args, **kwargs):
-        for listener in self.listeners:
+        for listener in list(self.listeners):
             await listener(*args, **kwargs)
 
 
+class CoalescedListener:
+    """Batches events per key over a short window and calls the listener once with a list.
+
+    Each item is the event's argument, or a tuple of its arguments for events
+    that have several. A batch is delivered `window` seconds after its first
+    event, or as soon as it holds `max_size` events.
+    """
+
+    def __init__(self, dispatcher: 'EventDispatcher', event_name: str, callback: Callable[..., Awaitable[Any]],
+                 window: float = 0.5, key: Optional[str] = 'guild_id', max_size: int = 1000):
+        self.dispatcher = dispatcher
+        self.event_name = event_name
+        self.callback = callback
+        self.window = window
+        self.key = key
+        self.max_size = max_size
+        self.__qualname__ = getattr(callback, '__qualname__', repr(callback))
+
+        self._buffers: Dict[Optional[str], list] = {}
+        self._timers: Dict[Optional[str], asyncio.TimerHandle] = {}
+
+    def add(self, args: Tuple[Any, ...]) -> None:
+        key = _key_value(args[0], self.key) if self.key and args else None
+        buffer = self._buffers.setdefault(key, [])
+        buffer.append(args[0] if len(args) == 1 else args)
+
+        if len(buffer) >= self.max_size:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = asyncio.get_running_loop().call_later(self.window, self._flush, key)
+
+    def flush(self) -> None:
+        """Deliver every pending batch now"""
+        for key in list(self._buffers):
+            self._flush(key)
+
+    def _flush(self, key: Optional[str]) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+
+        items = self._buffers.pop(key, None)
+        if items:
+            self.dispatcher._submit(self.event_name, functools.partial(
+                self.dispatcher._run, self.event_name, self.callback, (items,), {}))
+
+
 class EventDispatcher:
-    def __init__(self):
+    """Runs event listeners as tasks on a bounded pool.
+
+    At most `max_concurrency` listener tasks run at once (None for no limit).
+    Once the pool is full, work waits in a backlog of at most `max_backlog`
+    entries and starts as slots free up; `dispatch` itself never waits, so
+    a busy pool can't stall the gateway reader and its heartbeat ACKs. Work
+    that arrives with the backlog full is dropped, logged and counted in
+    `dropped`. Exceptions are logged per listener. With `ordered=True`,
+    events for the same guild run one after another while different guilds
+    still run in parallel: each busy guild gets one worker task, holding one
+    pool slot, that drains its queue.
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = 100, ordered: bool = False,
+                 slow_threshold: Optional[float] = 0.25, max_backlog: int = 10000):
         self.events: Dict[str, Event] = {}
+        # Bumped whenever listeners change, so callers can cache derived state
+        self.version = 0
+        self.max_concurrency = max_concurrency
+        self.ordered = ordered
+
+        self.max_backlog = max_backlog
+        self.dropped = 0
+        self._tasks: Set[asyncio.Task] = set()
+        self._backlog: Deque[Callable[[], Awaitable[Any]]] = deque()
+        self._queues: Dict[str, deque] = {}
+
+        # wait_for futures: unkeyed ones per event, keyed ones indexed by (field, value)
+        self._waiters: Dict[str, List[Tuple[asyncio.Future, Optional[Callable[..., bool]]]]] = {}
+        self._keyed_waiters: Dict[str, Dict[str, Dict[str, list]]] = {}
+
+        # Instrumentation; a LoopMonitor warns when the loop is blocked for longer
+        # than `slow_threshold`, naming the listeners that ran in the meantime
+        self.slow_threshold = slow_threshold
+        self.event_counts: Dict[str, int] = {}
+        self.listener_latency: Dict[Tuple[str, str], Histogram] = {}
+        self.monitor: Optional[LoopMonitor] = LoopMonitor(self, threshold=slow_threshold) if slow_threshold else None
+        self._running: Dict[asyncio.Task, str] = {}
+        self._recent: Set[str] = set()
 
     def add_listener(self, event_name: str, callback: Callable[..., Awaitable[Any]]):
         if event_name not in self.events:
             self.events[event_name] = Event(event_name)
 
         self.events[event_name].add_listener(callback)
+        self.version += 1
+
+    def add_coalesced_listener(self, event_name: str, callback: Callable[..., Awaitable[Any]],
+                               window: float = 0.5, key: Optional[str] = 'guild_id',
+                               max_size: int = 1000) -> CoalescedListener:
+        """Register a listener that receives events in batches grouped by `key`"""
+        listener = CoalescedListener(self, event_name, callback, window=window, key=key, max_size=max_size)
+        self.add_listener(event_name, listener)
+        return listener
+
+    def remove_listener(self, event_name: str, callback: Callable[..., Awaitable[Any]]):
+        event = self.events.get(event_name)
+        if event is not None and callback in event.listeners:
+            event.listeners.remove(callback)
+            self.version += 1
+
+    def has_listeners(self, *event_names: str) -> bool:
+        for event_name in event_names:
+            event = self.events.get(event_name)
+            if event is not None and event.listeners:
+                return True
+            if event_name in self._waiters or event_name in self._keyed_waiters:
+                return True
+        return False
+
+    async def wait_for(self, event_name: str, check: Optional[Callable[..., bool]] = None,
+                       timeout: Optional[float] = None, **keys: Any) -> Any:
+        """Wait for the next `event_name` event that passes `check`.
+
+        Keyword arguments such as `channel_id=...`, `user_id=...` or
+        `custom_id=...` index the waiter, so an event only runs the checks of
+        waiters registered for its key instead of every waiter's check.
+        Returns the event's argument, or a tuple when it has several.
+        """
+        future = asyncio.get_running_loop().create_future()
+
+        if keys:
+            (field, value), *rest = keys.items()
+            if rest:
+                extra = {name: str(expected) for name, expected in rest}
+                user_check = check
+
+                def check(*args, **kwargs):
+                    if any(_key_value(args[0], name) != expected for name, expected in extra.items()):
+                        return False
+                    return user_check is None or user_check(*args, **kwargs)
+
+            bucket = self._keyed_waiters.setdefault(event_name, {}).setdefault(field, {}).setdefault(str(value), [])
+        else:
+            bucket = self._waiters.setdefault(event_name, [])
+
+        entry = (future, check)
+        bucket.append(entry)
+        self.version += 1
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            if entry in bucket:
+                bucket.remove(entry)
+            self._prune_waiters(event_name)
+
+    def _prune_waiters(self, event_name: str) -> None:
+        if not self._waiters.get(event_name, True):
+            del self._waiters[event_name]
+
+        fields = self._keyed_waiters.get(event_name)
+        if fields is not None:
+            for field in list(fields):
+                values = fields[field]
+                for value in [value for value, bucket in values.items() if not bucket]:
+                    del values[value]
+                if not values:
+                    del fields[field]
+            if not fields:
+                del self._keyed_waiters[event_name]
+
+        self.version += 1
+
+    def _resolve_waiters(self, event_name: str, args, kwargs) -> None:
+        candidates = []
+
+        for field, values in self._keyed_waiters.get(event_name, {}).items():
+            value = _key_value(args[0], field) if args else None
+            if value is not None:
+                candidates.extend(values.get(value, ()))
+
+        candidates.extend(self._waiters.get(event_name, ()))
+
+        for future, check in candidates:
+            if future.done():
+                continue
+            try:
+                if check is not None and not check(*args, **kwargs):
+                    continue
+            except Exception as e:
+                future.set_exception(e)
+                continue
+
+            if not args:
+                future.set_result(None)
+            elif len(args) == 1:
+                future.set_result(args[0])
+            else:
+                future.set_result(args)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    @property
+    def backlog(self) -> int:
+        return len(self._backlog)
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-event counts, per-listener latency summaries and in-flight tasks"""
+        return {
+            'events': dict(self.event_counts),
+            'listeners': {f"{event_name}:{listener}": histogram.summary()
+                          for (event_name, listener), histogram in self.listener_latency.items()},
+            'in_flight': self.in_flight,
+            'backlog': self.backlog,
+            'dropped': self.dropped,
+            'loop_blocked': self.monitor.blocked if self.monitor else None
+        }
 
     async def dispatch(self, event_name: str, *args, **kwargs):
-        if event_name in self.events:
-            await self.events[event_name].dispatch(*args, **kwargs)
+        self.event_counts[event_name] = self.event_counts.get(event_name, 0) + 1
+        if self.monitor is not None:
+            self.monitor.start()
+
+        if event_name in self._waiters or event_name in self._keyed_waiters:
+            self._resolve_waiters(event_name, args, kwargs)
+
+        event = self.events.get(event_name)
+        if event is None or not event.listeners:
+            return
+
+        listeners = []
+        for listener in event.listeners:
+            if isinstance(listener, CoalescedListener):
+                listener.add(args)
+            else:
+                listeners.append(listener)
+
+        if not listeners:
+            return
+
+        if self.ordered:
+            key = _guild_key(args)
+            if key is not None:
+                queue = self._queues.get(key)
+                if queue is not None:
+                    # The guild's worker is running or waiting in the backlog and will get to it
+                    if len(queue) >= self.max_backlog:
+                        self._drop(event_name)
+                    else:
+                        queue.append((event_name, listeners, args, kwargs))
+                    return
+
+                self._queues[key] = deque([(event_name, listeners, args, kwargs)])
+                if not self._submit(event_name, functools.partial(self._drain, key)):
+                    del self._queues[key]
+                return
+
+        for listener in listeners:
+            self._submit(event_name, functools.partial(self._run, event_name, listener, args, kwargs))
 
     async def emit(self, event_name: str, *args, **kwargs):
-        await self.dispatch(event_name, *args, **kwargs)
\ No newline at end of file
+        await self.dispatch(event_name, *args, **kwargs)
+
+    async def join(self) -> None:
+        """Wait for every in-flight listener to finish"""
+        while self._tasks:
+            await asyncio.wait(list(self._tasks))
+
+    def _submit(self, event_name: str, work: Callable[[], Awaitable[Any]]) -> bool:
+        """Start `work` on a free slot, or backlog it; returns False if it was dropped"""
+        if not self.max_concurrency or len(self._tasks) < self.max_concurrency:
+            self._spawn(work())
+        elif len(self._backlog) < self.max_backlog:
+            self._backlog.append(work)
+        else:
+            self._drop(event_name)
+            return False
+        return True
+
+    def _drop(self, event_name: str) -> None:
+        self.dropped += 1
+        # The first drop and every 1000th after it, so an overflow doesn't flood the log too
+        if self.dropped % 1000 == 1:
+            logger.warning(f"Listener backlog is full; dropping '{event_name}' "
+                           f"({self.dropped} dropped so far)")
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        # The finished task's slot goes straight to the oldest backlogged work
+        if self._backlog:
+            self._spawn(self._backlog.popleft()())
+
+    async def _run(self, event_name: str, listener: Callable[..., Awaitable[Any]], args, kwargs) -> None:
+        name = getattr(listener, '__qualname__', repr(listener))
+        task = asyncio.current_task()
+        self._running[task] = f"{event_name}:{name}"
+        if self.monitor is not None:
+            self._recent.add(self._running[task])
+        start = time.perf_counter()
+
+        try:
+            await listener(*args, **kwargs)
+        except Exception:
+            logger.exception(f"Error in '{event_name}' listener {name}")
+        finally:
+            elapsed = time.perf_counter() - start
+            self._running.pop(task, None)
+
+            histogram = self.listener_latency.get((event_name, name))
+            if histogram is None:
+                histogram = self.listener_latency[(event_name, name)] = Histogram(window=256)
+            histogram.observe(elapsed)
+
+            # Wall time includes awaiting REST calls and wait_for, so this isn't a
+            # sign of blocking; the LoopMonitor reports that
+            if self.slow_threshold and elapsed > self.slow_threshold:
+                logger.debug(f"'{event_name}' listener {name} took {elapsed:.3f}s")
+
+    async def _drain(self, key: str) -> None:
+        """Run one guild's queued events in order, then retire the worker"""
+        queue = self._queues[key]
+        try:
+            while queue:
+                event_name, listeners, args, kwargs = queue.popleft()
+                for listener in listeners:
+                    await self._run(event_name, listener, args, kwargs)
+        finally:
+            del self._queues[key]
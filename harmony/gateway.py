@@ -0,0 +1,539 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+import zlib
+from typing import Optional, Dict, Any, List, Tuple
+
+import aiohttp
+
+from . import codec
+from .metrics import Histogram
+
+logger = logging.getLogger('harmony')
+
+GATEWAY_URL = "wss://gateway.discord.gg/"
+ZLIB_SUFFIX = b'\x00\x00\xff\xff'
+
+# Close codes after which reconnecting can never succeed
+FATAL_CLOSE_CODES = {4004, 4010, 4011, 4012, 4013, 4014}
+
+# Close codes that invalidate the session, so the next connection must IDENTIFY
+SESSION_CLOSE_CODES = {4007, 4009}
+
+# Outbound send priorities, lowest value is sent first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+OP_PRIORITIES = {
+    1: PRIORITY_HIGH,  # Heartbeat
+    2: PRIORITY_HIGH,  # Identify
+    3: PRIORITY_LOW,   # Presence Update
+    6: PRIORITY_HIGH,  # Resume
+    8: PRIORITY_LOW,   # Request Guild Members
+}
+
+
+class ConnectionClosed(Exception):
+    def __init__(self, code: Optional[int], reason: str = ''):
+        self.code = code
+        message = f"Gateway connection closed with code {code}"
+        if reason:
+            message += f": {reason}"
+        super().__init__(message)
+
+
+class ZlibInflator:
+    """Incremental decoder for the gateway's zlib-stream transport compression.
+
+    Discord compresses the whole connection as a single zlib stream, so one
+    decompressor has to live for as long as the websocket does. A message is
+    complete once a frame ends with the Z_SYNC_FLUSH suffix.
+    """
+
+    def __init__(self):
+        self._inflator = zlib.decompressobj()
+        self._buffer = bytearray()
+        self.bytes_received = 0
+        self.bytes_decompressed = 0
+
+    def feed(self, data: bytes) -> Optional[bytes]:
+        """Feed a binary frame, returning the decoded message once it is complete"""
+        self.bytes_received += len(data)
+
+        if not self._buffer and data.endswith(ZLIB_SUFFIX):
+            # Common case: the whole message arrived in a single frame
+            decoded = self._inflator.decompress(data)
+        else:
+            self._buffer.extend(data)
+            if not self._buffer.endswith(ZLIB_SUFFIX):
+                return None
+
+            decoded = self._inflator.decompress(self._buffer)
+            self._buffer = bytearray()
+
+        self.bytes_decompressed += len(decoded)
+        return decoded
+
+    def reset(self) -> None:
+        """Start a new stream, e.g. after reconnecting"""
+        self._inflator = zlib.decompressobj()
+        self._buffer = bytearray()
+
+    @property
+    def ratio(self) -> float:
+        """Decompressed bytes per byte received on the wire"""
+        if not self.bytes_received:
+            return 0.0
+        return self.bytes_decompressed / self.bytes_received
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'bytes_received': self.bytes_received,
+            'bytes_decompressed': self.bytes_decompressed,
+            'ratio': self.ratio
+        }
+
+
+class ExponentialBackoff:
+    """Exponential backoff with full jitter, so reconnecting shards don't stampede"""
+
+    def __init__(self, base: float = 1.0, maximum: float = 60.0):
+        self.base = base
+        self.maximum = maximum
+        self._attempts = 0
+
+    def delay(self) -> float:
+        ceiling = min(self.maximum, self.base * 2 ** min(self._attempts, 16))
+        self._attempts += 1
+        return random.uniform(0, ceiling)
+
+    def reset(self) -> None:
+        self._attempts = 0
+
+
+class IdentifyLimiter:
+    """Spaces out IDENTIFYs, allowing one per `max_concurrency` bucket every 5 seconds.
+
+    `wait` hands a shard its bucket, which stays taken until `release`. The
+    spacing runs from the release of a slot whose IDENTIFY was sent, not from
+    the grant, so connect and HELLO latency can't bring two IDENTIFYs closer.
+    """
+
+    def __init__(self, max_concurrency: int = 1, interval: float = 5.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.interval = interval
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._last: Dict[int, float] = {}
+
+    async def wait(self, shard_id: int) -> None:
+        bucket = shard_id % self.max_concurrency
+        lock = self._locks.setdefault(bucket, asyncio.Lock())
+
+        await lock.acquire()
+        try:
+            remaining = self._last.get(bucket, 0.0) + self.interval - asyncio.get_running_loop().time()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+        except BaseException:
+            lock.release()
+            raise
+
+    def release(self, shard_id: int, sent: bool = True) -> None:
+        """Give a bucket back; if its IDENTIFY was `sent`, the next one waits `interval` from now"""
+        bucket = shard_id % self.max_concurrency
+        if sent:
+            self._last[bucket] = asyncio.get_running_loop().time()
+        lock = self._locks.get(bucket)
+        if lock is not None and lock.locked():
+            lock.release()
+
+
+class GatewayRateLimiter:
+    """Token bucket for outbound gateway sends with a priority queue.
+
+    Discord closes a connection that sends more than 120 payloads in 60
+    seconds. The bucket holds half the limit and refills at half the limit per
+    period, so no window can go over it. A few tokens are reserved for
+    high-priority sends (heartbeats, IDENTIFY and RESUME) so a queue of
+    presence updates can never delay a heartbeat.
+    """
+
+    def __init__(self, limit: int = 120, per: float = 60.0, reserved: int = 3):
+        self.capacity = limit / 2
+        self.rate = self.capacity / per
+        self.reserved = reserved
+        self._tokens = self.capacity
+        self._last_refill: Optional[float] = None
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._drain_task: Optional[asyncio.Task] = None
+
+        self.sent = 0
+        self.queued = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _refill(self) -> None:
+        now = asyncio.get_running_loop().time()
+        if self._last_refill is not None:
+            self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def _available(self, priority: int) -> float:
+        if priority == PRIORITY_HIGH:
+            return self._tokens
+        return self._tokens - self.reserved
+
+    async def acquire(self, priority: int = PRIORITY_NORMAL) -> None:
+        """Wait for a send slot, serving waiters by priority then arrival"""
+        self._refill()
+
+        if (not self._waiters or self._waiters[0][0] > priority) and self._available(priority) >= 1:
+            self._tokens -= 1
+            self.sent += 1
+            return
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        self.queued += 1
+
+        if not self._drain_task or self._drain_task.done():
+            self._drain_task = asyncio.create_task(self._drain())
+
+        start = loop.time()
+        try:
+            await future
+        finally:
+            waited = loop.time() - start
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    async def _drain(self) -> None:
+        while self._waiters:
+            priority, _, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+
+            self._refill()
+            missing = 1 - self._available(priority)
+            if missing > 0:
+                await asyncio.sleep(missing / self.rate)
+                continue
+
+            heapq.heappop(self._waiters)
+            self._tokens -= 1
+            self.sent += 1
+            future.set_result(None)
+
+    def reset(self, exc: Optional[BaseException] = None) -> None:
+        """Refill the bucket for a new connection, failing any queued sends with `exc`"""
+        for _, _, future in self._waiters:
+            if not future.done():
+                future.set_exception(exc or ConnectionClosed(None, "connection reset"))
+        self._waiters.clear()
+        if self._drain_task:
+            self._drain_task.cancel()
+            self._drain_task = None
+        self._tokens = self.capacity
+        self._last_refill = None
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'sent': self.sent,
+            'queued': self.queued,
+            'queue_depth': self.queue_depth,
+            'tokens': self._tokens,
+            'total_wait': self.total_wait,
+            'max_wait': self.max_wait,
+            'mean_wait': self.total_wait / self.queued if self.queued else 0.0
+        }
+
+
+class GatewayConnection:
+    """A gateway websocket with heartbeating, RESUME and automatic reconnects"""
+
+    def __init__(self, client, url: str = GATEWAY_URL, compress: bool = False,
+                 shard_id: int = 0, shard_count: Optional[int] = None,
+                 identify_limiter: Optional[IdentifyLimiter] = None):
+        self.client = client
+        self.url = url
+        self.shard_id = shard_id
+        self.shard_count = shard_count
+        self.ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self.sequence: Optional[int] = None
+        self.session_id: Optional[str] = None
+        self.resume_gateway_url: Optional[str] = None
+        self.heartbeat_interval: Optional[float] = None
+
+        self._inflator: Optional[ZlibInflator] = ZlibInflator() if compress else None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._ack_pending = False
+        self._last_heartbeat: Optional[float] = None
+        self.latency: Optional[float] = None
+        self.latency_histogram = Histogram(window=256)
+        self._backoff = ExponentialBackoff()
+        self._identify_limiter = identify_limiter
+        self._identify_slot = False
+        self.ratelimiter = GatewayRateLimiter()
+        self.events_skipped = 0
+        self._closed = False
+
+    @property
+    def can_resume(self) -> bool:
+        return self.session_id is not None and self.sequence is not None
+
+    def _build_url(self, base: str) -> str:
+        url = f"{base.rstrip('/')}/?v=10&encoding=json"
+        if self._inflator:
+            url += "&compress=zlib-stream"
+        return url
+
+    async def run(self, reconnect: bool = True) -> None:
+        """Keep a connection open until closed, resuming the session where possible"""
+        while not self._closed:
+            url = self.url
+            if self.can_resume and self.resume_gateway_url:
+                url = self.resume_gateway_url
+
+            code = None
+            try:
+                if not self.can_resume and self._identify_limiter:
+                    # Take the IDENTIFY slot before connecting, so the reader never
+                    # stops reading (and missing heartbeat ACKs) while queued for it.
+                    # `identify` gives it back once the payload is sent.
+                    await self._identify_limiter.wait(self.shard_id)
+                    self._identify_slot = True
+
+                async with self.client.session.ws_connect(self._build_url(url), max_msg_size=0) as ws:
+                    self.ws = ws
+                    if self._inflator:
+                        self._inflator.reset()
+                    await self._gateway_handler()
+                code = ws.close_code
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Shard {self.shard_id} connection error: {e!r}")
+            except ConnectionClosed as e:
+                # A send raced with the socket closing; reconnect like any other drop
+                code = self.ws.close_code if self.ws is not None else None
+                logger.warning(f"Shard {self.shard_id} connection lost while sending: {e}")
+            finally:
+                self._release_identify_slot(sent=False)
+                self._stop_heartbeat()
+                self.ratelimiter.reset(ConnectionClosed(code, "connection lost before the payload was sent"))
+                self.ws = None
+
+            if self._closed:
+                return
+
+            if code in FATAL_CLOSE_CODES:
+                raise ConnectionClosed(code, "not reconnecting")
+
+            if code in SESSION_CLOSE_CODES:
+                self._invalidate_session()
+
+            if not reconnect:
+                return
+
+            delay = self._backoff.delay()
+            logger.info(f"Shard {self.shard_id} disconnected (code {code}), reconnecting in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def _gateway_handler(self) -> None:
+        """Read frames until the websocket closes"""
+        async for msg in self.ws:
+            if msg.type == aiohttp.WSMsgType.TEXT:
+                raw = msg.data
+            elif msg.type == aiohttp.WSMsgType.BINARY and self._inflator:
+                raw = self._inflator.feed(msg.data)
+                if raw is None:
+                    continue
+            else:
+                continue
+
+            allowed = self.client._allowed_events()
+            if allowed is not None:
+                envelope = codec.peek_dispatch(raw)
+                if envelope is not None and envelope[0] not in allowed:
+                    # Nobody consumes this event; keep the sequence and skip decoding
+                    self.sequence = envelope[1]
+                    self.events_skipped += 1
+                    continue
+
+            await self._received(codec.loads(raw))
+
+    async def _received(self, data: Dict[str, Any]) -> None:
+        op = data['op']
+
+        if op == 0:  # Dispatch
+            self.sequence = data['s']
+            event_name = data['t']
+            event_data = data['d']
+
+            if event_name == 'READY':
+                self.session_id = event_data['session_id']
+                self.resume_gateway_url = event_data.get('resume_gateway_url')
+                self._backoff.reset()
+            elif event_name == 'RESUMED':
+                logger.info(f"Shard {self.shard_id} resumed session {self.session_id}")
+                self._backoff.reset()
+
+            await self.client._handle_dispatch(event_name, event_data, self.shard_id)
+
+        elif op == 1:  # Heartbeat request
+            await self.send_heartbeat()
+
+        elif op == 7:  # Reconnect
+            logger.info(f"Shard {self.shard_id}: gateway requested a reconnect")
+            await self.ws.close(code=4000)
+
+        elif op == 9:  # Invalid Session
+            if not data.get('d'):
+                self._invalidate_session()
+            await asyncio.sleep(random.uniform(1, 5))
+            await self.ws.close(code=4000)
+
+        elif op == 10:  # Hello
+            self.heartbeat_interval = data['d']['heartbeat_interval'] / 1000
+            self._start_heartbeat()
+
+            if self.can_resume:
+                await self.resume()
+            else:
+                await self.identify()
+
+        elif op == 11:  # Heartbeat ACK
+            self._ack_pending = False
+            if self._last_heartbeat is not None:
+                self.latency = time.perf_counter() - self._last_heartbeat
+                self.latency_histogram.observe(self.latency)
+                self._last_heartbeat = None
+
+    async def send(self, payload: Dict[str, Any], priority: Optional[int] = None) -> None:
+        """Send a payload through the rate limiter, prioritised by opcode unless given"""
+        if priority is None:
+            priority = OP_PRIORITIES.get(payload['op'], PRIORITY_NORMAL)
+
+        await self.ratelimiter.acquire(priority)
+
+        if self.ws is None or self.ws.closed:
+            raise ConnectionClosed(None, "not connected")
+
+        await self.ws.send_json(payload, dumps=codec.dumps)
+
+    async def change_presence(self, status: str = 'online', activities: Optional[List[Dict[str, Any]]] = None,
+                              afk: bool = False, since: Optional[int] = None) -> None:
+        await self.send({
+            'op': 3,
+            'd': {
+                'since': since,
+                'activities': activities or [],
+                'status': status,
+                'afk': afk
+            }
+        })
+
+    async def request_guild_members(self, guild_id: int, nonce: str, query: str = '', limit: int = 0,
+                                    presences: bool = False, user_ids: Optional[List[int]] = None) -> None:
+        """Ask for a guild's members; they arrive as GUILD_MEMBERS_CHUNK events tagged with `nonce`"""
+        payload = {'guild_id': str(guild_id), 'limit': limit, 'presences': presences, 'nonce': nonce}
+        if user_ids is not None:
+            payload['user_ids'] = [str(user_id) for user_id in user_ids]
+        else:
+            payload['query'] = query
+
+        await self.send({'op': 8, 'd': payload})
+
+    def _release_identify_slot(self, sent: bool) -> None:
+        if self._identify_slot:
+            self._identify_slot = False
+            self._identify_limiter.release(self.shard_id, sent=sent)
+
+    async def identify(self) -> None:
+        """Send identify payload to Discord; `run` has already taken an identify limiter slot"""
+        payload = {
+            'op': 2,
+            'd': {
+                'token': self.client.token,
+                'intents': self.client.intents,
+                'properties': {
+                    '$os': 'linux',
+                    '$browser': 'harmony',
+                    '$device': 'harmony'
+                }
+            }
+        }
+
+        if self.shard_count is not None:
+            payload['d']['shard'] = [self.shard_id, self.shard_count]
+
+        try:
+            await self.send(payload)
+        finally:
+            # Counted as sent even if the send failed part way; it may have reached Discord
+            self._release_identify_slot(sent=True)
+
+    async def resume(self) -> None:
+        """Resume the previous session, replaying events missed since `sequence`"""
+        logger.info(f"Shard {self.shard_id} resuming session {self.session_id} at sequence {self.sequence}")
+        await self.send({
+            'op': 6,
+            'd': {
+                'token': self.client.token,
+                'session_id': self.session_id,
+                'seq': self.sequence
+            }
+        })
+
+    async def send_heartbeat(self) -> None:
+        self._ack_pending = True
+        self._last_heartbeat = time.perf_counter()
+        await self.send({
+            'op': 1,
+            'd': self.sequence
+        })
+
+    async def _heartbeat(self) -> None:
+        """Send regular heartbeats, closing the connection if an ACK never arrived"""
+        # Jitter the first beat so shards that connected together don't beat in lockstep
+        await asyncio.sleep(self.heartbeat_interval * random.random())
+
+        while True:
+            if self._ack_pending:
+                logger.warning(f"Shard {self.shard_id}: no heartbeat ACK received, closing zombie connection")
+                await self.ws.close(code=4000)
+                return
+
+            await self.send_heartbeat()
+            await asyncio.sleep(self.heartbeat_interval)
+
+    def _start_heartbeat(self) -> None:
+        self._stop_heartbeat()
+        self._ack_pending = False
+        self._last_heartbeat = None
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    def _stop_heartbeat(self) -> None:
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+
+    def _invalidate_session(self) -> None:
+        self.session_id = None
+        self.sequence = None
+        self.resume_gateway_url = None
+
+    async def close(self, code: int = 1000) -> None:
+        self._closed = True
+        self._stop_heartbeat()
+        if self.ws:
+            await self.ws.close(code=code)
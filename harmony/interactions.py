@@ -117,10 +117,6 @@ class InteractionContext:
         if ephemeral:
             payload['flags'] = 64
 
-        if not hasattr(self.bot, 'rest'):
-            from harmony.rest import RESTClient
-            self.bot.rest = RESTClient(self.bot)
-
         try:
             await self.bot.rest.create_interaction_response(
                 self.interaction_id,
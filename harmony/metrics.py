@@ -0,0 +1,248 @@
+import asyncio
+import bisect
+import logging
+from collections import deque
+from typing import Optional, Dict, Any, List, Sequence
+
+logger = logging.getLogger('harmony')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Latency histogram with rolling percentiles and cumulative buckets.
+
+    Percentiles are computed over the last `window` samples so they follow
+    current behaviour, while the bucket counts, `count` and `sum` cover the
+    whole lifetime of the histogram.
+    """
+
+    def __init__(self, window: int = 1000, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._samples = deque(maxlen=window)
+
+    def observe(self, value: float) -> None:
+        self._samples.append(value)
+        self.count += 1
+        self.sum += value
+
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.bucket_counts[index] += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Return the q-th percentile (0-100) of the rolling window"""
+        if not self._samples:
+            return None
+
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    @property
+    def p50(self) -> Optional[float]:
+        return self.percentile(50)
+
+    @property
+    def p99(self) -> Optional[float]:
+        return self.percentile(99)
+
+    @property
+    def last(self) -> Optional[float]:
+        return self._samples[-1] if self._samples else None
+
+    def summary(self) -> Dict[str, Any]:
+        ordered = sorted(self._samples)
+
+        def pick(q):
+            if not ordered:
+                return None
+            return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'p50': pick(50),
+            'p90': pick(90),
+            'p99': pick(99),
+            'max': ordered[-1] if ordered else None
+        }
+
+
+class LoopMonitor:
+    """Measures event loop lag and warns when something blocks the loop.
+
+    Sleeps for `interval` and records how late it wakes up. A wake-up later
+    than `threshold` means a callback held the loop, so the listeners that
+    ran since the previous wake-up are logged as suspects.
+    """
+
+    def __init__(self, dispatcher, interval: float = 0.1, threshold: float = 0.25):
+        self.dispatcher = dispatcher
+        self.interval = interval
+        self.threshold = threshold
+        self.lag = Histogram(window=256)
+        self.blocked = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self.lag.observe(lag)
+
+            suspects = self.dispatcher._recent | set(self.dispatcher._running.values())
+            self.dispatcher._recent.clear()
+
+            if lag > self.threshold:
+                self.blocked += 1
+                names = ', '.join(sorted(suspects)) or 'none'
+                logger.warning(f"Event loop blocked for {lag:.3f}s (listeners run since last check: {names})")
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _render_histogram(lines: List[str], name: str, labels: Dict[str, Any], histogram: Histogram) -> None:
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.bucket_counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{_labels(dict(labels, le=bound))} {cumulative}")
+    lines.append(f"{name}_bucket{_labels(dict(labels, le='+Inf'))} {histogram.count}")
+    lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+    lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+
+def render_prometheus(client) -> str:
+    """Render the client's dispatch and gateway metrics in Prometheus text format"""
+    events = client.events
+    lines: List[str] = []
+
+    lines.append("# HELP harmony_events_total Events dispatched, by event name")
+    lines.append("# TYPE harmony_events_total counter")
+    for event_name, count in sorted(events.event_counts.items()):
+        lines.append(f"harmony_events_total{_labels({'event': event_name})} {count}")
+
+    lines.append("# HELP harmony_listener_duration_seconds Listener run time, by event and listener")
+    lines.append("# TYPE harmony_listener_duration_seconds histogram")
+    for (event_name, listener), histogram in sorted(events.listener_latency.items()):
+        _render_histogram(lines, 'harmony_listener_duration_seconds',
+                          {'event': event_name, 'listener': listener}, histogram)
+
+    lines.append("# HELP harmony_listeners_in_flight Listener tasks currently running")
+    lines.append("# TYPE harmony_listeners_in_flight gauge")
+    lines.append(f"harmony_listeners_in_flight {events.in_flight}")
+    lines.append("# HELP harmony_listener_backlog Listener work waiting for a free slot")
+    lines.append("# TYPE harmony_listener_backlog gauge")
+    lines.append(f"harmony_listener_backlog {events.backlog}")
+    lines.append("# HELP harmony_listener_dropped_total Listener work dropped because the backlog was full")
+    lines.append("# TYPE harmony_listener_dropped_total counter")
+    lines.append(f"harmony_listener_dropped_total {events.dropped}")
+
+    if events.monitor is not None:
+        lines.append("# HELP harmony_loop_lag_seconds Event loop wake-up lag")
+        lines.append("# TYPE harmony_loop_lag_seconds histogram")
+        _render_histogram(lines, 'harmony_loop_lag_seconds', {}, events.monitor.lag)
+
+    lines.append("# HELP harmony_cache_entries Cached entries, by store")
+    lines.append("# TYPE harmony_cache_entries gauge")
+    for store, count in client.state.entry_counts().items():
+        lines.append(f"harmony_cache_entries{_labels({'store': store})} {count}")
+
+    message_cache = client.state.messages
+    lines.append("# HELP harmony_message_cache_lookups_total Message cache lookups, by result")
+    lines.append("# TYPE harmony_message_cache_lookups_total counter")
+    lines.append(f"harmony_message_cache_lookups_total{_labels({'result': 'hit'})} {message_cache.hits}")
+    lines.append(f"harmony_message_cache_lookups_total{_labels({'result': 'miss'})} {message_cache.misses}")
+    lines.append("# HELP harmony_message_cache_evictions_total Messages evicted from the cache")
+    lines.append("# TYPE harmony_message_cache_evictions_total counter")
+    lines.append(f"harmony_message_cache_evictions_total {message_cache.evictions}")
+
+    rest = client.rest
+    lines.append("# HELP harmony_rest_requests_total REST requests sent, including retries")
+    lines.append("# TYPE harmony_rest_requests_total counter")
+    lines.append(f"harmony_rest_requests_total {rest.requests}")
+    lines.append("# HELP harmony_rest_connections_total REST connections used, by whether they were reused")
+    lines.append("# TYPE harmony_rest_connections_total counter")
+    lines.append(f"harmony_rest_connections_total{_labels({'reused': 'false'})} {rest.connections_created}")
+    lines.append(f"harmony_rest_connections_total{_labels({'reused': 'true'})} {rest.connections_reused}")
+    lines.append("# HELP harmony_rest_retries_total REST request retries, by reason")
+    lines.append("# TYPE harmony_rest_retries_total counter")
+    for reason, count in sorted(rest.retries.items()):
+        lines.append(f"harmony_rest_retries_total{_labels({'reason': reason})} {count}")
+    lines.append("# HELP harmony_rest_retry_seconds_total Time requests spent between their first failure and their outcome")
+    lines.append("# TYPE harmony_rest_retry_seconds_total counter")
+    lines.append(f"harmony_rest_retry_seconds_total {rest.retry_seconds}")
+    lines.append("# HELP harmony_rest_failures_total REST requests that failed after exhausting retries")
+    lines.append("# TYPE harmony_rest_failures_total counter")
+    lines.append(f"harmony_rest_failures_total {rest.failures}")
+    lines.append("# HELP harmony_rest_coalesced_total GET calls served by an identical request already in flight")
+    lines.append("# TYPE harmony_rest_coalesced_total counter")
+    lines.append(f"harmony_rest_coalesced_total {rest.coalesced}")
+    lines.append("# HELP harmony_rest_request_duration_seconds Time to REST response headers")
+    lines.append("# TYPE harmony_rest_request_duration_seconds histogram")
+    _render_histogram(lines, 'harmony_rest_request_duration_seconds', {}, rest.latency)
+
+    connections = client._connections()
+    if connections:
+        lines.append("# HELP harmony_gateway_latency_seconds Last heartbeat round trip, by shard")
+        lines.append("# TYPE harmony_gateway_latency_seconds gauge")
+        for connection in connections:
+            if connection.latency is not None:
+                lines.append(f"harmony_gateway_latency_seconds{_labels({'shard': connection.shard_id})} {connection.latency}")
+
+        lines.append("# HELP harmony_gateway_send_queue_depth Outbound gateway sends waiting, by shard")
+        lines.append("# TYPE harmony_gateway_send_queue_depth gauge")
+        for connection in connections:
+            lines.append(f"harmony_gateway_send_queue_depth{_labels({'shard': connection.shard_id})} {connection.ratelimiter.queue_depth}")
+
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """Serves `render_prometheus` output on a local HTTP endpoint"""
+
+    def __init__(self, client, host: str = '127.0.0.1', port: int = 9100):
+        self.client = client
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def start(self) -> None:
+        from aiohttp import web
+
+        async def handle(request):
+            return web.Response(text=render_prometheus(self.client), content_type='text/plain', charset='utf-8')
+
+        app = web.Application()
+        app.router.add_get('/metrics', handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
@@ -1,86 +1,369 @@
+from typing import Callable, Dict, List, Optional, Any, Union
+
+
+def snowflake(value: Any) -> int:
+    """Convert a snowflake from its payload string to an int"""
+    return int(value)
+
+
+def snowflakes(values: List[Any]) -> List[int]:
+    return [int(value) for value in values]
+
+
+def _intern_user(client, data: Dict[str, Any]) -> 'User':
+    """Return the client's shared User for a payload, building one if there's no state"""
+    state = getattr(client, 'state', None)
+    if state is None:
+        return User(client, data)
+    return state.store_user(data)
+
+
+def _intern_users(client, users: List[Dict[str, Any]]) -> List['User']:
+    return [_intern_user(client, data) for data in users]
 
-from dataclasses import dataclass
-from typing import Dict, List, Optional, Any
 
 class Model:
+    """Base class for Discord objects.
+
+    Subclasses list their attributes in `__slots__` and the payload fields to
+    read in `_fields`, mapped to an optional converter. Any other payload
+    field is ignored. Attributes missing from a payload take their value from
+    `_defaults` (a callable default is called, so containers aren't shared
+    between instances) or None. Nested models are listed in `_nested`, mapped
+    to a builder called with the client and the field's payload.
+    """
+    __slots__ = ('_client',)
+
+    _fields: Dict[str, Optional[Callable[[Any], Any]]] = {}
+    _nested: Dict[str, Callable[[Any, Any], Any]] = {}
+    _defaults: Dict[str, Any] = {}
+    _attributes: tuple = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._attributes = tuple(
+            name for klass in reversed(cls.__mro__)
+            for name in klass.__dict__.get('__slots__', ())
+            if name not in ('_client', '__weakref__')
+        )
+
     def __init__(self, client, data: Dict[str, Any]):
         self._client = client
+        defaults = self._defaults
+        for name in self._attributes:
+            default = defaults.get(name)
+            setattr(self, name, default() if callable(default) else default)
         self._update(data)
-    
+
+    def _copy(self):
+        """Shallow copy, e.g. to keep the old state before applying an update in place"""
+        copy = type(self).__new__(type(self))
+        copy._client = self._client
+        for name in self._attributes:
+            setattr(copy, name, getattr(self, name))
+        return copy
+
+    def _to_dict(self) -> Dict[str, Any]:
+        """The parsed fields as a payload that `_update` can read back"""
+        return {key: getattr(self, key) for key in self._fields}
+
     def _update(self, data: Dict[str, Any]):
-        for key, value in data.items():
-            setattr(self, key, value)
+        for key, convert in self._fields.items():
+            if key in data:
+                value = data[key]
+                if convert is not None and value is not None:
+                    value = convert(value)
+                setattr(self, key, value)
+
+        for key, build in self._nested.items():
+            if key in data:
+                setattr(self, key, build(self._client, data[key]))
+
+
+class LazyModel:
+    """Mixin that keeps the raw payload and parses each attribute on first access.
+
+    Construction only stores the payload, so handlers that read two or three
+    fields never pay for the rest (nested users, embeds, mentions). Parsed
+    values are cached in the model's slots. The concrete class must add a
+    `_data` slot, e.g. `class LazyMessage(LazyModel, Message): __slots__ = ('_data',)`.
+    """
+    __slots__ = ()
+
+    def __init__(self, client, data: Dict[str, Any]):
+        self._client = client
+        self._data = data
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for slots that haven't been parsed yet
+        if name not in self._attributes or name == '_data':
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+        data = self._data
+        if name in data and name in self._fields:
+            value = data[name]
+            convert = self._fields[name]
+            if convert is not None and value is not None:
+                value = convert(value)
+        elif name in data and name in self._nested:
+            value = self._nested[name](self._client, data[name])
+        else:
+            default = self._defaults.get(name)
+            value = default() if callable(default) else default
+
+        setattr(self, name, value)
+        return value
+
+    def _parsed(self):
+        """(name, value) for the attributes parsed so far"""
+        for name in self._attributes:
+            try:
+                yield name, object.__getattribute__(self, name)
+            except AttributeError:
+                pass
+
+    def _copy(self):
+        copy = type(self).__new__(type(self))
+        copy._client = self._client
+        for name, value in self._parsed():
+            setattr(copy, name, value)
+        return copy
+
+    def _update(self, data: Dict[str, Any]):
+        # Merge into a new dict (the old payload may be shared with raw listeners)
+        # and forget parsed values the update replaces
+        self._data = {**self._data, **data}
+        for name in data:
+            if name != '_data' and name in self._attributes:
+                try:
+                    delattr(self, name)
+                except AttributeError:
+                    pass
 
 
 class User(Model):
-    id: str
+    __slots__ = ('id', 'username', 'discriminator', 'global_name', 'avatar', 'bot', '__weakref__')
+
+    _fields = {'id': snowflake, 'username': None, 'discriminator': None,
+               'global_name': None, 'avatar': None, 'bot': None}
+    _defaults = {'bot': False}
+
+    id: int
     username: str
     discriminator: str
+    global_name: Optional[str]
     avatar: Optional[str]
-    bot: bool = False
+    bot: bool
     
     async def send(self, content: str):
-        async with self._client.session.post(
-            'https://discord.com/api/v10/users/@me/channels',
-            headers={'Authorization': f'Bot {self._client.token}'},
-            json={'recipient_id': self.id}
-        ) as resp:
-            channel_data = await resp.json()
-            channel_id = channel_data['id']
-            
-        return await self._client.send_message(channel_id, content)
+        channel_data = await self._client.rest.create_dm(str(self.id))
+        return await self._client.send_message(channel_data['id'], content)
 
 
 class Guild(Model):
-    id: str
+    __slots__ = ('id', 'name', 'icon', 'owner_id', 'system_channel_id', 'member_count',
+                 'large', 'unavailable', 'channels', 'roles', 'members', 'threads', 'emojis',
+                 'presences', 'voice_states', 'shard_id', 'chunked')
+
+    _fields = {'id': snowflake, 'name': None, 'icon': None, 'owner_id': snowflake,
+               'system_channel_id': snowflake, 'member_count': None, 'large': None,
+               'unavailable': None}
+    _defaults = {'channels': dict, 'roles': dict, 'members': dict, 'threads': dict,
+                 'emojis': dict, 'presences': dict, 'voice_states': dict,
+                 'large': False, 'unavailable': False, 'chunked': False}
+
+    id: int
     name: str
     icon: Optional[str]
-    owner_id: str
-    channels: Dict[str, 'Channel'] = {}
-    members: Dict[str, 'Member'] = {}
+    owner_id: int
+    system_channel_id: Optional[int]
+    member_count: Optional[int]
+    large: bool
+    unavailable: bool
+    channels: Dict[int, 'Channel']
+    roles: Dict[int, 'Role']
+    members: Dict[int, 'Member']
+    threads: Dict[int, 'Channel']
+    emojis: Dict[int, 'Emoji']
+    presences: Dict[int, Dict[str, Any]]
+    voice_states: Dict[int, Dict[str, Any]]
+    shard_id: Optional[int]
+    chunked: bool
+
+    def _update(self, data: Dict[str, Any]):
+        super()._update(data)
+        client = self._client
+
+        # Channels, threads and members in GUILD_CREATE don't carry a guild_id
+        if 'channels' in data:
+            self.channels = {}
+            for channel_data in data['channels']:
+                self._add_channel(Channel(client, channel_data))
+        if 'threads' in data:
+            self.threads = {}
+            for thread_data in data['threads']:
+                self._add_thread(Channel(client, thread_data))
+        if 'roles' in data:
+            self.roles = {}
+            for role_data in data['roles']:
+                self._add_role(Role(client, role_data))
+        if 'members' in data:
+            self.members = {}
+            for member_data in data['members']:
+                self._add_member(Member(client, member_data))
+        if 'emojis' in data:
+            self.emojis = {}
+            for emoji_data in data['emojis']:
+                self._add_emoji(Emoji(client, emoji_data))
+        if 'presences' in data:
+            self.presences = {}
+            for presence in data['presences']:
+                self._set_presence(presence)
+        if 'voice_states' in data:
+            self.voice_states = {}
+            for voice_state in data['voice_states']:
+                self._set_voice_state(voice_state)
+
+    def _to_dict(self) -> Dict[str, Any]:
+        data = super()._to_dict()
+        data['channels'] = [channel._to_dict() for channel in self.channels.values()]
+        data['threads'] = [thread._to_dict() for thread in self.threads.values()]
+        data['roles'] = [role._to_dict() for role in self.roles.values()]
+        data['members'] = [member._to_dict() for member in self.members.values()]
+        data['emojis'] = [emoji._to_dict() for emoji in self.emojis.values()]
+        data['presences'] = [dict(presence, user={'id': user_id}) for user_id, presence in self.presences.items()]
+        data['voice_states'] = list(self.voice_states.values())
+        return data
+
+    def _add_channel(self, channel: 'Channel') -> None:
+        channel.guild_id = self.id
+        self.channels[channel.id] = channel
+
+    def _add_thread(self, thread: 'Channel') -> None:
+        thread.guild_id = self.id
+        self.threads[thread.id] = thread
+
+    def _add_role(self, role: 'Role') -> None:
+        self.roles[role.id] = role
+
+    def _add_member(self, member: 'Member') -> None:
+        member.guild_id = self.id
+        self.members[member.user.id] = member
+
+    def _add_emoji(self, emoji: 'Emoji') -> None:
+        self.emojis[emoji.id] = emoji
+
+    def _set_presence(self, data: Dict[str, Any]) -> None:
+        user_id = int(data['user']['id'])
+        if data.get('status') == 'offline':
+            self.presences.pop(user_id, None)
+        else:
+            self.presences[user_id] = {
+                'status': data.get('status'),
+                'activities': data.get('activities', []),
+                'client_status': data.get('client_status', {})
+            }
+
+    def _set_voice_state(self, data: Dict[str, Any]) -> None:
+        user_id = int(data['user_id'])
+        if data.get('channel_id') is None:
+            self.voice_states.pop(user_id, None)
+        else:
+            state = {key: value for key, value in data.items() if key not in ('member', 'guild_id')}
+            self.voice_states[user_id] = state
+
+    def get_channel(self, channel_id: Union[int, str]) -> Optional['Channel']:
+        return self.channels.get(int(channel_id))
+
+    def get_thread(self, thread_id: Union[int, str]) -> Optional['Channel']:
+        return self.threads.get(int(thread_id))
+
+    def get_role(self, role_id: Union[int, str]) -> Optional['Role']:
+        return self.roles.get(int(role_id))
+
+    def get_member(self, user_id: Union[int, str]) -> Optional['Member']:
+        """Look up a cached member; in lazy chunking mode a miss starts chunking the guild"""
+        member = self.members.get(int(user_id))
+        if member is None and not self.chunked:
+            chunker = getattr(self._client, 'chunker', None)
+            if chunker is not None:
+                chunker.on_member_miss(self)
+        return member
+
+    async def chunk(self, timeout: Optional[float] = None) -> 'Guild':
+        """Fetch every member of the guild over the gateway into `members`"""
+        return await self._client.chunker.chunk(self, timeout)
+
+    def get_emoji(self, emoji_id: Union[int, str]) -> Optional['Emoji']:
+        return self.emojis.get(int(emoji_id))
     
     async def reply(self, content: str = None, embed: Dict[str, Any] = None, components: List[Dict[str, Any]] = None):
-        payload = {}
-        
-        if content:
-            payload["content"] = content
-            
-        if embed:
-            payload["embeds"] = [embed]
-            
-        if components:
-            payload["components"] = [comp.to_dict() for comp in components]
-        
-        channel_id = self.channel_id
-        
-        async with self._client.session.post(
-            f'https://discord.com/api/v10/channels/{channel_id}/messages',
-            headers={'Authorization': f'Bot {self._client.token}'},
-            json=payload
-        ) as resp:
-            if resp.status != 200:
-                raise Exception(f"Failed to send message (Status: {resp.status})")
-            
-            data = await resp.json()
-            return Message(self._client, data)
+        data = await self._client.rest.create_message(
+            str(self.system_channel_id), content,
+            embeds=[embed] if embed else None,
+            components=[comp.to_dict() for comp in components] if components else None
+        )
+        return Message(self._client, data)
     
     async def create_channel(self, name: str, channel_type: int = 0):
-        async with self._client.session.post(
-            f'https://discord.com/api/v10/guilds/{self.id}/channels',
-            headers={'Authorization': f'Bot {self._client.token}'},
-            json={'name': name, 'type': channel_type}
-        ) as resp:
-            data = await resp.json()
-            channel = Channel(self._client, data)
-            self.channels[channel.id] = channel
-            return channel
+        data = await self._client.rest.create_guild_channel(str(self.id), name, channel_type)
+        channel = Channel(self._client, data)
+        self._add_channel(channel)
+        return channel
 
 
-class Channel(Model):
-    id: str
+class Role(Model):
+    __slots__ = ('id', 'name', 'color', 'position', 'permissions', 'hoist', 'managed', 'mentionable')
+
+    _fields = {'id': snowflake, 'name': None, 'color': None, 'position': None,
+               'permissions': int, 'hoist': None, 'managed': None, 'mentionable': None}
+    _defaults = {'color': 0, 'position': 0, 'permissions': 0, 'hoist': False,
+                 'managed': False, 'mentionable': False}
+
+    id: int
     name: str
+    color: int
+    position: int
+    permissions: int
+    hoist: bool
+    managed: bool
+    mentionable: bool
+
+
+class Emoji(Model):
+    __slots__ = ('id', 'name', 'roles', 'animated', 'managed', 'available')
+
+    _fields = {'id': snowflake, 'name': None, 'roles': snowflakes, 'animated': None,
+               'managed': None, 'available': None}
+    _defaults = {'roles': list, 'animated': False, 'managed': False, 'available': True}
+
+    id: int
+    name: str
+    roles: List[int]
+    animated: bool
+    managed: bool
+    available: bool
+
+
+class Channel(Model):
+    __slots__ = ('id', 'name', 'type', 'guild_id', 'position', 'parent_id', 'topic', 'nsfw',
+                 'owner_id', 'thread_metadata')
+
+    _fields = {'id': snowflake, 'name': None, 'type': None, 'guild_id': snowflake,
+               'position': None, 'parent_id': snowflake, 'topic': None, 'nsfw': None,
+               'owner_id': snowflake, 'thread_metadata': None}
+    _defaults = {'nsfw': False}
+
+    id: int
+    name: Optional[str]
     type: int
-    guild_id: Optional[str] = None
+    guild_id: Optional[int]
+    position: Optional[int]
+    parent_id: Optional[int]
+    topic: Optional[str]
+    nsfw: bool
+    owner_id: Optional[int]
+    thread_metadata: Optional[Dict[str, Any]]
     
     async def send(self, content: str):
         return await self._client.send_message(self.id, content)
@@ -94,16 +377,35 @@ class Channel(Model):
 
 
 class Message(Model):
-    id: str
-    content: str
+    __slots__ = ('id', 'channel_id', 'guild_id', 'author', 'content', 'timestamp',
+                 'edited_timestamp', 'tts', 'mention_everyone', 'mentions', 'mention_roles',
+                 'attachments', 'embeds', 'pinned', 'type', 'shard_id')
+
+    _fields = {'id': snowflake, 'channel_id': snowflake, 'guild_id': snowflake,
+               'content': None, 'timestamp': None, 'edited_timestamp': None, 'tts': None,
+               'mention_everyone': None, 'mention_roles': snowflakes, 'attachments': None,
+               'embeds': None, 'pinned': None, 'type': None}
+    _nested = {'author': _intern_user, 'mentions': _intern_users}
+    _defaults = {'content': '', 'tts': False, 'mention_everyone': False, 'mentions': list,
+                 'mention_roles': list, 'attachments': list, 'embeds': list, 'pinned': False,
+                 'type': 0}
+
+    id: int
+    channel_id: int
+    guild_id: Optional[int]
     author: User
-    channel_id: str
-    guild_id: Optional[str] = None
-    
-    def _update(self, data: Dict[str, Any]):
-        super()._update(data)
-        if 'author' in data:
-            self.author = User(self._client, data['author'])
+    content: str
+    timestamp: str
+    edited_timestamp: Optional[str]
+    tts: bool
+    mention_everyone: bool
+    mentions: List[User]
+    mention_roles: List[int]
+    attachments: List[Dict[str, Any]]
+    embeds: List[Dict[str, Any]]
+    pinned: bool
+    type: int
+    shard_id: Optional[int]
     
     async def reply(self, content: str = None, embed: Dict[str, Any] = None, components: List[Dict[str, Any]] = None):
         payload = {'message_reference': {'message_id': self.id}}
@@ -125,37 +427,38 @@ class Message(Model):
             if comp_list:
                 payload["components"] = comp_list
         
-        async with self._client.session.post(
-            f'https://discord.com/api/v10/channels/{self.channel_id}/messages',
-            headers={'Authorization': f'Bot {self._client.token}'},
-            json=payload
-        ) as resp:
-            if resp.status not in range(200, 300):
-                error_text = await resp.text()
-                raise Exception(f"Failed to send message (Status: {resp.status}, Error: {error_text})")
-            
-            data = await resp.json()
-            return Message(self._client, data)
+        data = await self._client.rest.create_message(str(self.channel_id), **payload)
+        return Message(self._client, data)
     
     async def delete(self):
-        async with self._client.session.delete(
-            f'https://discord.com/api/v10/channels/{self.channel_id}/messages/{self.id}',
-            headers={'Authorization': f'Bot {self._client.token}'}
-        ) as resp:
-            return resp.status == 204
+        await self._client.rest.delete_message(str(self.channel_id), str(self.id))
+        return True
+
+
+class LazyMessage(LazyModel, Message):
+    """Message that parses its fields from the raw payload on first access"""
+    __slots__ = ('_data',)
 
 
 class Member(Model):
+    __slots__ = ('user', 'guild_id', 'nick', 'roles', 'joined_at', 'voice')
+
+    _fields = {'guild_id': snowflake, 'nick': None, 'roles': snowflakes,
+               'joined_at': None, 'voice': None}
+    _nested = {'user': _intern_user}
+    _defaults = {'roles': list}
+
     user: User
-    nick: Optional[str] = None
-    roles: List[str] = []
+    guild_id: Optional[int]
+    nick: Optional[str]
+    roles: List[int]
     joined_at: str
-    voice: Optional[Dict[str, Any]] = None
-    
-    def _update(self, data: Dict[str, Any]):
-        super()._update(data)
-        if 'user' in data:
-            self.user = User(self._client, data['user'])
+    voice: Optional[Dict[str, Any]]
+
+    def _to_dict(self) -> Dict[str, Any]:
+        data = super()._to_dict()
+        data['user'] = self.user._to_dict()
+        return data
     
     @property
     def name(self) -> str:
@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import re
+from collections import deque
+from typing import Optional, Dict, Any, Deque, Tuple, Mapping
+
+logger = logging.getLogger('harmony')
+
+# Top-level resources whose id is a "major parameter": Discord rate limits
+# each channel, guild and webhook separately, even on the same route
+_MAJOR_RESOURCES = ('channels', 'guilds', 'webhooks')
+_SNOWFLAKE = re.compile(r'^\d{15,22}$')
+
+
+def route_key(method: str, endpoint: str) -> Tuple[str, str]:
+    """Split a request into its route template and major parameter.
+
+    `/channels/123/messages/456` becomes `('GET /channels/{major}/messages/{id}', '123')`.
+    Reaction emoji are folded into the template as well, so every reaction on
+    a channel shares one route.
+    """
+    parts = endpoint.split('?', 1)[0].strip('/').split('/')
+    major = ''
+    template = []
+
+    for index, part in enumerate(parts):
+        previous = parts[index - 1] if index else ''
+        if index == 1 and previous in _MAJOR_RESOURCES:
+            major = part
+            template.append('{major}')
+        elif index == 2 and parts[0] == 'webhooks':
+            # Webhook tokens are part of the major parameter
+            major = f"{major}/{part}"
+            template.append('{token}')
+        elif index == 2 and parts[0] == 'interactions':
+            template.append('{token}')
+        elif previous == 'reactions':
+            template.append('{emoji}')
+        elif _SNOWFLAKE.match(part):
+            template.append('{id}')
+        else:
+            template.append(part)
+
+    return f"{method} /{'/'.join(template)}", major
+
+
+class Bucket:
+    """One rate limit bucket: a count of remaining requests until `reset_at`.
+
+    Requests that find the bucket empty wait on a queue of futures, released
+    by a timer when the bucket resets or as responses report more remaining
+    requests. A bucket starts out allowing a single request, whose response
+    teaches it the real limit.
+    """
+
+    def __init__(self, key: str, limit: int = 1, per: Optional[float] = None):
+        self.key = key
+        self.limit = limit
+        self.remaining = limit
+        self.reset_at = 0.0
+        self.per = per
+        self.unlimited = False
+        self.learned = False
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _refresh(self, now: float) -> None:
+        if now >= self.reset_at and (self.per is not None or self.reset_at):
+            self.remaining = self.limit
+            self.reset_at = now + self.per if self.per is not None else 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for future in self._waiters if not future.done())
+
+    async def acquire(self) -> None:
+        if self.unlimited:
+            return
+
+        loop = asyncio.get_running_loop()
+        self._refresh(loop.time())
+        if not self.queue_depth and self.remaining > 0:
+            self.remaining -= 1
+            return
+
+        future = loop.create_future()
+        self._waiters.append(future)
+        self._schedule()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Woken, then cancelled before running: pass the slot on
+                self.release()
+            raise
+
+    def release(self) -> None:
+        """Give back a request that never got a response"""
+        if not self.unlimited:
+            self.remaining = min(self.limit, self.remaining + 1)
+            self._wake()
+
+    def update(self, limit: Optional[int], remaining: Optional[int], reset_after: Optional[float]) -> None:
+        """Apply the X-RateLimit-* headers of a response"""
+        if limit is None:
+            # A successful response without rate limit headers: the route isn't limited
+            self.unlimited = True
+            self._wake_all()
+            return
+
+        if self.learned:
+            # Our own count already includes requests still in flight, and
+            # responses can arrive out of order, so never raise it
+            remaining = min(remaining, self.remaining)
+
+        self.unlimited = False
+        self.learned = True
+        self.limit = limit
+        self.remaining = remaining
+        self.reset_at = asyncio.get_running_loop().time() + reset_after
+        self._wake()
+
+    def block(self, retry_after: float) -> None:
+        """Empty the bucket for `retry_after` seconds after a 429"""
+        loop = asyncio.get_running_loop()
+        self.unlimited = False
+        self.remaining = 0
+        self.reset_at = max(self.reset_at, loop.time() + retry_after)
+        self._schedule()
+
+    def _wake(self) -> None:
+        while self._waiters and self.remaining > 0:
+            future = self._waiters.popleft()
+            if not future.done():
+                self.remaining -= 1
+                future.set_result(None)
+
+        while self._waiters and self._waiters[0].done():
+            self._waiters.popleft()
+        if self._waiters:
+            self._schedule()
+
+    def _wake_all(self) -> None:
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+
+    def _schedule(self) -> None:
+        if self._timer is not None or not self.reset_at:
+            return
+
+        def on_reset():
+            self._timer = None
+            self._refresh(asyncio.get_running_loop().time())
+            self._wake()
+
+        self._timer = asyncio.get_running_loop().call_at(self.reset_at, on_reset)
+
+    @property
+    def idle(self) -> bool:
+        return not self.queue_depth and self._timer is None
+
+
+class RateLimiter:
+    """Discord REST rate limits: per-route buckets plus the global limit.
+
+    Buckets are keyed by route and major parameter until a response reveals
+    the route's bucket hash (`X-RateLimit-Bucket`). After that, every route
+    sharing the hash shares one bucket per major parameter. The global limit
+    is a separate fixed-window bucket, paused entirely by a global 429.
+    """
+
+    def __init__(self, global_limit: int = 50, global_per: float = 1.0):
+        self.global_bucket = Bucket('global', limit=global_limit, per=global_per)
+        self._hashes: Dict[str, str] = {}
+        self._buckets: Dict[str, Bucket] = {}
+        self._global_unlocked = asyncio.Event()
+        self._global_unlocked.set()
+        self._requests = 0
+
+        self.ratelimited = 0
+        self.global_ratelimited = 0
+
+    def bucket_for(self, method: str, endpoint: str) -> Bucket:
+        route, major = route_key(method, endpoint)
+        key = f"{self._hashes.get(route, route)}:{major}"
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = Bucket(key)
+
+        self._requests += 1
+        if self._requests % 1000 == 0:
+            self._prune()
+        return bucket
+
+    async def acquire(self, method: str, endpoint: str) -> Bucket:
+        """Wait until a request may be sent, returning the bucket it counts against"""
+        bucket = self.bucket_for(method, endpoint)
+        await bucket.acquire()
+        try:
+            await self._global_unlocked.wait()
+            await self.global_bucket.acquire()
+        except asyncio.CancelledError:
+            bucket.release()
+            raise
+        return bucket
+
+    def release(self, bucket: Bucket) -> None:
+        """Give back both slots of a request that never got a response"""
+        bucket.release()
+        self.global_bucket.release()
+
+    def update(self, bucket: Bucket, method: str, endpoint: str, headers: Mapping[str, str],
+               status: int = 200) -> None:
+        """Learn the bucket hash and limits from a response's headers"""
+        bucket_hash = headers.get('X-RateLimit-Bucket')
+        if bucket_hash:
+            route, major = route_key(method, endpoint)
+            self._hashes[route] = bucket_hash
+            # Later requests on this route use the shared bucket; move this one there
+            self._buckets.setdefault(f"{bucket_hash}:{major}", bucket)
+
+        limit = headers.get('X-RateLimit-Limit')
+        if limit is None:
+            if bucket.learned:
+                # e.g. a proxy error page; keep the limits already learned
+                return
+            if 200 <= status < 300:
+                bucket.update(None, None, None)
+            else:
+                # Nothing learned from this probe; let the next request probe again
+                bucket.release()
+            return
+
+        bucket.update(int(limit), int(headers.get('X-RateLimit-Remaining', 0)),
+                      float(headers.get('X-RateLimit-Reset-After', 0)))
+
+    def on_429(self, bucket: Bucket, headers: Mapping[str, str], body: Optional[Dict[str, Any]]) -> float:
+        """Record a 429, returning how long to wait before retrying"""
+        body = body or {}
+        retry_after = float(body.get('retry_after') or headers.get('Retry-After') or 1.0)
+        is_global = body.get('global') or headers.get('X-RateLimit-Global') == 'true'
+
+        if is_global:
+            self.global_ratelimited += 1
+            logger.warning(f"Hit the global rate limit, pausing all requests for {retry_after:.2f}s")
+            self._global_unlocked.clear()
+            asyncio.get_running_loop().call_later(retry_after, self._global_unlocked.set)
+        else:
+            self.ratelimited += 1
+            scope = headers.get('X-RateLimit-Scope', 'user')
+            logger.warning(f"Rate limited on bucket {bucket.key} ({scope}), retrying in {retry_after:.2f}s")
+            bucket.block(retry_after)
+
+        return retry_after
+
+    def _prune(self) -> None:
+        loop = asyncio.get_running_loop()
+        for key, bucket in list(self._buckets.items()):
+            if bucket.idle and loop.time() >= bucket.reset_at:
+                del self._buckets[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'buckets': len(self._buckets),
+            'known_routes': len(self._hashes),
+            'queued': sum(bucket.queue_depth for bucket in self._buckets.values()),
+            'ratelimited': self.ratelimited,
+            'global_ratelimited': self.global_ratelimited,
+            'global_paused': not self._global_unlocked.is_set()
+        }
@@ -1,11 +1,184 @@
-
 from typing import Dict, Any, Optional, List, Union
-import json
+import asyncio
+import logging
+import random
+
+import aiohttp
+
+from . import codec
+from .metrics import Histogram
+from .ratelimit import RateLimiter
+
+logger = logging.getLogger('harmony')
+
+
+class HTTPException(Exception):
+    """A Discord API request answered with an error status"""
+
+    def __init__(self, status: int, method: str, endpoint: str, body: Union[Dict[str, Any], str, None],
+                 retry_after: Optional[float] = None):
+        self.status = status
+        self.method = method
+        self.endpoint = endpoint
+        self.body = body
+        self.retry_after = retry_after
+
+        if isinstance(body, dict):
+            self.code = body.get('code', 0)
+            self.text = body.get('message', '')
+        else:
+            self.code = 0
+            self.text = body or ''
+        super().__init__(f"{method} {endpoint} failed with {status} (error code {self.code}): {self.text}")
+
+
+class BadRequest(HTTPException):
+    pass
+
+
+class Unauthorized(HTTPException):
+    pass
+
+
+class Forbidden(HTTPException):
+    pass
+
+
+class NotFound(HTTPException):
+    pass
+
+
+class RateLimited(HTTPException):
+    """A 429 that was still being returned when retries ran out"""
+
+    @property
+    def is_global(self) -> bool:
+        return isinstance(self.body, dict) and bool(self.body.get('global'))
+
+
+class ServerError(HTTPException):
+    pass
+
+
+_ERRORS = {400: BadRequest, 401: Unauthorized, 403: Forbidden, 404: NotFound, 429: RateLimited}
+
+# Methods safe to repeat when a request may or may not have reached Discord
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+
+class RetryPolicy:
+    """How requests are retried after 429s, 5xx responses and connection errors.
+
+    Waits between attempts use decorrelated jitter: each delay is drawn
+    between `base` and three times the previous delay, capped at `maximum`,
+    so clients retrying together spread out instead of retrying in lockstep.
+    A 429 or 503 waits at least its Retry-After. No retry starts once the
+    request has been running for `deadline` seconds. 5xx responses, and
+    connection errors and timeouts, are only retried for idempotent methods,
+    since the request may already have been carried out; a connection that
+    was never made is retried for any method.
+    """
+
+    def __init__(self, attempts: int = 5, base: float = 0.5, maximum: float = 30.0,
+                 deadline: Optional[float] = 120.0):
+        if attempts < 1:
+            raise ValueError("attempts must be at least 1")
+        self.attempts = attempts
+        self.base = base
+        self.maximum = maximum
+        self.deadline = deadline
+
+    def delay(self, previous: float) -> float:
+        return min(self.maximum, random.uniform(self.base, max(self.base, previous * 3)))
+
 
 class RESTClient:
-    def __init__(self, client):
+    """Sends every Discord API request over one pooled, keep-alive HTTP session.
+
+    The session is created on `start()` (called by `Client.login`) and is
+    shared with the gateway websockets. `pool_size` caps the open connections
+    to the API host only, so websockets to the gateway host never take a slot
+    from REST calls.
+    """
+
+    def __init__(self, client, retry: Optional[RetryPolicy] = None, pool_size: int = 100,
+                 dns_cache_ttl: int = 300, keepalive_timeout: float = 60.0):
         self.client = client
         self.base_url = "https://discord.com/api/v10"
+        self.ratelimiter = RateLimiter()
+        self.retry = retry or RetryPolicy()
+        self.pool_size = pool_size
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._headers: Dict[str, str] = {}
+
+        self.requests = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.latency = Histogram()
+        self.retries = {'ratelimited': 0, 'server_error': 0, 'connection': 0}
+        self.retry_seconds = 0.0
+        self.failures = 0
+        self.coalesced = 0
+        self._inflight: Dict[tuple, asyncio.Task] = {}
+
+    async def start(self) -> aiohttp.ClientSession:
+        """Create the pooled session and the request headers for the client's token"""
+        if self.session is None or self.session.closed:
+            trace = aiohttp.TraceConfig()
+            trace.on_connection_create_end.append(self._on_connection_created)
+            trace.on_connection_reuseconn.append(self._on_connection_reused)
+
+            connector = aiohttp.TCPConnector(
+                limit=0, limit_per_host=self.pool_size,
+                ttl_dns_cache=self.dns_cache_ttl, keepalive_timeout=self.keepalive_timeout
+            )
+            self.session = aiohttp.ClientSession(connector=connector, json_serialize=codec.dumps,
+                                                 trace_configs=[trace])
+
+        self._headers = {
+            "Authorization": f"Bot {self.client.token}",
+            "Content-Type": "application/json"
+        }
+        return self.session
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _on_connection_created(self, session, context, params) -> None:
+        self.connections_created += 1
+
+    async def _on_connection_reused(self, session, context, params) -> None:
+        self.connections_reused += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Requests sent, connection reuse and request latency (p50/p90/p99)"""
+        connections = self.connections_created + self.connections_reused
+        return {
+            'requests': self.requests,
+            'connections_created': self.connections_created,
+            'connections_reused': self.connections_reused,
+            'reuse_ratio': self.connections_reused / connections if connections else None,
+            'latency': self.latency.summary(),
+            'retries': dict(self.retries),
+            'retry_seconds': self.retry_seconds,
+            'failures': self.failures,
+            'coalesced': self.coalesced,
+            'ratelimits': self.ratelimiter.stats()
+        }
+
+    async def get_gateway_bot(self) -> Dict[str, Any]:
+        return await self._request("GET", "/gateway/bot")
+
+    async def get_current_user(self) -> Dict[str, Any]:
+        return await self._request("GET", "/users/@me")
+
+    async def create_dm(self, recipient_id: str) -> Dict[str, Any]:
+        return await self._request("POST", "/users/@me/channels", json={"recipient_id": recipient_id})
 
     async def get_user(self, user_id: str) -> Dict[str, Any]:
         return await self._request("GET", f"/users/{user_id}")
@@ -19,13 +192,19 @@ class RESTClient:
     async def get_guild_channels(self, guild_id: str) -> List[Dict[str, Any]]:
         return await self._request("GET", f"/guilds/{guild_id}/channels")
 
+    async def create_guild_channel(self, guild_id: str, name: str, channel_type: int = 0) -> Dict[str, Any]:
+        return await self._request("POST", f"/guilds/{guild_id}/channels", json={"name": name, "type": channel_type})
+
     async def get_guild_members(self, guild_id: str, limit: int = 1000) -> List[Dict[str, Any]]:
         return await self._request("GET", f"/guilds/{guild_id}/members", params={"limit": limit})
 
     async def create_message(self, channel_id: str, content: str = None, 
                            embed: Dict[str, Any] = None, embeds: List[Dict[str, Any]] = None,
-                           tts: bool = False) -> Dict[str, Any]:
+                           tts: bool = False, components: List[Dict[str, Any]] = None,
+                           message_reference: Dict[str, Any] = None) -> Dict[str, Any]:
         payload = {}
+        if message_reference:
+            payload["message_reference"] = message_reference
         if content:
             payload["content"] = content
         if tts:
@@ -34,6 +213,8 @@ class RESTClient:
             payload["embed"] = embed
         if embeds:
             payload["embeds"] = embeds
+        if components:
+            payload["components"] = components
 
         return await self._request("POST", f"/channels/{channel_id}/messages", json=payload)
 
@@ -91,45 +272,141 @@ class RESTClient:
         })
 
     async def _request(self, method: str, endpoint: str, **kwargs) -> Any:
-        headers = {
-            "Authorization": f"Bot {self.client.token}",
-            "Content-Type": "application/json"
-        }
+        """Send a request, sharing one in-flight GET between concurrent identical callers.
+
+        Coalesced callers receive the same decoded response object, so it must
+        be treated as read-only.
+        """
+        if method != "GET" or set(kwargs) - {"params"}:
+            return await self._perform(method, endpoint, **kwargs)
+
+        params = kwargs.get("params")
+        key = (endpoint, tuple(sorted(params.items())) if params else ())
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.create_task(self._perform(method, endpoint, **kwargs))
+            task.add_done_callback(lambda done: self._finish_inflight(key, done))
+        else:
+            self.coalesced += 1
+
+        # Shielded so one caller being cancelled doesn't fail the others
+        return await asyncio.shield(task)
+
+    def _finish_inflight(self, key: tuple, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the error retrieved even if every caller was cancelled
+            task.exception()
 
+    async def _perform(self, method: str, endpoint: str, **kwargs) -> Any:
+        if self.session is None:
+            await self.start()
+
+        headers = self._headers
         if "headers" in kwargs:
-            headers.update(kwargs.pop("headers"))
+            headers = dict(headers, **kwargs.pop("headers"))
+
+        if "json" in kwargs:
+            kwargs["data"] = codec.dumps(kwargs.pop("json"))
 
         url = f"{self.base_url}{endpoint}"
+        policy = self.retry
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + policy.deadline if policy.deadline else None
+        delay = policy.base
+        retrying_since = None
 
-        async with self.client.session.request(method, url, headers=headers, **kwargs) as resp:
-            if resp.status == 204:
-                return None
+        try:
+            for attempt in range(1, policy.attempts + 1):
+                try:
+                    return await self._send(method, endpoint, url, headers, deadline, **kwargs)
+                except RateLimited as e:
+                    # The bucket (or the global lock) already holds the next attempt back
+                    error, reason, wait = e, 'ratelimited', e.retry_after or 0.0
+                except ServerError as e:
+                    if method not in IDEMPOTENT_METHODS:
+                        # The server got the request and may have acted on it
+                        self.failures += 1
+                        raise
+                    error, reason, wait = e, 'server_error', max(policy.delay(delay), e.retry_after or 0.0)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    if method not in IDEMPOTENT_METHODS and not isinstance(e, aiohttp.ClientConnectorError):
+                        # The request may already have been sent; retrying could post it twice
+                        self.failures += 1
+                        raise
+                    error, reason, wait = e, 'connection', policy.delay(delay)
 
-            if resp.status not in (200, 201, 204):
-                error = await resp.text()
-                raise Exception(f"API error {resp.status}: {error}")
+                if attempt == policy.attempts or (deadline is not None and loop.time() + wait >= deadline):
+                    self.failures += 1
+                    raise error
 
-            return await resp.json()
+                if retrying_since is None:
+                    retrying_since = loop.time()
+                self.retries[reason] += 1
+                logger.debug(f"Retrying {method} {endpoint} in {wait:.2f}s after {reason} (attempt {attempt})")
+
+                if reason != 'ratelimited':
+                    delay = wait
+                    await asyncio.sleep(wait)
+        finally:
+            if retrying_since is not None:
+                self.retry_seconds += loop.time() - retrying_since
+
+    async def _send(self, method: str, endpoint: str, url: str, headers: Dict[str, str],
+                    deadline: Optional[float], **kwargs) -> Any:
+        """Make one attempt at a request, raising HTTPException on an error status"""
+        loop = asyncio.get_running_loop()
+        if deadline is None:
+            bucket = await self.ratelimiter.acquire(method, endpoint)
+        else:
+            bucket = await asyncio.wait_for(self.ratelimiter.acquire(method, endpoint), deadline - loop.time())
+            # A zero total would disable the timeout altogether
+            kwargs.setdefault('timeout', aiohttp.ClientTimeout(total=max(0.001, deadline - loop.time())))
+
+        sent_at = loop.time()
+        self.requests += 1
+        counted = False
 
-    async def create_interaction_response(self, interaction_id, interaction_token, data):
         try:
-            print(f"Sending interaction response: {interaction_id} {interaction_token}")
-            print(f"Response data: {json.dumps(data)}")
-            
-            async with self.client.session.post(
-                f'{self.base_url}/interactions/{interaction_id}/{interaction_token}/callback',
-                headers={"Authorization": f"Bot {self.client.token}", "Content-Type": "application/json"},
-                json=data
-            ) as resp:
-                if resp.status not in range(200, 300):
-                    error_text = await resp.text()
-                    print(f"Error in interaction response: {resp.status} - {error_text}")
-                    raise Exception(f"Failed to respond to interaction: {resp.status}")
+            async with self.session.request(method, url, headers=headers, **kwargs) as resp:
+                self.latency.observe(loop.time() - sent_at)
+                self.ratelimiter.update(bucket, method, endpoint, resp.headers, resp.status)
+                counted = True
 
-                try:
-                    return await resp.json()
-                except:
+                if resp.status == 204:
                     return None
-        except Exception as e:
-            print(f"Exception in interaction response: {e}")
-            raise
+
+                if 200 <= resp.status < 300:
+                    return await resp.json(loads=codec.loads)
+
+                try:
+                    body = await resp.json(loads=codec.loads)
+                except (aiohttp.ContentTypeError, ValueError):
+                    body = await resp.text()
+
+                if resp.status == 429:
+                    retry_after = self.ratelimiter.on_429(bucket, resp.headers, body if isinstance(body, dict) else None)
+                    raise RateLimited(resp.status, method, endpoint, body, retry_after)
+
+                retry_after = resp.headers.get('Retry-After')
+                retry_after = float(retry_after) if retry_after else None
+                error = ServerError if resp.status >= 500 else _ERRORS.get(resp.status, HTTPException)
+                raise error(resp.status, method, endpoint, body, retry_after)
+        finally:
+            if not counted:
+                # No response headers reached the bucket (a connection error, a
+                # timeout or the caller cancelling), so give the slots back
+                self.ratelimiter.release(bucket)
+
+    async def create_interaction_response(self, interaction_id, interaction_token, data):
+        logger.debug("Sending interaction response: %s", interaction_id)
+        return await self._request("POST", f"/interactions/{interaction_id}/{interaction_token}/callback", json=data)
+
+    async def bulk_overwrite_global_application_commands(self, application_id: str,
+                                                         commands: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return await self._request("PUT", f"/applications/{application_id}/commands", json=commands)
+
+    async def bulk_overwrite_guild_application_commands(self, application_id: str, guild_id: str,
+                                                        commands: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return await self._request("PUT", f"/applications/{application_id}/guilds/{guild_id}/commands", json=commands)
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+from typing import Optional, Dict, List, Iterable
+
+from .client import Client, Bot
+from .gateway import GatewayConnection, IdentifyLimiter
+
+logger = logging.getLogger('harmony')
+
+
+class AutoShardedClient(Client):
+    """Client that runs one gateway connection per shard on a single event loop"""
+
+    def __init__(self, intents: int = 0, shard_count: Optional[int] = None,
+                 shard_ids: Optional[Iterable[int]] = None, **options):
+        super().__init__(intents=intents, **options)
+        self.shard_count = shard_count
+        self.shard_ids: Optional[List[int]] = list(shard_ids) if shard_ids is not None else None
+        self.shards: Dict[int, GatewayConnection] = {}
+        self.max_concurrency = 1
+        self.identify_limiter = None
+        self._ready_shards = set()
+
+        if self.shard_ids is not None and self.shard_count is None:
+            raise ValueError("shard_count is required when shard_ids is given")
+
+    async def _fetch_gateway_info(self) -> None:
+        data = await self.rest.get_gateway_bot()
+        self.max_concurrency = data.get('session_start_limit', {}).get('max_concurrency', 1)
+
+        if self.shard_count is None:
+            self.shard_count = data['shards']
+            logger.info(f"Using recommended shard count of {self.shard_count}")
+
+    async def connect(self, reconnect: bool = True) -> None:
+        """Connect every shard to the gateway and process events until closed"""
+        if not self.token:
+            raise Exception("Not logged in")
+
+        await self._fetch_gateway_info()
+        self._load_snapshot()
+
+        limiter = self.identify_limiter or IdentifyLimiter(self.max_concurrency)
+        shard_ids = self.shard_ids if self.shard_ids is not None else range(self.shard_count)
+
+        for shard_id in shard_ids:
+            self.shards[shard_id] = GatewayConnection(
+                self, self.gateway_url, compress=self.compress,
+                shard_id=shard_id, shard_count=self.shard_count,
+                identify_limiter=limiter
+            )
+            self._restore_session(self.shards[shard_id])
+
+        self._connection = next(iter(self.shards.values()))
+        await asyncio.gather(*(shard.run(reconnect=reconnect) for shard in self.shards.values()))
+
+    async def _mark_ready(self, shard_id: int) -> None:
+        self._ready_shards.add(shard_id)
+        await self.events.dispatch('shard_ready', shard_id)
+
+        if len(self._ready_shards) == len(self.shards) and not self._ready.is_set():
+            self._ready.set()
+            await self.events.dispatch('ready')
+
+    def shard_for(self, guild_id: str) -> int:
+        """Return the shard id that receives events for a guild"""
+        return (int(guild_id) >> 22) % (self.shard_count or 1)
+
+    def _connections(self) -> List[GatewayConnection]:
+        return list(self.shards.values())
+
+    def _connection_for(self, shard_id: Optional[int]) -> GatewayConnection:
+        connection = self.shards.get(shard_id)
+        if connection is None:
+            raise Exception(f"Shard {shard_id} is not running")
+        return connection
+
+    def get_shard(self, shard_id: int) -> Optional[GatewayConnection]:
+        return self.shards.get(shard_id)
+
+
+class AutoShardedBot(Bot, AutoShardedClient):
+    """Bot with command handling that shards its gateway connections"""
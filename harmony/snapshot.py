@@ -0,0 +1,104 @@
+"""
+Cache snapshots for warm restarts.
+
+A snapshot holds the guild cache (channels, threads, roles, members and the
+other enabled per-guild stores) and each shard's gateway session. It is a
+small header followed by one length-prefixed, zlib-compressed record per
+guild:
+
+    magic | header length | header (JSON) | (record length | record)*
+
+The file is memory-mapped when loading, so records are decompressed straight
+from the page cache without reading the whole file into memory first.
+"""
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from typing import Dict, Any
+
+from . import codec
+
+logger = logging.getLogger('harmony')
+
+MAGIC = b'HRMSNAP1'
+_HEADER = struct.Struct('>8sI')
+_RECORD = struct.Struct('>I')
+
+
+def save_snapshot(client, path: str) -> int:
+    """Write the client's guild cache and gateway sessions to `path`, returning the guild count"""
+    sessions = {}
+    for connection in client._connections():
+        if connection.can_resume:
+            sessions[str(connection.shard_id)] = {
+                'session_id': connection.session_id,
+                'sequence': connection.sequence,
+                'resume_gateway_url': connection.resume_gateway_url,
+                'shard_count': connection.shard_count
+            }
+
+    guilds = list(client.state.guilds.values())
+    header = codec.dumps({
+        'saved_at': time.time(),
+        'user': client.user._to_dict() if client.user else None,
+        'application_id': getattr(client, 'application_id', None),
+        'sessions': sessions,
+        'guilds': len(guilds)
+    }).encode('utf-8')
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as fh:
+        fh.write(_HEADER.pack(MAGIC, len(header)))
+        fh.write(header)
+        for guild in guilds:
+            payload = guild._to_dict()
+            payload['shard_id'] = guild.shard_id
+            record = zlib.compress(codec.dumps(payload).encode('utf-8'), 1)
+            fh.write(_RECORD.pack(len(record)))
+            fh.write(record)
+
+    # Replace atomically so a crash mid-write never leaves a truncated snapshot
+    os.replace(tmp_path, path)
+    return len(guilds)
+
+
+def load_snapshot(client, path: str) -> Dict[int, Dict[str, Any]]:
+    """Fill the client's cache from a snapshot, returning the saved sessions by shard id.
+
+    Raises ValueError if the file isn't a snapshot or is truncated.
+    """
+    with open(path, 'rb') as fh:
+        if os.fstat(fh.fileno()).st_size < _HEADER.size:
+            raise ValueError("snapshot is truncated")
+
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            magic, header_size = _HEADER.unpack_from(view, 0)
+            if magic != MAGIC:
+                raise ValueError("not a harmony cache snapshot")
+
+            offset = _HEADER.size
+            header = codec.loads(bytes(view[offset:offset + header_size]))
+            offset += header_size
+
+            if header.get('user'):
+                client.user = client.state.store_user(header['user'])
+            if header.get('application_id'):
+                client.application_id = header['application_id']
+
+            for _ in range(header['guilds']):
+                (size,) = _RECORD.unpack_from(view, offset)
+                offset += _RECORD.size
+                if offset + size > len(view):
+                    raise ValueError("snapshot is truncated")
+
+                payload = codec.loads(zlib.decompress(view[offset:offset + size]))
+                guild = client.state.create_guild(payload, payload.pop('shard_id'))
+                client.state.snapshot_guilds.add(guild.id)
+                offset += size
+
+    logger.info(f"Loaded {header['guilds']} guilds from snapshot saved "
+                f"{time.time() - header['saved_at']:.0f}s ago")
+    return {int(shard_id): session for shard_id, session in header['sessions'].items()}
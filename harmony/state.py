@@ -0,0 +1,322 @@
+import logging
+import sys
+import weakref
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Set, List
+
+from .enums import Intents
+from .models import Model, Guild, Message, User
+
+logger = logging.getLogger('harmony')
+
+# Intents whose events feed each optional store by default
+STORE_INTENTS: Dict[str, int] = {
+    'members': Intents.GUILDS | Intents.GUILD_MEMBERS,
+    'messages': Intents.GUILD_MESSAGES | Intents.DIRECT_MESSAGES,
+    'presences': Intents.GUILD_PRESENCES,
+    'voice_states': Intents.GUILD_VOICE_STATES,
+    'emojis': Intents.GUILDS | Intents.GUILD_EMOJIS,
+}
+
+# Gateway events that only need parsing when a store is enabled
+STORE_EVENTS: Dict[str, Set[str]] = {
+    'members': {'GUILD_MEMBER_ADD', 'GUILD_MEMBER_UPDATE', 'GUILD_MEMBER_REMOVE', 'GUILD_MEMBERS_CHUNK'},
+    'messages': {'MESSAGE_CREATE', 'MESSAGE_UPDATE', 'MESSAGE_DELETE', 'MESSAGE_DELETE_BULK'},
+    'presences': {'PRESENCE_UPDATE'},
+    'voice_states': {'VOICE_STATE_UPDATE'},
+    'emojis': {'GUILD_EMOJIS_UPDATE'},
+}
+
+# Optional stores that GUILD_CREATE fills from a field of the same name
+PAYLOAD_STORES = ('members', 'presences', 'voice_states', 'emojis')
+
+# Gateway events that keep the always-on guild, channel and role stores current
+BASE_EVENTS: Set[str] = {
+    'READY', 'RESUMED', 'GUILD_CREATE', 'GUILD_UPDATE', 'GUILD_DELETE',
+    'CHANNEL_CREATE', 'CHANNEL_UPDATE', 'CHANNEL_DELETE',
+    'THREAD_CREATE', 'THREAD_UPDATE', 'THREAD_DELETE',
+    'GUILD_ROLE_CREATE', 'GUILD_ROLE_UPDATE', 'GUILD_ROLE_DELETE',
+}
+
+# Per-guild stores, in the order memory is accounted
+GUILD_STORES = ('channels', 'threads', 'roles', 'members', 'emojis', 'presences', 'voice_states')
+
+
+class CachePolicy:
+    """Which entities the client caches, and which intents feed each store.
+
+    A store is filled only when it is enabled here and the client has at
+    least one of the store's intents (see `STORE_INTENTS`, overridable with
+    `intents`). For messages, GUILD_MESSAGES feeds guild messages and
+    DIRECT_MESSAGES feeds DMs. Guilds, channels, threads and roles are always
+    cached.
+    """
+
+    STORES = ('members', 'messages', 'presences', 'voice_states', 'emojis')
+
+    def __init__(self, members: bool = True, messages: bool = True, presences: bool = False,
+                 voice_states: bool = True, emojis: bool = True, max_messages: int = 1000,
+                 max_messages_per_channel: Optional[int] = None,
+                 intents: Optional[Dict[str, int]] = None):
+        self.members = members
+        self.messages = messages
+        self.presences = presences
+        self.voice_states = voice_states
+        self.emojis = emojis
+        self.max_messages = max_messages
+        self.max_messages_per_channel = max_messages_per_channel
+        self.intents = dict(STORE_INTENTS, **(intents or {}))
+
+        unknown = set(self.intents) - set(self.STORES)
+        if unknown:
+            raise ValueError(f"Unknown cache stores: {', '.join(sorted(unknown))}")
+
+    @classmethod
+    def all(cls, **options) -> 'CachePolicy':
+        return cls(members=True, messages=True, presences=True, voice_states=True, emojis=True, **options)
+
+    @classmethod
+    def none(cls, **options) -> 'CachePolicy':
+        return cls(members=False, messages=False, presences=False, voice_states=False, emojis=False, **options)
+
+
+def _sizeof(obj: Any, seen: Set[int], skip: frozenset = frozenset()) -> int:
+    """Deep size of an object in bytes, counting shared objects once"""
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_sizeof(key, seen) + _sizeof(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_sizeof(item, seen) for item in obj)
+    elif isinstance(obj, Model):
+        for name in obj._attributes:
+            if name in skip:
+                continue
+            try:
+                # Bypass __getattr__ so lazy models aren't parsed just to be measured
+                value = object.__getattribute__(obj, name)
+            except AttributeError:
+                continue
+            size += _sizeof(value, seen)
+    return size
+
+
+class MessageCache:
+    """Bounded LRU cache of messages by id.
+
+    Holds at most `max_size` messages overall and, if set, `max_per_channel`
+    per channel, evicting the least recently used first. Lookups through
+    `get` and `remove` count as hits or misses.
+    """
+
+    def __init__(self, max_size: int = 1000, max_per_channel: Optional[int] = None):
+        self.max_size = max_size
+        self.max_per_channel = max_per_channel
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._messages: 'OrderedDict[int, Message]' = OrderedDict()
+        self._channels: Dict[int, 'OrderedDict[int, None]'] = {}
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __contains__(self, message_id) -> bool:
+        return int(message_id) in self._messages
+
+    def values(self):
+        return self._messages.values()
+
+    def add(self, message: Message) -> None:
+        if self.max_size <= 0:
+            return
+
+        channel = self._channels.setdefault(message.channel_id, OrderedDict())
+        self._messages[message.id] = message
+        self._messages.move_to_end(message.id)
+        channel[message.id] = None
+        channel.move_to_end(message.id)
+
+        if self.max_per_channel is not None and len(channel) > self.max_per_channel:
+            self._evict(next(iter(channel)))
+        if len(self._messages) > self.max_size:
+            self._evict(next(iter(self._messages)))
+
+    def get(self, message_id) -> Optional[Message]:
+        message_id = int(message_id)
+        message = self._messages.get(message_id)
+        if message is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._touch(message)
+        return message
+
+    def remove(self, message_id) -> Optional[Message]:
+        """Drop a message, returning it if it was cached"""
+        message = self._pop(int(message_id))
+        if message is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return message
+
+    def remove_channel(self, channel_id: int) -> None:
+        for message_id in list(self._channels.get(channel_id, ())):
+            self._pop(message_id)
+
+    def remove_guild(self, guild_id: int) -> None:
+        for message_id in [message.id for message in self._messages.values() if message.guild_id == guild_id]:
+            self._pop(message_id)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._messages),
+            'max_size': self.max_size,
+            'channels': len(self._channels),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else None
+        }
+
+    def _touch(self, message: Message) -> None:
+        self._messages.move_to_end(message.id)
+        self._channels[message.channel_id].move_to_end(message.id)
+
+    def _evict(self, message_id: int) -> None:
+        self._pop(message_id)
+        self.evictions += 1
+
+    def _pop(self, message_id: int) -> Optional[Message]:
+        message = self._messages.pop(message_id, None)
+        if message is not None:
+            channel = self._channels[message.channel_id]
+            del channel[message_id]
+            if not channel:
+                del self._channels[message.channel_id]
+        return message
+
+
+class ConnectionState:
+    """The client's cache of guilds and their entities, filled from gateway events"""
+
+    def __init__(self, client, policy: Optional[CachePolicy] = None):
+        self.client = client
+        self.policy = policy or CachePolicy()
+        self.guilds: Dict[int, Guild] = {}
+        # Users are shared by every member, message and mention that refers to
+        # them, and dropped once nothing does
+        self.users: 'weakref.WeakValueDictionary[int, User]' = weakref.WeakValueDictionary()
+        self.messages = MessageCache(self.policy.max_messages, self.policy.max_messages_per_channel)
+        # Guilds loaded from a snapshot that the gateway has not vouched for yet
+        self.snapshot_guilds: Set[int] = set()
+
+    def enabled(self, store: str) -> bool:
+        """Whether a store is both enabled and fed by one of the client's intents"""
+        return bool(getattr(self.policy, store) and self.client.intents & self.policy.intents[store])
+
+    def cache_events(self) -> Set[str]:
+        """Gateway events that must be parsed to keep the enabled stores current"""
+        events = set(BASE_EVENTS)
+        for store, store_events in STORE_EVENTS.items():
+            if self.enabled(store):
+                events |= store_events
+            elif getattr(self.policy, store):
+                logger.debug(f"The {store} cache is enabled but none of its intents are")
+        return events
+
+    def _strip_disabled(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        dropped = [store for store in PAYLOAD_STORES if store in data and not self.enabled(store)]
+        if not dropped:
+            return data
+        return {key: value for key, value in data.items() if key not in dropped}
+
+    def create_guild(self, data: Dict[str, Any], shard_id: int) -> Guild:
+        guild = Guild(self.client, self._strip_disabled(data))
+        guild.shard_id = shard_id
+        self.guilds[guild.id] = guild
+        return guild
+
+    def update_guild(self, guild: Guild, data: Dict[str, Any]) -> None:
+        guild._update(self._strip_disabled(data))
+
+    def get_guild(self, guild_id) -> Optional[Guild]:
+        return self.guilds.get(int(guild_id))
+
+    def remove_guild(self, guild_id) -> Optional[Guild]:
+        guild = self.guilds.pop(int(guild_id), None)
+        if guild is not None:
+            self.messages.remove_guild(guild.id)
+        return guild
+
+    def _snapshot_guilds_on(self, shard_id: int, shard_count: int) -> Set[int]:
+        return {guild_id for guild_id in self.snapshot_guilds if (guild_id >> 22) % shard_count == shard_id}
+
+    def confirm_snapshot_guilds(self, shard_id: int, shard_count: int) -> None:
+        """A resumed session replays what was missed, so a shard's snapshot guilds are current"""
+        self.snapshot_guilds -= self._snapshot_guilds_on(shard_id, shard_count)
+
+    def drop_stale_guilds(self, shard_id: int, shard_count: int, listed: Set[int]) -> List[Guild]:
+        """Remove a shard's snapshot guilds that a fresh READY did not list"""
+        marked = self._snapshot_guilds_on(shard_id, shard_count)
+        self.snapshot_guilds -= marked
+        stale = [self.remove_guild(guild_id) for guild_id in marked - listed]
+        return [guild for guild in stale if guild is not None]
+
+    def store_message(self, message: Message) -> None:
+        feeding = self.policy.intents['messages']
+        intent = Intents.GUILD_MESSAGES if message.guild_id is not None else Intents.DIRECT_MESSAGES
+        if not self.policy.messages or not self.client.intents & feeding & intent:
+            return
+
+        self.messages.add(message)
+
+    def store_user(self, data: Dict[str, Any]) -> User:
+        """Return the interned User for a payload, updating it in place if already known"""
+        user_id = int(data['id'])
+        user = self.users.get(user_id)
+        if user is None:
+            user = User(self.client, data)
+            self.users[user_id] = user
+        else:
+            user._update(data)
+        return user
+
+    def get_user(self, user_id) -> Optional[User]:
+        return self.users.get(int(user_id))
+
+    def get_message(self, message_id) -> Optional[Message]:
+        return self.messages.get(int(message_id))
+
+    def entry_counts(self) -> Dict[str, int]:
+        """Number of cached entries per store"""
+        counts = {'guilds': len(self.guilds)}
+        for store in GUILD_STORES:
+            counts[store] = sum(len(getattr(guild, store)) for guild in self.guilds.values())
+        counts['messages'] = len(self.messages)
+        counts['users'] = len(self.users)
+        return counts
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Approximate bytes held by each store.
+
+        Walks every cached object, so it is meant for occasional inspection
+        rather than frequent polling. Objects shared between stores are
+        counted in the first store that reaches them.
+        """
+        seen: Set[int] = set()
+        skip = frozenset(GUILD_STORES)
+
+        usage = {'guilds': sys.getsizeof(self.guilds) + sum(_sizeof(guild, seen, skip) for guild in self.guilds.values())}
+        for store in GUILD_STORES:
+            usage[store] = sum(_sizeof(getattr(guild, store), seen) for guild in self.guilds.values())
+        usage['messages'] = _sizeof(self.messages._messages, seen)
+        # Users are reached through the members and messages above; this is whatever's left
+        usage['users'] = sum(_sizeof(user, seen) for user in list(self.users.values()))
+        return usage
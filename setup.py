@@ -26,4 +26,7 @@ setup(
     install_requires=[
         "aiohttp>=3.7.4",
     ],
+    extras_require={
+        "speed": ["orjson>=3.6"],
+    },
 )
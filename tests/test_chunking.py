@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from harmony import Client
+from harmony.enums import Intents
+from harmony.state import CachePolicy
+
+
+def test_chunk_guilds_needs_the_members_intent():
+    with pytest.raises(ValueError):
+        Client(intents=Intents.GUILDS, chunk_guilds='startup')
+
+
+def test_chunk_guilds_needs_the_members_cache():
+    with pytest.raises(ValueError):
+        Client(intents=Intents.GUILDS | Intents.GUILD_MEMBERS, chunk_guilds='lazy',
+               cache=CachePolicy(members=False))
+
+
+def test_startup_chunking_failure_is_logged_not_raised(caplog):
+    client = Client(intents=Intents.GUILDS | Intents.GUILD_MEMBERS, chunk_guilds='startup')
+    client.intents = Intents.GUILDS
+
+    async def main():
+        await client._handle_dispatch('GUILD_CREATE', {'id': '290926798626357250', 'name': 'large',
+                                                       'large': True, 'member_count': 5000}, 0)
+
+    asyncio.run(main())
+    assert client.get_guild('290926798626357250') is not None
+    assert client.chunker.pending == 0
+    assert 'Failed to handle GUILD_CREATE on shard 0' in caplog.text
+
+
+def test_member_update_does_not_start_a_lazy_chunk():
+    client = Client(intents=Intents.GUILDS | Intents.GUILD_MEMBERS, chunk_guilds='lazy')
+    guild = client.state.create_guild({'id': '290926798626357250', 'name': 'guild'}, 0)
+
+    async def main():
+        await client.parse_guild_member_update({'guild_id': str(guild.id), 'roles': [],
+                                                'user': {'id': '80351110224678912', 'username': 'member'}}, 0)
+        assert client.chunker.pending == 0
+
+        # A lookup from user code still does
+        assert guild.get_member('53908232506183680') is None
+        assert client.chunker.pending == 1
+        client.chunker._sender.cancel()
+
+    asyncio.run(main())
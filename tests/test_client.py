@@ -0,0 +1,65 @@
+import asyncio
+import logging
+
+from harmony import Bot, InteractionHandler
+from harmony.enums import Intents
+
+MODAL_SUBMIT = {
+    'id': '1', 'application_id': '2', 'token': 'token', 'type': 5,
+    'data': {'custom_id': 'feedback', 'components': [
+        {'type': 1, 'components': [{'type': 4, 'custom_id': 'comment', 'value': 'great'}]}
+    ]}
+}
+
+
+def test_modal_submit_fires_once_with_typed_arguments(caplog):
+    bot = Bot(command_prefix='!')
+    InteractionHandler(bot)
+    submitted = []
+
+    @bot.event
+    async def modal_submit(ctx, custom_id, values):
+        submitted.append((custom_id, values))
+
+    async def main():
+        await bot._handle_dispatch('INTERACTION_CREATE', MODAL_SUBMIT, 0)
+        await bot.events.join()
+
+    with caplog.at_level(logging.ERROR, logger='harmony'):
+        asyncio.run(main())
+    assert submitted == [('feedback', {'comment': 'great'})]
+    assert not caplog.records
+
+
+def test_component_interaction_fires_once():
+    bot = Bot(command_prefix='!')
+    InteractionHandler(bot)
+    clicked = []
+
+    @bot.event
+    async def component_interaction(ctx, custom_id, component_type):
+        clicked.append(custom_id)
+
+    async def main():
+        await bot._handle_dispatch('INTERACTION_CREATE', dict(MODAL_SUBMIT, type=3, data={
+            'custom_id': 'confirm', 'component_type': 2
+        }), 0)
+        await bot.events.join()
+
+    asyncio.run(main())
+    assert clicked == ['confirm']
+
+
+def test_parser_error_is_logged_not_raised(caplog):
+    bot = Bot(command_prefix='!', intents=Intents.GUILD_MESSAGES)
+
+    @bot.event
+    async def raw_bulk_message_delete(data):
+        pass
+
+    async def main():
+        # MESSAGE_DELETE_BULK without its ids
+        await bot._handle_dispatch('MESSAGE_DELETE_BULK', {'channel_id': '1'}, 3)
+
+    asyncio.run(main())
+    assert 'Failed to handle MESSAGE_DELETE_BULK on shard 3' in caplog.text
@@ -0,0 +1,59 @@
+import asyncio
+from types import SimpleNamespace
+
+from harmony.cluster import IPCHub, IPCBus, _IPCIdentifyLimiter
+
+
+async def connect_clusters(hub, count, **options):
+    host, port = await hub.start()
+    limiters = []
+    for cluster_id in range(count):
+        bus = IPCBus(SimpleNamespace(guilds={}), cluster_id, host, port)
+        await bus.connect()
+        limiters.append(_IPCIdentifyLimiter(bus, **options))
+    # Let the hub register every cluster
+    await asyncio.sleep(0.05)
+    return limiters
+
+
+def test_identify_falls_back_when_the_hub_dies():
+    async def main():
+        hub = IPCHub()
+        first, second = await connect_clusters(hub, 2)
+        await first.wait(0)
+
+        waiting = asyncio.create_task(second.wait(2))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+
+        await hub.close()
+        await asyncio.wait_for(waiting, 1)
+        second.release(2)
+
+        for limiter in (first, second):
+            await limiter.bus.close()
+
+    asyncio.run(main())
+
+
+def test_identify_wait_times_out_and_returns_a_late_grant():
+    async def main():
+        hub = IPCHub()
+        first, second = await connect_clusters(hub, 2, timeout=0.1)
+        await first.wait(0)
+
+        # Falls back to the local limiter instead of waiting on the held slot forever
+        await asyncio.wait_for(second.wait(2), 1)
+        second.release(2, sent=False)
+
+        # The hub grants the abandoned request once the slot is free; it must come straight back
+        first.release(0, sent=False)
+        await asyncio.sleep(0.05)
+        await asyncio.wait_for(first.bus.wait_identify(0), 1)
+        assert hub._held == {0: [0], 1: []}
+
+        for limiter in (first, second):
+            await limiter.bus.close()
+        await hub.close()
+
+    asyncio.run(main())
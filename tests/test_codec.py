@@ -0,0 +1,22 @@
+import json
+
+import pytest
+
+from harmony import codec
+
+
+@pytest.mark.parametrize('frame', [
+    '{"t":"MESSAGE_CREATE","s":42,"op":0,"d":{"content":"hi"}}',
+    b'{"t":"MESSAGE_CREATE","s":42,"op":0,"d":{"content":"hi"}}',
+    json.dumps({'op': 0, 's': 42, 't': 'MESSAGE_CREATE', 'd': {'content': 'hi'}}),
+])
+def test_peek_dispatch_reads_the_envelope(frame):
+    assert codec.peek_dispatch(frame) == ('MESSAGE_CREATE', 42)
+
+
+@pytest.mark.parametrize('frame', [
+    '{"t":null,"s":null,"op":11,"d":null}',
+    '{"t":null,"s":null,"op":10,"d":{"heartbeat_interval":41250}}',
+])
+def test_peek_dispatch_ignores_other_opcodes(frame):
+    assert codec.peek_dispatch(frame) is None
@@ -0,0 +1,211 @@
+import asyncio
+
+import pytest
+
+from harmony.events import EventDispatcher
+
+
+def test_ordered_dispatch_keeps_guild_order():
+    async def main():
+        dispatcher = EventDispatcher(max_concurrency=4, ordered=True, slow_threshold=None)
+        seen = []
+
+        async def listener(payload):
+            await asyncio.sleep(0.01 * (5 - payload['n']))
+            seen.append((payload['guild_id'], payload['n']))
+
+        dispatcher.add_listener('message', listener)
+        for n in range(5):
+            for guild_id in ('1', '2'):
+                await dispatcher.dispatch('message', {'guild_id': guild_id, 'n': n})
+        await dispatcher.join()
+
+        for guild_id in ('1', '2'):
+            assert [n for guild, n in seen if guild == guild_id] == list(range(5))
+
+    asyncio.run(main())
+
+
+def test_slow_guild_does_not_stall_other_guilds():
+    async def main():
+        dispatcher = EventDispatcher(max_concurrency=4, ordered=True, slow_threshold=None)
+        loop = asyncio.get_running_loop()
+        handled = {}
+
+        async def listener(payload):
+            if payload['guild_id'] == 'slow':
+                await asyncio.sleep(0.2)
+            handled.setdefault(payload['guild_id'], loop.time())
+
+        dispatcher.add_listener('message', listener)
+        for _ in range(6):
+            await dispatcher.dispatch('message', {'guild_id': 'slow'})
+
+        start = loop.time()
+        await dispatcher.dispatch('message', {'guild_id': 'fast'})
+        assert loop.time() - start < 0.05
+        await asyncio.sleep(0.05)
+        assert handled['fast'] - start < 0.05
+        # The slow guild holds a single slot however many events it has queued
+        assert dispatcher.in_flight == 1
+
+        await dispatcher.join()
+
+    asyncio.run(main())
+
+
+def test_awaiting_listener_is_not_reported_as_slow(caplog):
+    async def main():
+        dispatcher = EventDispatcher(slow_threshold=0.05)
+
+        async def listener(payload):
+            # Waiting on I/O takes wall time without blocking the loop
+            await asyncio.sleep(0.1)
+
+        dispatcher.add_listener('message', listener)
+        await dispatcher.dispatch('message', {'guild_id': '1'})
+        await dispatcher.join()
+        dispatcher.monitor.stop()
+
+        assert dispatcher.listener_latency[('message', listener.__qualname__)].count == 1
+
+    with caplog.at_level('WARNING', logger='harmony'):
+        asyncio.run(main())
+    assert not caplog.records
+
+
+def test_full_pool_backlogs_then_drops_without_waiting(caplog):
+    async def main():
+        dispatcher = EventDispatcher(max_concurrency=2, slow_threshold=None, max_backlog=3)
+        release = asyncio.Event()
+        seen = []
+
+        async def listener(payload):
+            await release.wait()
+            seen.append(payload['n'])
+
+        dispatcher.add_listener('message', listener)
+        for n in range(8):
+            await asyncio.wait_for(dispatcher.dispatch('message', {'n': n}), 0.1)
+
+        assert (dispatcher.in_flight, dispatcher.backlog, dispatcher.dropped) == (2, 3, 3)
+        release.set()
+        await dispatcher.join()
+        assert sorted(seen) == [0, 1, 2, 3, 4]
+        assert dispatcher.stats()['dropped'] == 3
+
+    asyncio.run(main())
+    assert "Listener backlog is full" in caplog.text
+
+
+def test_wait_for_keyed_match_runs_only_its_checks():
+    async def main():
+        dispatcher = EventDispatcher(slow_threshold=None)
+        checked = []
+
+        def check(message):
+            checked.append(message['content'])
+            return True
+
+        waiter = asyncio.create_task(dispatcher.wait_for('message', check, channel_id='1'))
+        await asyncio.sleep(0)
+
+        await dispatcher.dispatch('message', {'channel_id': '2', 'content': 'elsewhere'})
+        await dispatcher.dispatch('message', {'channel_id': '1', 'content': 'here'})
+
+        assert (await waiter)['content'] == 'here'
+        # The other channel's message never reached the check
+        assert checked == ['here']
+        assert not dispatcher._keyed_waiters
+
+    asyncio.run(main())
+
+
+def test_wait_for_check_error_reaches_the_waiter():
+    async def main():
+        dispatcher = EventDispatcher(slow_threshold=None)
+
+        def check(message):
+            raise KeyError('author')
+
+        waiter = asyncio.create_task(dispatcher.wait_for('message', check, channel_id='1'))
+        await asyncio.sleep(0)
+        await dispatcher.dispatch('message', {'channel_id': '1'})
+
+        with pytest.raises(KeyError):
+            await waiter
+        assert not dispatcher._keyed_waiters
+
+    asyncio.run(main())
+
+
+def test_wait_for_timeout_and_cancel_clean_up_the_index():
+    async def main():
+        dispatcher = EventDispatcher(slow_threshold=None)
+
+        with pytest.raises(asyncio.TimeoutError):
+            await dispatcher.wait_for('message', timeout=0.01, channel_id='1', user_id='2')
+        assert not dispatcher._keyed_waiters
+        assert not dispatcher.has_listeners('message')
+
+        waiter = asyncio.create_task(dispatcher.wait_for('reaction_add', custom_id='confirm'))
+        unkeyed = asyncio.create_task(dispatcher.wait_for('reaction_add'))
+        await asyncio.sleep(0)
+        assert dispatcher.has_listeners('reaction_add')
+
+        waiter.cancel()
+        unkeyed.cancel()
+        await asyncio.gather(waiter, unkeyed, return_exceptions=True)
+        assert not dispatcher._keyed_waiters
+        assert not dispatcher._waiters
+
+    asyncio.run(main())
+
+
+def test_coalesced_listener_batches_each_burst():
+    async def main():
+        dispatcher = EventDispatcher(slow_threshold=None)
+        batches = []
+
+        async def reactions(payloads):
+            batches.append([payload['n'] for payload in payloads])
+
+        dispatcher.add_coalesced_listener('raw_reaction_add', reactions, window=0.05, key='message_id')
+        for n in range(5):
+            await dispatcher.dispatch('raw_reaction_add', {'message_id': '1', 'n': n})
+        await dispatcher.dispatch('raw_reaction_add', {'message_id': '2', 'n': 5})
+
+        await asyncio.sleep(0.1)
+        await dispatcher.join()
+        # One call per key per burst, holding every event in order
+        assert sorted(batches) == [[0, 1, 2, 3, 4], [5]]
+
+        for n in range(6, 8):
+            await dispatcher.dispatch('raw_reaction_add', {'message_id': '1', 'n': n})
+        await asyncio.sleep(0.1)
+        await dispatcher.join()
+        assert batches[-1] == [6, 7]
+        assert len(batches) == 3
+
+    asyncio.run(main())
+
+
+def test_coalesced_listener_flushes_a_full_batch_early():
+    async def main():
+        dispatcher = EventDispatcher(slow_threshold=None)
+        batches = []
+
+        async def reactions(payloads):
+            batches.append(len(payloads))
+
+        listener = dispatcher.add_coalesced_listener('raw_reaction_add', reactions, window=10, max_size=3)
+        for n in range(4):
+            await dispatcher.dispatch('raw_reaction_add', {'guild_id': '1', 'n': n})
+        await dispatcher.join()
+        assert batches == [3]
+
+        listener.flush()
+        await dispatcher.join()
+        assert batches == [3, 1]
+
+    asyncio.run(main())
@@ -0,0 +1,385 @@
+import asyncio
+import json
+from typing import Dict, Optional
+from types import SimpleNamespace
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from harmony import Client
+from harmony.enums import Intents
+from harmony.events import EventDispatcher
+from harmony.gateway import GatewayConnection, ExponentialBackoff, ConnectionClosed, IdentifyLimiter
+
+
+class FakeGateway:
+    """Local websocket server speaking just enough of the gateway protocol.
+
+    `script(gateway, ws, index)` drives connection number `index`. Heartbeats
+    are ACKed automatically unless `ack` is False, and every other payload
+    the client sends is kept in `received[index]`. `hello_delays` holds
+    seconds to wait before sending HELLO, by connection number.
+    """
+
+    def __init__(self, script, heartbeat_interval: int = 45000, ack: bool = True,
+                 hello_delays: Optional[Dict[int, float]] = None):
+        self.script = script
+        self.heartbeat_interval = heartbeat_interval
+        self.ack = ack
+        self.hello_delays = hello_delays or {}
+        self.received = []
+        self._inboxes = []
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_get('/', self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        self.url = f"http://127.0.0.1:{self._runner.addresses[0][1]}"
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._runner.cleanup()
+
+    async def _handle(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        index = len(self.received)
+        self.received.append([])
+        inbox = asyncio.Queue()
+        self._inboxes.append(inbox)
+
+        async def read():
+            async for msg in ws:
+                payload = json.loads(msg.data)
+                if payload['op'] == 1:
+                    if self.ack:
+                        await ws.send_json({'op': 11})
+                    continue
+                self.received[index].append(payload)
+                await inbox.put(payload)
+
+        reader = asyncio.create_task(read())
+        await asyncio.sleep(self.hello_delays.get(index, 0))
+        await ws.send_json({'op': 10, 'd': {'heartbeat_interval': self.heartbeat_interval}})
+        script = asyncio.create_task(self.script(self, ws, index))
+        try:
+            # The client may hang up before the script is done with it
+            await asyncio.wait({reader, script}, return_when=asyncio.FIRST_COMPLETED)
+            if script.done():
+                script.result()
+                await reader
+        finally:
+            reader.cancel()
+            script.cancel()
+        return ws
+
+    async def expect(self, index: int, op: int, timeout: float = 5.0):
+        """Wait for the next non-heartbeat payload on a connection and check its opcode"""
+        payload = await asyncio.wait_for(self._inboxes[index].get(), timeout)
+        assert payload['op'] == op, payload
+        return payload
+
+    async def ready(self, ws, sequence: int = 1, session_id: str = 'session'):
+        await ws.send_json({'op': 0, 's': sequence, 't': 'READY', 'd': {
+            'session_id': session_id, 'resume_gateway_url': self.url
+        }})
+
+
+def fake_client(session):
+    dispatched = []
+
+    async def handle_dispatch(event_name, data, shard_id):
+        dispatched.append(event_name)
+
+    return SimpleNamespace(token='token', intents=0, session=session, dispatched=dispatched,
+                           _allowed_events=lambda: None, _handle_dispatch=handle_dispatch)
+
+
+def connection_for(client, gateway, **options):
+    connection = GatewayConnection(client, gateway.url, **options)
+    connection._backoff = ExponentialBackoff(base=0.01, maximum=0.05)
+    return connection
+
+
+async def run_until(connection, condition, timeout: float = 5.0):
+    """Run a connection until `condition()` holds, then close it"""
+    task = asyncio.create_task(connection.run())
+    try:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not condition():
+            assert not task.done(), task.exception()
+            assert loop.time() < deadline, "condition not reached"
+            await asyncio.sleep(0.01)
+    finally:
+        await connection.close()
+        await asyncio.wait_for(task, timeout)
+
+
+def test_send_racing_a_close_reconnects():
+    async def script(gateway, ws, index):
+        await gateway.expect(index, 2)
+        await gateway.ready(ws)
+
+    async def main():
+        async with FakeGateway(script) as gateway, aiohttp.ClientSession() as session:
+            client = fake_client(session)
+            connection = connection_for(client, gateway)
+
+            identify = connection.identify
+
+            async def identify_after_close():
+                # The zombie check closes the socket while IDENTIFY is still queued
+                if len(gateway.received) == 1:
+                    await connection.ws.close(code=4000)
+                await identify()
+
+            connection.identify = identify_after_close
+            await run_until(connection, lambda: 'READY' in client.dispatched)
+            assert len(gateway.received) == 2
+
+    asyncio.run(main())
+
+
+def test_fatal_close_code_escapes():
+    async def script(gateway, ws, index):
+        await gateway.expect(index, 2)
+        await ws.close(code=4004)
+
+    async def main():
+        async with FakeGateway(script) as gateway, aiohttp.ClientSession() as session:
+            connection = connection_for(fake_client(session), gateway)
+            with pytest.raises(ConnectionClosed) as info:
+                await asyncio.wait_for(connection.run(), 5)
+            assert info.value.code == 4004
+
+    asyncio.run(main())
+
+
+def test_identify_wait_keeps_heartbeats_acked():
+    identified = []
+
+    async def script(gateway, ws, index):
+        await gateway.expect(index, 2)
+        identified.append(asyncio.get_running_loop().time())
+        await gateway.ready(ws, session_id=f'session-{index}')
+
+    async def main():
+        async with FakeGateway(script, heartbeat_interval=50) as gateway, aiohttp.ClientSession() as session:
+            limiter = IdentifyLimiter(interval=0.3)
+            clients = [fake_client(session) for _ in range(2)]
+            connections = [connection_for(client, gateway, shard_id=shard_id, shard_count=2,
+                                          identify_limiter=limiter)
+                           for shard_id, client in enumerate(clients)]
+
+            await asyncio.gather(*(run_until(connection, lambda client=client: 'READY' in client.dispatched)
+                                   for connection, client in zip(connections, clients)))
+
+            # The second shard waited its turn without being closed as a zombie
+            assert len(gateway.received) == 2
+            assert identified[1] - identified[0] >= 0.25
+
+    asyncio.run(main())
+
+
+def test_identify_spacing_runs_from_the_send():
+    identified = []
+
+    async def script(gateway, ws, index):
+        await gateway.expect(index, 2)
+        identified.append(asyncio.get_running_loop().time())
+        await gateway.ready(ws, session_id=f'session-{index}')
+
+    async def main():
+        # A slow HELLO on the first connection must not eat into the second shard's wait
+        async with FakeGateway(script, hello_delays={0: 0.3}) as gateway, aiohttp.ClientSession() as session:
+            limiter = IdentifyLimiter(interval=0.3)
+            clients = [fake_client(session) for _ in range(2)]
+            connections = [connection_for(client, gateway, shard_id=shard_id, shard_count=2,
+                                          identify_limiter=limiter)
+                           for shard_id, client in enumerate(clients)]
+
+            await asyncio.gather(*(run_until(connection, lambda client=client: 'READY' in client.dispatched)
+                                   for connection, client in zip(connections, clients)))
+            assert identified[1] - identified[0] >= 0.25
+
+    asyncio.run(main())
+
+
+def test_resumes_after_a_drop():
+    async def script(gateway, ws, index):
+        if index == 0:
+            await gateway.expect(index, 2)
+            await gateway.ready(ws)
+            await ws.send_json({'op': 0, 's': 2, 't': 'MESSAGE_CREATE', 'd': {}})
+            await asyncio.sleep(0.05)
+            await ws.close(code=1011)
+        else:
+            resume = await gateway.expect(index, 6)
+            assert resume['d'] == {'token': 'token', 'session_id': 'session', 'seq': 2}
+            await ws.send_json({'op': 0, 's': 3, 't': 'RESUMED', 'd': {}})
+
+    async def main():
+        async with FakeGateway(script) as gateway, aiohttp.ClientSession() as session:
+            client = fake_client(session)
+            await run_until(connection_for(client, gateway), lambda: 'RESUMED' in client.dispatched)
+            assert client.dispatched == ['READY', 'MESSAGE_CREATE', 'RESUMED']
+
+    asyncio.run(main())
+
+
+def test_reconnect_request_resumes():
+    async def script(gateway, ws, index):
+        if index == 0:
+            await gateway.expect(index, 2)
+            await gateway.ready(ws)
+            await ws.send_json({'op': 7, 'd': None})
+        else:
+            await gateway.expect(index, 6)
+            await ws.send_json({'op': 0, 's': 2, 't': 'RESUMED', 'd': {}})
+
+    async def main():
+        async with FakeGateway(script) as gateway, aiohttp.ClientSession() as session:
+            client = fake_client(session)
+            await run_until(connection_for(client, gateway), lambda: 'RESUMED' in client.dispatched)
+            assert len(gateway.received) == 2
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize('resumable, reply_op', [(False, 2), (True, 6)])
+def test_invalid_session(monkeypatch, resumable, reply_op):
+    monkeypatch.setattr('harmony.gateway.random.uniform', lambda low, high: 0.0)
+
+    async def script(gateway, ws, index):
+        if index == 0:
+            await gateway.expect(index, 2)
+            await gateway.ready(ws)
+            await ws.send_json({'op': 9, 'd': resumable})
+        else:
+            # A non-resumable session must IDENTIFY again, a resumable one RESUMEs
+            await gateway.expect(index, reply_op)
+            await gateway.ready(ws, sequence=2, session_id='second')
+
+    async def main():
+        async with FakeGateway(script) as gateway, aiohttp.ClientSession() as session:
+            client = fake_client(session)
+            await run_until(connection_for(client, gateway), lambda: client.dispatched.count('READY') == 2)
+
+    asyncio.run(main())
+
+
+def test_zombie_connection_is_replaced():
+    async def script(gateway, ws, index):
+        if index == 0:
+            await gateway.expect(index, 2)
+            await gateway.ready(ws)
+            # Never ACK a heartbeat; the client must give up on this connection
+            gateway.ack = False
+        else:
+            gateway.ack = True
+            await gateway.expect(index, 6)
+            await ws.send_json({'op': 0, 's': 2, 't': 'RESUMED', 'd': {}})
+
+    async def main():
+        async with FakeGateway(script, heartbeat_interval=50) as gateway, aiohttp.ClientSession() as session:
+            client = fake_client(session)
+            await run_until(connection_for(client, gateway), lambda: 'RESUMED' in client.dispatched)
+            assert len(gateway.received) == 2
+
+    asyncio.run(main())
+
+
+def test_saturated_listener_pool_keeps_heartbeats_acked():
+    done = []
+
+    async def script(gateway, ws, index):
+        await gateway.expect(index, 2)
+        await gateway.ready(ws)
+        for sequence in range(2, 22):
+            await ws.send_json({'op': 0, 's': sequence, 't': 'MESSAGE_CREATE', 'd': {'n': sequence}})
+        # Several heartbeat intervals with every listener slot taken
+        await asyncio.sleep(0.5)
+        done.append(True)
+        await asyncio.sleep(5)
+
+    async def main():
+        async with FakeGateway(script, heartbeat_interval=50) as gateway, aiohttp.ClientSession() as session:
+            release = asyncio.Event()
+            events = EventDispatcher(max_concurrency=1, slow_threshold=None, max_backlog=5)
+
+            async def listener(data):
+                await release.wait()
+
+            events.add_listener('message', listener)
+
+            async def handle_dispatch(event_name, data, shard_id):
+                if event_name == 'MESSAGE_CREATE':
+                    await events.dispatch('message', data)
+
+            client = fake_client(session)
+            client._handle_dispatch = handle_dispatch
+            connection = connection_for(client, gateway)
+            await run_until(connection, lambda: done)
+
+            assert len(gateway.received) == 1
+            assert connection.sequence == 21
+            assert (events.in_flight, events.backlog, events.dropped) == (1, 5, 14)
+
+            release.set()
+            await events.join()
+
+    asyncio.run(main())
+
+
+def test_unwanted_events_are_skipped_and_still_sequenced():
+    reaction = {'user_id': '1', 'channel_id': '2', 'message_id': '3', 'emoji': {'name': '👍'}}
+
+    async def script(gateway, ws, index):
+        if index == 0:
+            await gateway.expect(index, 2)
+            await ws.send_json({'op': 0, 's': 1, 't': 'READY', 'd': {
+                'session_id': 'session', 'resume_gateway_url': gateway.url,
+                'user': {'id': '80351110224678912', 'username': 'harmony'}, 'guilds': []
+            }})
+            await ws.send_json({'op': 0, 's': 2, 't': 'MESSAGE_REACTION_REMOVE', 'd': reaction})
+            await ws.send_json({'op': 0, 's': 3, 't': 'MESSAGE_REACTION_ADD', 'd': reaction})
+            await ws.send_json({'op': 0, 's': 4, 't': 'MESSAGE_REACTION_REMOVE', 'd': reaction})
+            await asyncio.sleep(0.05)
+            await ws.close(code=1011)
+        else:
+            # The skipped frames still count towards the sequence RESUME replays from
+            resume = await gateway.expect(index, 6)
+            assert resume['d']['seq'] == 4
+            await ws.send_json({'op': 0, 's': 5, 't': 'RESUMED', 'd': {}})
+
+    async def main():
+        async with FakeGateway(script) as gateway, aiohttp.ClientSession() as session:
+            client = Client(intents=Intents.GUILDS | Intents.GUILD_MESSAGE_REACTIONS)
+            client.token, client.session = 'token', session
+            added, handled = [], []
+
+            @client.event
+            async def raw_reaction_add(data):
+                added.append(data)
+
+            handle_dispatch = client._handle_dispatch
+
+            async def record_dispatch(event_name, data, shard_id=0):
+                handled.append(event_name)
+                await handle_dispatch(event_name, data, shard_id)
+
+            client._handle_dispatch = record_dispatch
+            connection = client._connection = connection_for(client, gateway)
+            await run_until(connection, lambda: 'RESUMED' in handled)
+            await client.events.join()
+
+            assert handled == ['READY', 'MESSAGE_REACTION_ADD', 'RESUMED']
+            assert added == [reaction]
+            assert connection.events_skipped == 2
+
+    asyncio.run(main())
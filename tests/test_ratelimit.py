@@ -0,0 +1,210 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from aiohttp import web
+
+from harmony.ratelimit import RateLimiter, route_key
+from harmony.rest import RESTClient, RetryPolicy
+
+CHANNEL = '111111111111111111'
+OTHER_CHANNEL = '222222222222222222'
+MESSAGE = '333333333333333333'
+
+
+class MockAPI:
+    """Local HTTP server standing in for the Discord API, recording every hit"""
+
+    def __init__(self, *routes):
+        self.routes = routes
+        self.hits = []
+
+    async def __aenter__(self):
+        app = web.Application()
+        for method, path, handler in self.routes:
+            app.router.add_route(method, path, self._recorded(handler))
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+
+        self.rest = RESTClient(SimpleNamespace(token='token'), retry=RetryPolicy(base=0.01, maximum=0.05))
+        self.rest.base_url = f"http://127.0.0.1:{self._runner.addresses[0][1]}"
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.rest.close()
+        await self._runner.cleanup()
+
+    def _recorded(self, handler):
+        async def handle(request):
+            self.hits.append((request.path, asyncio.get_running_loop().time()))
+            return await handler(request)
+        return handle
+
+
+class WindowedLimit:
+    """A fixed-window limit per channel that answers with Discord's rate limit headers"""
+
+    def __init__(self, limit: int = 5, per: float = 0.5):
+        self.limit = limit
+        self.per = per
+        self.windows = {}
+        self.rejected = 0
+
+    async def __call__(self, request):
+        now = asyncio.get_running_loop().time()
+        channel = request.match_info['channel']
+        reset_at, remaining = self.windows.get(channel, (0.0, 0))
+        if now >= reset_at:
+            reset_at, remaining = now + self.per, self.limit
+
+        headers = {'X-RateLimit-Limit': str(self.limit), 'X-RateLimit-Bucket': 'reactions',
+                   'X-RateLimit-Reset-After': f"{reset_at - now:.3f}"}
+        if remaining == 0:
+            self.rejected += 1
+            headers.update({'X-RateLimit-Remaining': '0', 'Retry-After': f"{reset_at - now:.3f}"})
+            return web.json_response({'message': 'You are being rate limited.', 'retry_after': reset_at - now,
+                                      'global': False}, status=429, headers=headers)
+
+        self.windows[channel] = (reset_at, remaining - 1)
+        headers['X-RateLimit-Remaining'] = str(remaining - 1)
+        return web.Response(status=204, headers=headers)
+
+
+def test_route_key():
+    assert route_key('GET', f'/channels/{CHANNEL}/messages/{MESSAGE}') == \
+        ('GET /channels/{major}/messages/{id}', CHANNEL)
+    assert route_key('PUT', f'/channels/{CHANNEL}/messages/{MESSAGE}/reactions/%F0%9F%91%8D/@me') == \
+        ('PUT /channels/{major}/messages/{id}/reactions/{emoji}/@me', CHANNEL)
+    assert route_key('POST', f'/webhooks/{CHANNEL}/token/messages') == \
+        ('POST /webhooks/{major}/{token}/messages', f'{CHANNEL}/token')
+
+
+def test_learns_limits_from_headers():
+    limit = WindowedLimit(limit=5, per=0.5)
+    reactions = '/channels/{channel}/messages/{message}/reactions/{emoji}/@me'
+
+    async def main():
+        async with MockAPI(('PUT', reactions, limit)) as api:
+            start = asyncio.get_running_loop().time()
+            await asyncio.gather(*(api.rest.create_reaction(CHANNEL, MESSAGE, '👍') for _ in range(15)),
+                                 *(api.rest.create_reaction(OTHER_CHANNEL, MESSAGE, '👍') for _ in range(5)))
+            elapsed = asyncio.get_running_loop().time() - start
+
+            assert limit.rejected == 0
+            assert len(api.hits) == 20
+            # 15 requests at 5 per window need three windows; the other channel has its own bucket
+            assert 0.9 <= elapsed < 2.0
+            assert api.rest.ratelimiter.stats()['known_routes'] == 1
+
+    asyncio.run(main())
+
+
+def test_bucket_429_waits_retry_after():
+    responses = []
+
+    async def channel(request):
+        if not responses:
+            responses.append(429)
+            return web.json_response({'message': 'You are being rate limited.', 'retry_after': 0.3, 'global': False},
+                                     status=429, headers={'X-RateLimit-Limit': '5', 'X-RateLimit-Remaining': '0',
+                                                          'X-RateLimit-Reset-After': '0.3', 'Retry-After': '0.3'})
+        return web.json_response({'id': request.match_info['channel']})
+
+    async def main():
+        async with MockAPI(('GET', '/channels/{channel}', channel)) as api:
+            assert await api.rest.get_channel(CHANNEL) == {'id': CHANNEL}
+            (_, first), (_, second) = api.hits
+            assert second - first >= 0.3
+            assert api.rest.ratelimiter.ratelimited == 1
+            assert api.rest.retries['ratelimited'] == 1
+
+    asyncio.run(main())
+
+
+def test_global_429_pauses_every_route():
+    responses = []
+
+    async def user(request):
+        if not responses:
+            responses.append(429)
+            return web.json_response({'message': 'You are being rate limited.', 'retry_after': 0.3, 'global': True},
+                                     status=429, headers={'X-RateLimit-Global': 'true', 'Retry-After': '0.3'})
+        return web.json_response({'id': request.match_info['user']})
+
+    async def channel(request):
+        return web.json_response({'id': request.match_info['channel']})
+
+    async def main():
+        async with MockAPI(('GET', '/users/{user}', user), ('GET', '/channels/{channel}', channel)) as api:
+            blocked = asyncio.create_task(api.rest.get_user('444444444444444444'))
+            while not api.hits:
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.05)
+
+            start = asyncio.get_running_loop().time()
+            await api.rest.get_channel(CHANNEL)
+            assert asyncio.get_running_loop().time() - start >= 0.2
+            assert await blocked == {'id': '444444444444444444'}
+            assert api.rest.ratelimiter.global_ratelimited == 1
+
+    asyncio.run(main())
+
+
+def test_cancelled_request_gives_back_its_slot():
+    calls = []
+
+    async def create_message(request):
+        calls.append(request)
+        if len(calls) == 1:
+            await asyncio.sleep(1)
+        return web.json_response({'id': MESSAGE}, headers={'X-RateLimit-Limit': '5', 'X-RateLimit-Remaining': '4',
+                                                           'X-RateLimit-Reset-After': '5'})
+
+    async def main():
+        async with MockAPI(('POST', '/channels/{channel}/messages', create_message)) as api:
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(api.rest.create_message(CHANNEL, 'first'), 0.1)
+
+            assert await asyncio.wait_for(api.rest.create_message(CHANNEL, 'second'), 0.5) == {'id': MESSAGE}
+
+    asyncio.run(main())
+
+
+def test_headerless_error_keeps_learned_limit():
+    async def main():
+        limiter = RateLimiter()
+        bucket = limiter.bucket_for('GET', f'/channels/{CHANNEL}')
+        await bucket.acquire()
+        limiter.update(bucket, 'GET', f'/channels/{CHANNEL}',
+                       {'X-RateLimit-Limit': '5', 'X-RateLimit-Remaining': '4', 'X-RateLimit-Reset-After': '5'})
+
+        # A proxy 502 carries no rate limit headers
+        limiter.update(bucket, 'GET', f'/channels/{CHANNEL}', {}, status=502)
+        assert not bucket.unlimited
+
+        acquired = []
+
+        async def acquire():
+            await bucket.acquire()
+            acquired.append(True)
+
+        tasks = [asyncio.create_task(acquire()) for _ in range(20)]
+        await asyncio.sleep(0.05)
+        assert len(acquired) == 4
+        for task in tasks:
+            task.cancel()
+
+    asyncio.run(main())
+
+
+def test_headerless_success_marks_route_unlimited():
+    async def main():
+        limiter = RateLimiter()
+        bucket = limiter.bucket_for('GET', '/gateway/bot')
+        await bucket.acquire()
+        limiter.update(bucket, 'GET', '/gateway/bot', {}, status=200)
+        assert bucket.unlimited
+
+    asyncio.run(main())
@@ -0,0 +1,117 @@
+import asyncio
+import socket
+from types import SimpleNamespace
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from harmony.rest import RESTClient, RetryPolicy, NotFound, ServerError
+
+CHANNEL = '111111111111111111'
+
+
+async def serve(*routes):
+    app = web.Application()
+    for method, path, handler in routes:
+        app.router.add_route(method, path, handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', 0).start()
+
+    rest = RESTClient(SimpleNamespace(token='token'), retry=RetryPolicy(attempts=3, base=0.01, maximum=0.05))
+    rest.base_url = f"http://127.0.0.1:{runner.addresses[0][1]}"
+    return runner, rest
+
+
+def test_dropped_post_is_not_retried():
+    hits = []
+
+    async def hang_up(request):
+        hits.append(request.method)
+        request.transport.close()
+        return web.Response()
+
+    async def main():
+        runner, rest = await serve(('*', '/channels/{channel}/messages', hang_up))
+        try:
+            with pytest.raises(aiohttp.ClientConnectionError):
+                await rest.create_message(CHANNEL, 'hello')
+            assert hits == ['POST']
+
+            # The same failure on a GET is safe to repeat
+            hits.clear()
+            with pytest.raises(aiohttp.ClientConnectionError):
+                await rest._request('GET', f'/channels/{CHANNEL}/messages')
+            assert len(hits) >= 3
+        finally:
+            await rest.close()
+            await runner.cleanup()
+
+    asyncio.run(main())
+
+
+def test_unreachable_host_is_retried_for_any_method():
+    async def main():
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+
+        rest = RESTClient(SimpleNamespace(token='token'), retry=RetryPolicy(attempts=3, base=0.01, maximum=0.05))
+        rest.base_url = f"http://127.0.0.1:{port}"
+        try:
+            with pytest.raises(aiohttp.ClientConnectorError):
+                await rest.create_message(CHANNEL, 'hello')
+            assert rest.retries['connection'] == 2
+        finally:
+            await rest.close()
+
+    asyncio.run(main())
+
+
+def test_server_error_on_post_is_not_retried():
+    hits = []
+
+    async def broken(request):
+        hits.append(request.method)
+        return web.json_response({'message': '500: Internal Server Error', 'code': 0}, status=500)
+
+    async def main():
+        runner, rest = await serve(('*', '/channels/{channel}/messages', broken))
+        try:
+            with pytest.raises(ServerError):
+                await rest.create_message(CHANNEL, 'hello')
+            assert hits == ['POST']
+
+            hits.clear()
+            with pytest.raises(ServerError):
+                await rest._request('GET', f'/channels/{CHANNEL}/messages')
+            assert hits == ['GET'] * 3
+            assert rest.retries['server_error'] == 2
+        finally:
+            await rest.close()
+            await runner.cleanup()
+
+    asyncio.run(main())
+
+
+def test_retry_policy_needs_an_attempt():
+    with pytest.raises(ValueError):
+        RetryPolicy(attempts=0)
+
+
+def test_error_status_raises_typed_exception():
+    async def missing(request):
+        return web.json_response({'message': 'Unknown Channel', 'code': 10003}, status=404)
+
+    async def main():
+        runner, rest = await serve(('GET', '/channels/{channel}', missing))
+        try:
+            with pytest.raises(NotFound) as info:
+                await rest.get_channel(CHANNEL)
+            assert (info.value.status, info.value.code) == (404, 10003)
+        finally:
+            await rest.close()
+            await runner.cleanup()
+
+    asyncio.run(main())
@@ -0,0 +1,41 @@
+import asyncio
+
+from harmony import Client
+from harmony.enums import Intents
+from harmony.snapshot import save_snapshot, load_snapshot
+
+USER = {'id': '80351110224678912', 'username': 'harmony', 'discriminator': '0'}
+KEPT = 290926798626357250
+LEFT = 290926798626357251
+
+
+def test_ready_drops_snapshot_guilds_the_bot_left(tmp_path):
+    path = str(tmp_path / 'cache.snapshot')
+    client = Client(intents=Intents.GUILDS)
+    client.application_id = '80351110224678913'
+    for guild_id in (KEPT, LEFT):
+        client.state.create_guild({'id': str(guild_id), 'name': 'guild'}, 0)
+    save_snapshot(client, path)
+
+    async def main():
+        restarted = Client(intents=Intents.GUILDS)
+        load_snapshot(restarted, path)
+        assert set(restarted.state.guilds) == {KEPT, LEFT}
+        assert restarted.application_id == '80351110224678913'
+
+        removed = []
+
+        async def on_guild_remove(guild):
+            removed.append(guild.id)
+
+        restarted.events.add_listener('guild_remove', on_guild_remove)
+
+        # The RESUME was rejected; a fresh READY lists only the guilds the bot is still in
+        await restarted.parse_ready({'user': USER, 'guilds': [{'id': str(KEPT), 'unavailable': True}]}, 0)
+        await asyncio.sleep(0.01)
+
+        assert set(restarted.state.guilds) == {KEPT}
+        assert not restarted.state.snapshot_guilds
+        assert removed == [LEFT]
+
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+from harmony import Client
+from harmony.enums import Intents
+from harmony.metrics import render_prometheus
+from harmony.models import Message
+from harmony.state import MessageCache
+
+CHANNEL = 111111111111111111
+OTHER_CHANNEL = 222222222222222222
+
+
+def message(client, message_id, channel_id=CHANNEL):
+    return Message(client, {'id': str(message_id), 'channel_id': str(channel_id), 'content': 'hi'})
+
+
+def test_evicts_least_recently_used():
+    client = Client(intents=Intents.GUILD_MESSAGES)
+    cache = MessageCache(max_size=3)
+    for message_id in (1, 2, 3):
+        cache.add(message(client, message_id))
+
+    # Reading 1 makes 2 the oldest
+    assert cache.get(1).id == 1
+    cache.add(message(client, 4))
+
+    assert [m.id for m in cache.values()] == [3, 1, 4]
+    assert 2 not in cache
+    assert cache.evictions == 1
+
+
+def test_per_channel_limit_evicts_from_that_channel_only():
+    client = Client(intents=Intents.GUILD_MESSAGES)
+    cache = MessageCache(max_size=10, max_per_channel=2)
+    cache.add(message(client, 1))
+    cache.add(message(client, 2, OTHER_CHANNEL))
+    cache.add(message(client, 3))
+    cache.add(message(client, 4))
+
+    assert [m.id for m in cache.values()] == [2, 3, 4]
+    assert list(cache._channels[CHANNEL]) == [3, 4]
+
+
+def test_eviction_drops_the_channel_index_entry():
+    client = Client(intents=Intents.GUILD_MESSAGES)
+    cache = MessageCache(max_size=1)
+    cache.add(message(client, 1))
+    cache.add(message(client, 2, OTHER_CHANNEL))
+
+    assert CHANNEL not in cache._channels
+    assert list(cache._channels[OTHER_CHANNEL]) == [2]
+    assert cache.stats()['channels'] == 1
+
+
+def test_counters_are_exported():
+    client = Client(intents=Intents.GUILD_MESSAGES)
+    client.state.messages = cache = MessageCache(max_size=1)
+    cache.add(message(client, 1))
+    cache.add(message(client, 2))
+
+    assert cache.get(2) is not None
+    assert cache.get(1) is None
+    assert cache.remove(3) is None
+    assert cache.stats() == {'size': 1, 'max_size': 1, 'channels': 1, 'hits': 1, 'misses': 2,
+                             'evictions': 1, 'hit_rate': 1 / 3}
+
+    metrics = render_prometheus(client)
+    assert 'harmony_message_cache_lookups_total{result="hit"} 1' in metrics
+    assert 'harmony_message_cache_lookups_total{result="miss"} 2' in metrics
+    assert 'harmony_message_cache_evictions_total 1' in metrics